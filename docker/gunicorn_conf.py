@@ -2,13 +2,40 @@
 import multiprocessing
 import os
 
+# Prometheus multiprocess mode: workers write metric samples to files in this
+# directory and /metrics aggregates them (infikar/metrics.py). It must be set
+# before prometheus_client is first imported.
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/prometheus_multiproc")
+
 # Server socket
 bind = os.getenv("BIND", "0.0.0.0:8000")
 backlog = 2048
 
+# Serving mode: "wsgi" (sync workers) or "asgi" (uvicorn workers; the public
+# card pages, health check and analytics beacon then run as async views)
+SERVER_MODE = os.getenv("SERVER_MODE", "wsgi").lower()
+
+if SERVER_MODE == "asgi":
+    wsgi_app = "infikar.asgi:application"
+    worker_class = "uvicorn_worker.UvicornWorker"
+    # Each event loop serves many concurrent requests; one worker per core is enough
+    default_workers = multiprocessing.cpu_count() + 1
+else:
+    wsgi_app = "infikar.wsgi:application"
+    worker_class = "sync"
+    default_workers = multiprocessing.cpu_count() * 2 + 1
+
+# Server role: "full" (every route) or "public" (infikar.settings_public: no
+# admin, allauth or crispy forms, for workers behind a load balancer that sends
+# /admin/ elsewhere). Only gunicorn uses this; the entrypoint's migrate and
+# collectstatic still run with the full settings.
+SERVER_ROLE = os.getenv("SERVER_ROLE", "full").lower()
+
+if SERVER_ROLE == "public":
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "infikar.settings_public")
+
 # Worker processes
-workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
-worker_class = "sync"
+workers = int(os.getenv("WEB_CONCURRENCY", default_workers))
 worker_connections = 1000
 timeout = 30
 keepalive = 2
@@ -46,4 +73,28 @@ graceful_timeout = 30
 # Max header line size
 limit_request_line = 4094
 limit_request_fields = 100
-limit_request_field_size = 8190
\ No newline at end of file
+limit_request_field_size = 8190
+
+
+def post_worker_init(worker):
+    """Warm per-worker in-process caches before the worker takes traffic"""
+    try:
+        from infikar.subscriptions.catalog import get_catalog
+        get_catalog()
+    except Exception as e:
+        worker.log.warning("Could not warm plan catalog: %s", e)
+
+
+def on_starting(server):
+    """Start each deploy with an empty metrics directory"""
+    import shutil
+    
+    path = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+
+def child_exit(server, worker):
+    """Drop the live gauges of a worker that exited"""
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,495 @@
+"""
+Bulk generator for load-test datasets.
+
+Unlike the row-at-a-time create_dummy_data mode, this builds a chunk of users
+with all their objects in memory and writes each model with bulk_create. Chunks
+are ranges of user indexes, and with `workers` they run in parallel processes.
+Every user draws from its own random stream, seeded from (seed, user index).
+The same seed therefore yields the same data whatever the chunking or the
+number of workers. Dates count back from the hour the run started.
+
+Traffic follows a power law. Each user's popularity is drawn from a Pareto
+distribution, so a few profiles get most of the views, as in production. Every
+published card gets DailyAnalytics rows for `days` days, and totals in
+CardAnalytics and UserAnalytics. Raw AnalyticsEvent rows cover the last
+`event_days` days, capped per card and day. Only the aggregates hold the full
+counts of popular cards.
+
+bulk_create skips save() and signals. Published cards are snapshotted with
+publish_cards, and the username index should be rebuilt afterwards
+(rebuild_username_index).
+"""
+import contextlib
+import functools
+import math
+import random
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.contenttypes.models import ContentType
+from django.db import connections, transaction
+from django.utils import timezone
+
+from infikar.accounts.models import UserProfile
+from infikar.analytics.models import AnalyticsEvent, CardAnalytics, DailyAnalytics, UserAnalytics
+from infikar.cards.models import (
+    AboutContent, Card, CardTemplate, LinkContent, RecommendationContent,
+    RecommendationPick, SplashContent, YouTubeContent, YouTubeVideo,
+)
+from infikar.cards.versions import publish_cards
+
+User = get_user_model()
+
+PASSWORD = 'infikar-load-test'
+
+CARD_TYPES = ['link', 'about', 'recommendation', 'splash', 'youtube']
+CARD_TYPE_WEIGHTS = [5, 2, 2, 1, 2]
+
+FIRST_NAMES = ['Alex', 'Sarah', 'Mike', 'Lisa', 'Tom', 'Emma', 'Jake', 'Anna', 'David', 'Sophie', 'Ryan', 'Zoe']
+LAST_NAMES = ['Johnson', 'Chen', 'Rodriguez', 'Thompson', 'Wilson', 'Davis', 'Brown', 'Garcia', 'Lee', 'Martinez']
+SOCIAL_FIELDS = ['website', 'twitter', 'instagram', 'linkedin', 'youtube', 'tiktok', 'github']
+DEVICES = ['mobile', 'mobile', 'mobile', 'desktop', 'desktop', 'tablet']
+
+COUNTRY_WEIGHTS = {
+    'United States': 30, 'Indonesia': 25, 'India': 15, 'United Kingdom': 10,
+    'Germany': 8, 'Brazil': 7, 'Japan': 5,
+}
+SOURCE_WEIGHTS = {'direct': 50, 'social': 35, 'search': 15}
+SOURCE_REFERERS = {
+    'direct': [''],
+    'social': ['https://www.instagram.com/', 'https://t.co/', 'https://www.tiktok.com/'],
+    'search': ['https://www.google.com/'],
+}
+
+# Pareto shape for user popularity; 1.16 gives the 80/20 split
+POPULARITY_ALPHA = 1.16
+# Expected daily views of a card of the least popular user
+BASE_DAILY_VIEWS = 1.5
+WEEKEND_FACTOR = 1.3
+CLICK_RATE = 0.12
+# Raw events per card, day and event type; the aggregates keep the full counts
+EVENT_CAP = 50
+
+
+def username_for(seed, index):
+    return f'load{seed}_{index}'
+
+
+@contextlib.contextmanager
+def keep_timestamps(*fields):
+    """Let bulk inserts write explicit values into auto_now/auto_now_add fields"""
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field, _, _ in saved:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def _insert(model, objects, field, batch_size):
+    """
+    Bulk insert and map each object's `field` value to its primary key.
+    MySQL does not return keys from bulk inserts, so they are read back.
+    """
+    model.objects.bulk_create(objects, batch_size=batch_size)
+    if objects and objects[0].pk is not None:
+        return {getattr(obj, field): obj.pk for obj in objects}
+    values = [getattr(obj, field) for obj in objects]
+    return dict(model.objects.filter(**{f'{field}__in': values}).values_list(field, 'pk'))
+
+
+def _poisson(rng, mean):
+    if mean <= 0:
+        return 0
+    if mean > 30:
+        # Normal approximation; Knuth's method below is linear in the mean
+        return max(0, round(rng.gauss(mean, math.sqrt(mean))))
+    limit, count, product = math.exp(-mean), 0, rng.random()
+    while product > limit:
+        count += 1
+        product *= rng.random()
+    return count
+
+
+def _split(rng, total, weights):
+    """Share `total` among the keys of `weights`, with some noise"""
+    shares = {key: weight * (0.5 + rng.random()) for key, weight in weights.items()}
+    scale = total / sum(shares.values())
+    counts = {key: int(share * scale) for key, share in shares.items()}
+    counts[max(shares, key=shares.get)] += total - sum(counts.values())
+    return {key: count for key, count in counts.items() if count}
+
+
+@functools.lru_cache(maxsize=None)
+def _password_hash():
+    # Hashing is deliberately slow, so every user of a process shares one
+    return make_password(PASSWORD)
+
+
+class ChunkBuilder:
+    """In-memory objects for a range of users"""
+    
+    def __init__(self, seed, template_ids, now, cards_per_user, days, event_days):
+        self.seed = seed
+        self.template_ids = template_ids
+        self.now = now
+        self.cards_per_user = cards_per_user
+        self.days = days
+        self.event_days = event_days
+    
+    def rng(self, index):
+        return random.Random(f'{self.seed}:{index}')
+    
+    def user(self, index, rng):
+        first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        username = username_for(self.seed, index)
+        return User(
+            username=username,
+            email=f'{username}@example.com',
+            password=_password_hash(),
+            first_name=first_name,
+            last_name=last_name,
+            is_active=True,
+            email_verified=True,
+            subscription_tier=rng.choice(['free', 'free', 'free', 'pro', 'pro_trial']),
+            bio=f"Hi! I'm {first_name}, a passionate creator sharing my journey.",
+            date_joined=self.now - timedelta(days=rng.randint(1, 700)),
+        )
+    
+    def profile(self, user_id, username, rng):
+        links = {
+            field: f'https://{field}.example.com/{username}'
+            for field in SOCIAL_FIELDS if rng.random() < 0.4
+        }
+        return UserProfile(user_id=user_id, **links)
+    
+    def cards(self, user_id, rng):
+        """The user's cards, each with whether it gets published"""
+        cards = []
+        for i in range(rng.randint(1, self.cards_per_user * 2 - 1)):
+            card_type = rng.choices(CARD_TYPES, CARD_TYPE_WEIGHTS)[0]
+            card = Card(
+                user_id=user_id,
+                title=f'{card_type.title()} Card {i + 1}',
+                slug=f'{card_type}-{i + 1}',
+                card_type=card_type,
+                template_id=rng.choice(self.template_ids),
+                is_draft=True,
+                is_hidden=rng.random() < 0.1,
+                sort_order=i * 1024,
+            )
+            # Three of four visible cards are published
+            cards.append((card, not card.is_hidden and rng.random() < 0.75))
+        return cards
+    
+    def content(self, card, user_index, rng):
+        """The card's content objects and, for picks and videos, a factory for their children"""
+        # Not the primary key, which depends on how chunks interleave across workers.
+        # Slugs number a user's cards, so this only depends on the seed and the indexes.
+        path = f'{self.seed}/{user_index}/{card.slug}'
+        if card.card_type == 'link':
+            links = [
+                LinkContent(
+                    card_id=card.pk,
+                    title=f'Link {i + 1}',
+                    description='Check this out',
+                    url=f'https://example.com/{path}/{i}',
+                    link_text='Visit',
+                    sort_order=i * 1024,
+                )
+                for i in range(rng.randint(2, 12))
+            ]
+            return links, None
+        if card.card_type == 'about':
+            return [AboutContent(
+                card_id=card.pk, title='About me', heading='About me', subheading='Creator & Storyteller',
+                short_description='I create content that matters.', link_text='Learn More',
+                link_url='https://example.com/about',
+            )], None
+        if card.card_type == 'splash':
+            return [SplashContent(
+                card_id=card.pk, title='Welcome!', heading='Welcome!', subheading="Let's create something",
+                link_text='Get Started', link_url='https://example.com/start',
+            )], None
+        if card.card_type == 'recommendation':
+            content = RecommendationContent(card_id=card.pk, title='Top Picks', subtitle='My Favorite Things')
+            picks = rng.randint(2, 10)
+            return [content], lambda pk: [
+                RecommendationPick(
+                    recommendation_id=pk, order_number=i + 1, title=f'Pick {i + 1}',
+                    description='This changed my workflow', link_text='Check it out',
+                    link_url=f'https://example.com/pick/{i}',
+                )
+                for i in range(picks)
+            ]
+        content = YouTubeContent(
+            card_id=card.pk, title='My Channel', channel_url='https://youtube.com/@example', button_label='Subscribe',
+        )
+        videos = rng.randint(2, 8)
+        return [content], lambda pk: [
+            YouTubeVideo(
+                youtube_content_id=pk, title=f'Video {i + 1}',
+                video_url=f"https://youtube.com/watch?v={path.replace('/', '-')}-{i}", sort_order=i,
+            )
+            for i in range(videos)
+        ]
+    
+    def history(self, card, popularity, rng, content_type):
+        """(DailyAnalytics rows, raw events, CardAnalytics) for a published card"""
+        mean_views = BASE_DAILY_VIEWS * popularity * rng.uniform(0.3, 1.0)
+        daily, events = [], []
+        totals, countries, referrers = Counter(), Counter(), Counter()
+        
+        for age in range(self.days):
+            day_start = self.now - timedelta(days=age + 1)
+            weekend = day_start.weekday() >= 5
+            views = _poisson(rng, mean_views * (WEEKEND_FACTOR if weekend else 1))
+            if not views:
+                continue
+            clicks = min(views, _poisson(rng, views * CLICK_RATE))
+            unique_views = max(1, round(views * rng.uniform(0.6, 0.9)))
+            unique_clicks = round(clicks * rng.uniform(0.7, 1.0))
+            new_users = round(unique_views * rng.uniform(0.3, 0.7))
+            
+            day_countries = _split(rng, views, COUNTRY_WEIGHTS)
+            sources = _split(rng, views, SOURCE_WEIGHTS)
+            day_referrers = Counter()
+            for source in ('social', 'search'):
+                if sources.get(source):
+                    day_referrers.update(_split(rng, sources[source], dict.fromkeys(SOURCE_REFERERS[source], 1)))
+            
+            daily.append(DailyAnalytics(
+                card_id=card.pk,
+                date=day_start.date(),
+                views=views,
+                unique_views=unique_views,
+                clicks=clicks,
+                unique_clicks=unique_clicks,
+                countries=day_countries,
+                referrers=dict(day_referrers),
+                direct_traffic=sources.get('direct', 0),
+                social_traffic=sources.get('social', 0),
+                search_traffic=sources.get('search', 0),
+                new_users=new_users,
+                returning_users=unique_views - new_users,
+            ))
+            
+            totals.update({
+                'views': views, 'unique_views': unique_views, 'clicks': clicks, 'unique_clicks': unique_clicks,
+                'new': new_users, 'returning': unique_views - new_users, **sources,
+            })
+            if age < 7:
+                totals.update({'views_7': views, 'clicks_7': clicks})
+            if age < 30:
+                totals.update({'views_30': views, 'clicks_30': clicks})
+            countries.update(day_countries)
+            referrers.update(day_referrers)
+            
+            if age < self.event_days:
+                events.extend(self.events(card, day_start, 'view', min(views, EVENT_CAP), rng, content_type))
+                events.extend(self.events(card, day_start, 'click', min(clicks, EVENT_CAP), rng, content_type))
+        
+        analytics = CardAnalytics(
+            card_id=card.pk,
+            total_views=totals['views'],
+            unique_views=totals['unique_views'],
+            total_clicks=totals['clicks'],
+            unique_clicks=totals['unique_clicks'],
+            views_7_days=totals['views_7'],
+            views_30_days=totals['views_30'],
+            clicks_7_days=totals['clicks_7'],
+            clicks_30_days=totals['clicks_30'],
+            top_countries=[{'country': name, 'count': count} for name, count in countries.most_common(5)],
+            top_referrers=[{'referrer': name, 'count': count} for name, count in referrers.most_common(5)],
+            direct_traffic=totals['direct'],
+            social_traffic=totals['social'],
+            search_traffic=totals['search'],
+            new_vs_returning={'new': totals['new'], 'returning': totals['returning']},
+        )
+        return daily, events, analytics
+    
+    def events(self, card, day_start, event_type, count, rng, content_type):
+        countries = list(COUNTRY_WEIGHTS)
+        country_weights = list(COUNTRY_WEIGHTS.values())
+        sources = list(SOURCE_WEIGHTS)
+        source_weights = list(SOURCE_WEIGHTS.values())
+        events = []
+        for _ in range(count):
+            source = rng.choices(sources, source_weights)[0]
+            events.append(AnalyticsEvent(
+                content_type=content_type,
+                object_id=card.pk,
+                event_type=event_type,
+                ip_address=f'10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}',
+                referer=rng.choice(SOURCE_REFERERS[source]),
+                country=rng.choices(countries, country_weights)[0],
+                device_type=rng.choice(DEVICES),
+                created_at=day_start + timedelta(seconds=rng.randrange(86400)),
+            ))
+        return events
+
+
+def _user_analytics(user_id, card_analytics):
+    return UserAnalytics(
+        user_id=user_id,
+        total_views=sum(analytics.total_views for analytics in card_analytics),
+        total_clicks=sum(analytics.total_clicks for analytics in card_analytics),
+        views_7_days=sum(analytics.views_7_days for analytics in card_analytics),
+        views_30_days=sum(analytics.views_30_days for analytics in card_analytics),
+        clicks_7_days=sum(analytics.clicks_7_days for analytics in card_analytics),
+        clicks_30_days=sum(analytics.clicks_30_days for analytics in card_analytics),
+        direct_traffic=sum(analytics.direct_traffic for analytics in card_analytics),
+        social_traffic=sum(analytics.social_traffic for analytics in card_analytics),
+        search_traffic=sum(analytics.search_traffic for analytics in card_analytics),
+    )
+
+
+def generate_chunk(builder, start, stop, batch_size, publish=True):
+    """Create users [start, stop) and everything they own in one transaction"""
+    counts = Counter()
+    card_type = ContentType.objects.get_for_model(Card)
+    # One random stream per user, consumed in the same order whatever the chunking
+    rngs = {index: builder.rng(index) for index in range(start, stop)}
+    
+    with transaction.atomic():
+        users, popularity = [], {}
+        for index in range(start, stop):
+            users.append(builder.user(index, rngs[index]))
+            popularity[index] = rngs[index].paretovariate(POPULARITY_ALPHA)
+        user_ids = _insert(User, users, 'username', batch_size)
+        index_of = {user_ids[user.username]: index for index, user in zip(rngs, users)}
+        counts['user'] = len(users)
+        
+        profiles = [builder.profile(user_id, username_for(builder.seed, index), rngs[index]) for user_id, index in index_of.items()]
+        UserProfile.objects.bulk_create(profiles, batch_size=batch_size)
+        counts['userprofile'] = len(profiles)
+        
+        cards = []
+        for user_id, index in index_of.items():
+            cards.extend(builder.cards(user_id, rngs[index]))
+        Card.objects.bulk_create([card for card, _ in cards], batch_size=batch_size)
+        if cards and cards[0][0].pk is None:
+            card_ids = {
+                (user_id, slug): pk
+                for pk, user_id, slug in Card.objects.filter(user_id__in=index_of).values_list('pk', 'user_id', 'slug')
+            }
+            for card, _ in cards:
+                card.pk = card_ids[(card.user_id, card.slug)]
+        counts['card'] = len(cards)
+        
+        contents, children = {}, []
+        daily, events, card_analytics = [], [], {}
+        for card, published in cards:
+            rng = rngs[index_of[card.user_id]]
+            objects, make_children = builder.content(card, index_of[card.user_id], rng)
+            contents.setdefault(type(objects[0]), []).extend(objects)
+            if make_children is not None:
+                children.append((card.pk, make_children))
+            if published:
+                card_daily, card_events, analytics = builder.history(
+                    card, popularity[index_of[card.user_id]], rng, card_type,
+                )
+                daily.extend(card_daily)
+                events.extend(card_events)
+                card_analytics.setdefault(card.user_id, []).append(analytics)
+        
+        parents = {}
+        for model, objects in contents.items():
+            if model in (RecommendationContent, YouTubeContent):
+                # One per card, and their picks and videos need the keys
+                parents.update(_insert(model, objects, 'card_id', batch_size))
+            else:
+                model.objects.bulk_create(objects, batch_size=batch_size)
+            counts[model._meta.model_name] += len(objects)
+        
+        for card_id, make_children in children:
+            for obj in make_children(parents[card_id]):
+                contents.setdefault(type(obj), []).append(obj)
+        for model in (RecommendationPick, YouTubeVideo):
+            objects = contents.get(model, [])
+            model.objects.bulk_create(objects, batch_size=batch_size)
+            counts[model._meta.model_name] = len(objects)
+        
+        DailyAnalytics.objects.bulk_create(daily, batch_size=batch_size)
+        with keep_timestamps(AnalyticsEvent._meta.get_field('created_at')):
+            AnalyticsEvent.objects.bulk_create(events, batch_size=batch_size)
+        CardAnalytics.objects.bulk_create(
+            [analytics for per_user in card_analytics.values() for analytics in per_user], batch_size=batch_size,
+        )
+        UserAnalytics.objects.bulk_create(
+            [_user_analytics(user_id, per_user) for user_id, per_user in card_analytics.items()], batch_size=batch_size,
+        )
+        counts['dailyanalytics'] = len(daily)
+        counts['analyticsevent'] = len(events)
+        
+        if publish:
+            published = [card.pk for card, is_published in cards if is_published]
+            for i in range(0, len(published), batch_size):
+                publish_cards(published[i:i + batch_size])
+            counts['published'] = len(published)
+    return counts
+
+
+def _generate_range(builder_options, start, stop, batch_size, publish):
+    return generate_chunk(ChunkBuilder(**builder_options), start, stop, batch_size, publish=publish)
+
+
+def _start_worker():
+    import django
+    
+    # Spawned workers (macOS, Windows) start without the app registry
+    django.setup()
+
+
+def _ensure_templates():
+    template_ids = list(CardTemplate.objects.filter(is_active=True).order_by('pk').values_list('pk', flat=True))
+    if not template_ids:
+        template_ids = [CardTemplate.objects.create(name='Minimal', slug='minimal').pk]
+    return template_ids
+
+
+def generate(users, seed=0, start=0, cards_per_user=4, days=30, event_days=3, workers=1,
+             chunk_size=500, batch_size=1000, publish=True, progress=None):
+    """
+    Create users [start, start + users) of the dataset for `seed`, `chunk_size`
+    users per transaction, spread over `workers` processes.
+    Returns row counts per model.
+    """
+    builder_options = {
+        'seed': seed,
+        'template_ids': _ensure_templates(),
+        'now': timezone.now().replace(minute=0, second=0, microsecond=0),
+        'cards_per_user': cards_per_user,
+        'days': days,
+        'event_days': event_days,
+    }
+    stop = start + users
+    ranges = [(first, min(first + chunk_size, stop)) for first in range(start, stop, chunk_size)]
+    totals, done = Counter(), 0
+    
+    if workers <= 1:
+        for first, last in ranges:
+            totals.update(_generate_range(builder_options, first, last, batch_size, publish))
+            done += last - first
+            if progress is not None:
+                progress(done, users)
+        return dict(totals)
+    
+    # Workers open their own connections; an inherited socket must not be shared
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_start_worker) as pool:
+        futures = {
+            pool.submit(_generate_range, builder_options, first, last, batch_size, publish): last - first
+            for first, last in ranges
+        }
+        for future in as_completed(futures):
+            totals.update(future.result())
+            done += futures[future]
+            if progress is not None:
+                progress(done, users)
+    return dict(totals)
@@ -1,12 +1,16 @@
 from django.core.management.base import BaseCommand
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.utils import timezone
+from infikar.accounts.dummy_data import generate
 from infikar.accounts.models import UserProfile
+from infikar.accounts.username_index import rebuild_index
 from infikar.cards.models import (
     CardTemplate, Card, LinkContent, AboutContent, 
     RecommendationContent, RecommendationPick, SplashContent, 
     YouTubeContent, YouTubeVideo
 )
+from infikar.cards.versions import publish_cards
 from infikar.subscriptions.models import SubscriptionPlan
 import random
 from datetime import timedelta
@@ -28,7 +32,48 @@ class Command(BaseCommand):
             '--cards-per-user',
             type=int,
             default=5,
-            help='Number of cards per user (default: 5)'
+            help='Number of cards per user (default: 5; the average with --bulk)'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=None,
+            help='Random seed, for the same data on every run (default: random; 0 with --bulk)'
+        )
+        parser.add_argument(
+            '--bulk',
+            action='store_true',
+            help='Insert in batches, with analytics history, for load-test datasets of any size'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Processes generating user ranges in parallel with --bulk (default: 1)'
+        )
+        parser.add_argument(
+            '--start',
+            type=int,
+            default=0,
+            help='First user index with --bulk, to extend an existing dataset (default: 0)'
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=30,
+            help='Days of daily analytics per published card with --bulk (default: 30)'
+        )
+        parser.add_argument(
+            '--event-days',
+            type=int,
+            default=3,
+            help='Most recent days that also get raw analytics events with --bulk (default: 3)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Users per transaction with --bulk (default: 500)'
         )
 
     def handle(self, *args, **options):
@@ -44,6 +89,13 @@ class Command(BaseCommand):
         num_users = options['users']
         cards_per_user = options['cards_per_user']
         
+        if options['bulk']:
+            self.create_bulk(options)
+            return
+        
+        if options['seed'] is not None:
+            random.seed(options['seed'])
+        
         for i in range(num_users):
             user = self.create_user(i)
             self.create_user_profile(user)
@@ -56,6 +108,35 @@ class Command(BaseCommand):
             self.style.SUCCESS('🌐 Visit http://localhost:8000/admin to see the data')
         )
 
+    def create_bulk(self, options):
+        """Generate a large dataset with bulk inserts (see infikar/accounts/dummy_data.py)"""
+        workers = options['workers']
+        if workers > 1 and connection.vendor == 'sqlite':
+            self.stdout.write(self.style.WARNING('  SQLite allows one writer at a time; using 1 worker'))
+            workers = 1
+        
+        started = timezone.now()
+        counts = generate(
+            options['users'],
+            seed=options['seed'] or 0,
+            start=options['start'],
+            cards_per_user=options['cards_per_user'],
+            days=options['days'],
+            event_days=options['event_days'],
+            workers=workers,
+            chunk_size=options['chunk_size'],
+            progress=lambda done, total: self.stdout.write(f'  👤 {done}/{total} users'),
+        )
+        elapsed = (timezone.now() - started).total_seconds()
+        
+        for name, count in counts.items():
+            self.stdout.write(f'  {name}: {count}')
+        if rebuild_index() is None:
+            self.stdout.write(self.style.WARNING('  Cache is not Redis-backed; username index not rebuilt'))
+        self.stdout.write(
+            self.style.SUCCESS(f'✅ Created {sum(counts.values())} rows for {options["users"]} users in {elapsed:.0f}s')
+        )
+
     def create_subscription_plans(self):
         """Create subscription plans"""
         plans = [
@@ -283,10 +364,12 @@ class Command(BaseCommand):
         """Create cards for a user"""
         card_types = ['link', 'about', 'recommendation', 'splash', 'youtube']
         templates = list(CardTemplate.objects.filter(is_active=True))
+        published_ids = []
         
         for i in range(num_cards):
             card_type = random.choice(card_types)
             template = random.choice(templates)
+            is_published = random.choice([True, True, True, False])  # 75% published
             
             card = Card.objects.create(
                 user=user,
@@ -294,8 +377,7 @@ class Command(BaseCommand):
                 slug=f"{card_type}-{i+1}-{user.username}",
                 card_type=card_type,
                 template=template,
-                is_published=random.choice([True, True, True, False]),  # 75% published
-                is_draft=random.choice([False, False, True]),  # 33% draft
+                is_draft=True,
                 is_hidden=random.choice([False, False, False, True]),  # 25% hidden
                 sort_order=i,
             )
@@ -311,6 +393,12 @@ class Command(BaseCommand):
                 self.create_splash_content(card)
             elif card_type == 'youtube':
                 self.create_youtube_content(card)
+            
+            if is_published:
+                published_ids.append(card.id)
+        
+        # Snapshot the published cards once their content exists
+        publish_cards(published_ids)
 
     def create_link_content(self, card):
         """Create link content for a card"""
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from infikar.accounts.username_index import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the Redis Bloom filter used for username availability checks'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=5000,
+            help='Number of usernames to read per database round trip (default: 5000)'
+        )
+
+    def handle(self, *args, **options):
+        count = rebuild_index(chunk_size=options['chunk_size'])
+        if count is None:
+            self.stdout.write(self.style.WARNING('Cache is not Redis-backed; username index disabled'))
+            return
+        
+        self.stdout.write(self.style.SUCCESS(f'✅ Indexed {count} usernames'))
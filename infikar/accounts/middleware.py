@@ -1,70 +1,102 @@
+import re
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
 from django.shortcuts import redirect
-from django.urls import reverse
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
+# Paths the onboard check never applies to. Prefixes match anything below them;
+# exact paths match only themselves.
+SKIP_PREFIXES = (
+    '/admin/',
+    '/static/',
+    '/media/',
+    '/health/',
+    '/favicon.ico',
+    '/app/check-username/',
+    '/auth/check-username/',
+    '/@',  # Public user profiles and card details
+)
+SKIP_EXACT_PATHS = (
+    '/',
+    '/app/signup/',
+    '/app/login/',
+    '/app/logout/',
+    '/app/onboard/',
+    '/auth/signup/',
+    '/auth/login/',
+    '/auth/logout/',
+    '/auth/onboard/',
+)
+
+# Built once at import so each request is a single anchored regex match
+SKIP_PATH_RE = re.compile('|'.join(
+    [re.escape(prefix) for prefix in SKIP_PREFIXES] +
+    [re.escape(path) + r'\Z' for path in SKIP_EXACT_PATHS]
+))
+
 
 class OnboardMiddleware:
     """
     Middleware to redirect users without usernames to onboard page.
     Users can only access: login, logout, onboard, and public pages.
+    Runs natively under both WSGI and ASGI.
     """
+    sync_capable = True
+    async_capable = True
     
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        
         # Skip middleware for certain paths
         if self._should_skip_middleware(request):
             return self.get_response(request)
         
         # Check if user is authenticated and has no username
-        if (request.user.is_authenticated and 
-            hasattr(request.user, 'username') and 
-            not request.user.username):
-            
-            # Only redirect if not already on onboard page
-            if not request.path.startswith('/app/onboard/'):
-                return redirect('accounts:onboard')
+        if self._needs_onboarding(request, request.user):
+            return redirect('accounts:onboard')
         
         return self.get_response(request)
     
-    def _should_skip_middleware(self, request):
-        """Check if middleware should be skipped for this request"""
-        path = request.path
-        
-        # Skip for static files, admin, and API endpoints
-        skip_paths = [
-            '/admin/',
-            '/static/',
-            '/media/',
-            '/health/',
-            '/favicon.ico',
-        ]
-        
-        for skip_path in skip_paths:
-            if path.startswith(skip_path):
-                return True
+    async def __acall__(self, request):
+        if self._should_skip_middleware(request):
+            return await self.get_response(request)
         
-        # Skip for public pages (home, user profiles, card details)
-        if path in ['/', '/app/signup/', '/app/login/', '/app/logout/', '/app/onboard/']:
-            return True
+        if self._needs_onboarding(request, await request.auser()):
+            return redirect('accounts:onboard')
         
-        # Skip for user profile pages (@username)
-        if path.startswith('/@') and '/' not in path[2:]:
+        return await self.get_response(request)
+    
+    def _needs_onboarding(self, request, user):
+        # Only redirect if not already on onboard page
+        return (
+            user.is_authenticated and
+            hasattr(user, 'username') and
+            not user.username and
+            not request.path.startswith(('/app/onboard/', '/auth/onboard/'))
+        )
+    
+    def _should_skip_middleware(self, request):
+        """Check if middleware should be skipped for this request"""
+        # Static files, admin, public pages and API endpoints
+        if SKIP_PATH_RE.match(request.path):
             return True
         
-        # Skip for card detail pages (@username/card-slug)
-        if path.startswith('/@') and path.count('/') == 2:
+        # Without a session cookie there is no logged-in user, so avoid
+        # touching request.user (and the session/user lookups behind it)
+        if settings.SESSION_COOKIE_NAME not in request.COOKIES:
             return True
         
         # Skip for AJAX requests (including username check)
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
             return True
         
-        # Skip for API endpoints
-        if path.startswith('/app/check-username/'):
-            return True
-        
         return False
@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models import DEFERRED
 from django.core.validators import RegexValidator
 from django.utils import timezone
 from datetime import timedelta
@@ -59,6 +60,13 @@ class User(AbstractUser):
     def __str__(self):
         return f"@{self.username}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Username as loaded, so saves that keep it need no lookup (see cards/signals.py)
+        instance._loaded_username = dict(zip(field_names, values)).get('username', DEFERRED)
+        return instance
+    
     @property
     def is_pro_user(self):
         """Check if user has active pro subscription"""
@@ -85,26 +93,22 @@ class User(AbstractUser):
                 return 'expired'
         return 'free'
     
+    def get_entitlements(self):
+        """Get resolved plan limits and feature flags (cached per request and in Redis)"""
+        from infikar.subscriptions.entitlements import get_entitlements
+        return get_entitlements(self)
+    
     def get_card_limit(self):
         """Get card limit based on subscription"""
-        if self.is_pro_user:
-            from django.conf import settings
-            return settings.PRO_CARD_LIMIT
-        return 10  # Free limit
+        return self.get_entitlements().card_limit
     
     def get_social_links_limit(self):
         """Get social links limit based on subscription"""
-        if self.is_pro_user:
-            from django.conf import settings
-            return settings.PRO_SOCIAL_LINKS
-        return 5  # Free limit
+        return self.get_entitlements().social_links_limit
     
     def get_picks_limit(self):
         """Get picks limit based on subscription"""
-        if self.is_pro_user:
-            from django.conf import settings
-            return settings.PRO_PICKS_LIMIT
-        return 50  # Free limit
+        return self.get_entitlements().picks_limit
 
 
 class UserProfile(models.Model):
@@ -0,0 +1,12 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import User
+from .username_index import add_username
+
+
+@receiver(post_save, sender=User)
+def index_username(sender, instance, **kwargs):
+    """Keep the username availability index in sync with saved users"""
+    if instance.username:
+        add_username(instance.username)
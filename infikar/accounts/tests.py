@@ -1,3 +1,165 @@
-from django.test import TestCase
+from unittest import mock, skipIf
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils.functional import empty
+
+from . import username_index
+from .middleware import SKIP_PATH_RE, OnboardMiddleware
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+User = get_user_model()
+
+
+@skipIf(fakeredis is None, 'fakeredis is not installed')
+@override_settings(USERNAME_BLOOM_CAPACITY=1000, PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class UsernameIndexTests(TestCase):
+    """The Bloom filter index against an in-process Redis with Lua support"""
+    
+    def setUp(self):
+        cache.clear()
+        self.redis = fakeredis.FakeRedis()
+        patcher = mock.patch.object(username_index, 'get_redis', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        username_index.rebuild_index()
+    
+    def create_user(self, username):
+        return User.objects.create_user(email=f'{username}@example.com', password='x', username=username, is_active=True)
+    
+    def bitmap(self):
+        key, _, _ = username_index._bloom_params()
+        return self.redis.get(key)
+    
+    def test_no_false_negatives_after_signup_and_rename(self):
+        names = [f'creator{i}' for i in range(50)]
+        for name in names:
+            self.create_user(name)
+        user = User.objects.get(username='creator0')
+        user.username = 'renamed'
+        user.save()
+        
+        for name in names[1:] + ['renamed']:
+            self.assertTrue(username_index.is_username_taken(name), name)
+        self.assertFalse(username_index.is_username_taken('creator0'))
+    
+    def test_reserved_names_are_taken(self):
+        self.assertTrue(username_index.might_be_taken('admin'))
+    
+    def test_free_name_runs_no_query(self):
+        self.create_user('taken')
+        
+        with self.assertNumQueries(0):
+            self.assertFalse(username_index.is_username_taken('nobody-has-this-name'))
+    
+    def test_free_answer_is_cached(self):
+        with mock.patch.object(username_index, 'might_be_taken', return_value=True):
+            with self.assertNumQueries(1):
+                self.assertFalse(username_index.is_username_taken('maybe'))
+                self.assertFalse(username_index.is_username_taken('maybe'))
+            
+            # Signing up with the name drops the cached answer
+            self.create_user('maybe')
+            self.assertTrue(username_index.is_username_taken('maybe'))
+    
+    def test_database_fallback_without_redis(self):
+        self.create_user('taken')
+        
+        with mock.patch.object(username_index, 'get_redis', return_value=None):
+            self.assertTrue(username_index.might_be_taken('anything'))
+            with self.assertNumQueries(1):
+                self.assertTrue(username_index.is_username_taken('taken'))
+            self.assertFalse(username_index.is_username_taken('free'))
+            self.assertIsNone(username_index.rebuild_index())
+    
+    def test_unbuilt_filter_is_not_trusted(self):
+        self.redis.flushall()
+        self.create_user('taken')
+        
+        # Adding to a missing filter must not create a partial one
+        self.assertIsNone(self.bitmap())
+        self.assertTrue(username_index.might_be_taken('anything'))
+    
+    def test_rebuild_reproduces_index(self):
+        for i in range(20):
+            self.create_user(f'creator{i}')
+        incremental = self.bitmap()
+        
+        self.assertEqual(username_index.rebuild_index(), 20)
+        self.assertEqual(self.bitmap(), incremental)
+
+
+class OnboardMiddlewareTests(TestCase):
+    """Skipped paths and cookieless requests never load the session or the user"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='new@example.com', password='x', username='new', is_active=True)
+        # Signed up, but has not picked a username yet
+        User.objects.filter(pk=cls.user.pk).update(username=None)
+    
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.session_key = self.client.session.session_key
+        self.factory = RequestFactory()
+    
+    def request(self, path, cookie=True):
+        request = self.factory.get(path)
+        if cookie:
+            request.COOKIES[settings.SESSION_COOKIE_NAME] = self.session_key
+        SessionMiddleware(lambda request: None).process_request(request)
+        AuthenticationMiddleware(lambda request: None).process_request(request)
+        return request
+    
+    def sync_middleware(self):
+        return OnboardMiddleware(lambda request: HttpResponse('ok'))
+    
+    def async_middleware(self):
+        async def get_response(request):
+            return HttpResponse('ok')
+        return OnboardMiddleware(get_response)
+    
+    def run_async(self, request):
+        return async_to_sync(self.async_middleware())(request)
+    
+    def assert_untouched(self, request):
+        self.assertFalse(request.session.accessed)
+        self.assertIs(request.user._wrapped, empty)
+    
+    def test_skip_path_re(self):
+        for path in ('/', '/@someone/', '/@someone/card/', '/static/app.css', '/health/ready/', '/auth/login/'):
+            self.assertTrue(SKIP_PATH_RE.match(path), path)
+        # Exact paths do not match what is below them
+        for path in ('/app/dashboard/', '/auth/login/next/', '/subscriptions/'):
+            self.assertFalse(SKIP_PATH_RE.match(path), path)
+    
+    def test_skipped_path_runs_no_query(self):
+        for run in (self.sync_middleware(), self.run_async):
+            request = self.request('/@someone/')
+            with self.assertNumQueries(0):
+                self.assertEqual(run(request).status_code, 200)
+            self.assert_untouched(request)
+    
+    def test_cookieless_request_runs_no_query(self):
+        for run in (self.sync_middleware(), self.run_async):
+            request = self.request('/app/dashboard/', cookie=False)
+            with self.assertNumQueries(0):
+                self.assertEqual(run(request).status_code, 200)
+            self.assert_untouched(request)
+    
+    def test_user_without_username_is_redirected(self):
+        for run in (self.sync_middleware(), self.run_async):
+            response = run(self.request('/app/dashboard/'))
+            self.assertEqual(response.status_code, 302)
+            self.assertEqual(response.url, reverse('accounts:onboard'))
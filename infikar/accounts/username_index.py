@@ -0,0 +1,157 @@
+"""
+Username availability index.
+
+Taken usernames (plus the reserved set) are kept in a Bloom filter stored as a
+Redis bitmap. A miss in the filter means the username is definitely free, so the
+database is only queried for possible collisions. Database answers of "free" are
+cached briefly so repeated keystrokes on a false positive do not hit MySQL again.
+"""
+import hashlib
+import math
+
+import redis
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from infikar.redis_client import get_redis
+from .models import User
+from .username_rules import RESERVED_USERNAMES
+
+BLOOM_KEY_PREFIX = 'username_bloom'
+NEGATIVE_CACHE_PREFIX = 'username_free:'
+
+# Only set bits on a filter that has been fully built; a partial filter would
+# report real usernames as definitely free.
+ADD_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+for i = 1, #ARGV do
+    redis.call('SETBIT', KEYS[1], ARGV[i], 1)
+end
+return 1
+"""
+
+
+def _bloom_params():
+    """Return (key, bit count, hash count) for the configured capacity and error rate"""
+    capacity = settings.USERNAME_BLOOM_CAPACITY
+    error_rate = settings.USERNAME_BLOOM_ERROR_RATE
+    bits = int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+    hashes = max(1, int(round(bits / capacity * math.log(2))))
+    # Sizing is part of the key so a config change never reads a mismatched bitmap
+    return f'{BLOOM_KEY_PREFIX}:{bits}:{hashes}', bits, hashes
+
+
+def _digest(username):
+    return hashlib.blake2b(username.lower().encode('utf-8'), digest_size=16).digest()
+
+
+def _positions(username, bits, hashes):
+    """Bit offsets for a username using double hashing over one digest"""
+    digest = _digest(username)
+    h1 = int.from_bytes(digest[:8], 'big')
+    h2 = int.from_bytes(digest[8:], 'big') | 1
+    return [(h1 + i * h2) % bits for i in range(hashes)]
+
+
+def might_be_taken(username):
+    """
+    Check the Bloom filter for a username.
+    Returns False only when the username is definitely neither taken nor reserved.
+    Returns True when it may be, or when the index is unavailable.
+    """
+    client = get_redis()
+    if client is None:
+        return True
+    
+    key, bits, hashes = _bloom_params()
+    try:
+        pipe = client.pipeline(transaction=False)
+        pipe.exists(key)
+        for position in _positions(username, bits, hashes):
+            pipe.getbit(key, position)
+        exists, *flags = pipe.execute()
+    except redis.RedisError:
+        return True
+    
+    if not exists:
+        return True
+    return all(flags)
+
+
+def add_username(username):
+    """Record a taken username in the filter and drop any cached "free" answer"""
+    if not username:
+        return
+    
+    cache.delete(_negative_cache_key(username))
+    
+    client = get_redis()
+    if client is None:
+        return
+    
+    key, bits, hashes = _bloom_params()
+    try:
+        client.eval(ADD_SCRIPT, 1, key, *_positions(username, bits, hashes))
+    except redis.RedisError:
+        pass
+
+
+def rebuild_index(chunk_size=5000):
+    """
+    Rebuild the filter from the reserved set and every username in the database.
+    The bitmap is built in memory and swapped in with a single RENAME.
+    Returns the number of usernames indexed, or None when Redis is unavailable.
+    """
+    client = get_redis()
+    if client is None:
+        return None
+    
+    key, bits, hashes = _bloom_params()
+    bitmap = bytearray((bits + 7) // 8)
+    started_at = timezone.now()
+    
+    def _set(name):
+        # Redis bitmaps are big-endian within each byte
+        for position in _positions(name, bits, hashes):
+            bitmap[position >> 3] |= 0x80 >> (position & 7)
+    
+    for name in RESERVED_USERNAMES:
+        _set(name)
+    
+    count = 0
+    usernames = User.objects.exclude(username__isnull=True).exclude(username='')
+    for name in usernames.values_list('username', flat=True).iterator(chunk_size=chunk_size):
+        _set(name)
+        count += 1
+    
+    tmp_key = f'{key}:rebuild'
+    client.set(tmp_key, bytes(bitmap))
+    client.rename(tmp_key, key)
+    
+    # Usernames claimed while the snapshot was being read
+    for name in usernames.filter(updated_at__gte=started_at).values_list('username', flat=True):
+        add_username(name)
+    
+    return count
+
+
+def _negative_cache_key(username):
+    return NEGATIVE_CACHE_PREFIX + _digest(username).hex()
+
+
+def is_username_taken(username):
+    """Check whether a username is taken, querying the database only on possible collisions"""
+    if not might_be_taken(username):
+        return False
+    
+    cache_key = _negative_cache_key(username)
+    if cache.get(cache_key):
+        return False
+    
+    taken = User.objects.filter(username=username).exists()
+    if not taken:
+        cache.set(cache_key, True, settings.USERNAME_NEGATIVE_CACHE_TTL)
+    return taken
@@ -0,0 +1,90 @@
+"""
+Username suggestions for taken handles
+"""
+import re
+
+from django.core.exceptions import ValidationError
+
+from .models import User
+from .username_rules import MAX_USERNAME_LENGTH
+from .validators import validate_username
+
+DEFAULT_SUGGESTION_COUNT = 5
+
+# Allowed separators, matching the username character rules
+SEPARATORS = ('.', '_', '-')
+WORD_SUFFIXES = ('official', 'hq', 'studio')
+WORD_PREFIXES = ('its', 'the', 'hey')
+NUMBER_SUFFIXES = ('1', '2', '3', '7', '10', '11', '22', '99', '123')
+
+
+def _clean(value):
+    """Lowercase and strip characters that are not allowed in usernames"""
+    value = re.sub(r'[^a-z0-9._-]', '', (value or '').lower())
+    return value.strip('.-_')
+
+
+def generate_candidates(username, first_name='', last_name=''):
+    """Build an ordered, de-duplicated list of candidate usernames"""
+    base = _clean(username)
+    first = _clean(first_name).replace('.', '').replace('-', '')
+    last = _clean(last_name).replace('.', '').replace('-', '')
+    
+    candidates = []
+    if first and last:
+        candidates.append(f'{first}{last}')
+        candidates.extend(f'{first}{sep}{last}' for sep in SEPARATORS)
+        candidates.append(f'{first[0]}{last}')
+        candidates.append(f'{first}{last[0]}')
+    
+    if base:
+        for name_part in (first, last):
+            if name_part and name_part not in base:
+                candidates.extend(f'{base}{sep}{name_part}' for sep in ('_', '.'))
+        candidates.extend(f'{base}{sep}{word}' for word in WORD_SUFFIXES for sep in ('_', ''))
+        candidates.extend(f'{word}{base}' for word in WORD_PREFIXES)
+        candidates.extend(f'{base}{number}' for number in NUMBER_SUFFIXES)
+        candidates.extend(f'{base}_{number}' for number in NUMBER_SUFFIXES)
+    elif first:
+        candidates.extend(f'{first}{number}' for number in NUMBER_SUFFIXES)
+    
+    seen = set()
+    unique = []
+    for candidate in candidates:
+        candidate = candidate[:MAX_USERNAME_LENGTH].rstrip('.-')
+        if candidate and candidate not in seen:
+            seen.add(candidate)
+            unique.append(candidate)
+    return unique
+
+
+def _is_allowed(candidate):
+    try:
+        validate_username(candidate)
+    except ValidationError:
+        return False
+    return True
+
+
+def suggest_usernames(username, user=None, limit=DEFAULT_SUGGESTION_COUNT):
+    """
+    Suggest free usernames close to a taken one.
+    Candidates are filtered against the validator rules (including reserved names)
+    and checked for availability with a single batched query.
+    """
+    first_name = getattr(user, 'first_name', '') if user else ''
+    last_name = getattr(user, 'last_name', '') if user else ''
+    
+    requested = (username or '').lower()
+    candidates = [
+        candidate for candidate in generate_candidates(username, first_name, last_name)
+        if candidate != requested and _is_allowed(candidate)
+    ]
+    if not candidates:
+        return []
+    
+    taken = {
+        name.lower() for name in
+        User.objects.filter(username__in=candidates).values_list('username', flat=True)
+    }
+    return [candidate for candidate in candidates if candidate not in taken][:limit]
@@ -11,10 +11,13 @@ from django.contrib.auth.views import LoginView, LogoutView
 from django.urls import reverse_lazy
 from django.contrib.auth.forms import UserCreationForm
 from django import forms
+from infikar.ratelimit import ratelimit
 from .models import User, UserProfile
+from .username_suggestions import suggest_usernames
 import json
 
 
+@method_decorator(ratelimit('signup'), name='post')
 class CustomSignupView(TemplateView):
     """Custom signup view with email/password and social login"""
     template_name = 'accounts/signup.html'
@@ -88,7 +91,9 @@ class OnboardView(TemplateView):
         # Check if username is available
         if User.objects.filter(username=username).exists():
             messages.error(request, 'Username is already taken')
-            return self.get(request, *args, **kwargs)
+            context = self.get_context_data(**kwargs)
+            context['suggestions'] = suggest_usernames(username, user)
+            return self.render_to_response(context)
         
         # Update user with username
         user.username = username
@@ -103,6 +108,7 @@ class OnboardView(TemplateView):
         return redirect('accounts:dashboard')
 
 
+@method_decorator(ratelimit('login'), name='post')
 class CustomLoginView(LoginView):
     """Custom login view with email/password and social login"""
     template_name = 'accounts/login.html'
@@ -149,6 +155,7 @@ class DashboardView(TemplateView):
 
 
 @require_http_methods(["POST"])
+@ratelimit('username_check')
 def check_username_availability(request):
     """AJAX endpoint to check username availability with rate limiting"""
     try:
@@ -158,8 +165,6 @@ def check_username_availability(request):
         if not username:
             return JsonResponse({'available': False, 'message': 'Username is required'})
         
-        # Basic rate limiting - check if too many requests in short time
-        # You can enhance this with Redis-based rate limiting later
         from .username_rules import MIN_USERNAME_LENGTH, MAX_USERNAME_LENGTH
         if len(username) < MIN_USERNAME_LENGTH:
             return JsonResponse({'available': False, 'message': f'Username must be at least {MIN_USERNAME_LENGTH} characters'})
@@ -167,9 +172,14 @@ def check_username_availability(request):
         if len(username) > MAX_USERNAME_LENGTH:
             return JsonResponse({'available': False, 'message': f'Username must be {MAX_USERNAME_LENGTH} characters or less'})
         
-        # Check if username is available
-        if User.objects.filter(username=username).exists():
-            return JsonResponse({'available': False, 'message': 'Username is already taken'})
+        # Check if username is available (Bloom filter first, database only on possible collisions)
+        from .username_index import is_username_taken
+        if is_username_taken(username):
+            return JsonResponse({
+                'available': False,
+                'message': 'Username is already taken',
+                'suggestions': suggest_usernames(username, request.user),
+            })
         
         # Check username validation
         from .validators import validate_username
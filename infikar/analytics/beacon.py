@@ -0,0 +1,176 @@
+"""
+Analytics beacon.
+
+Public card pages report views and link clicks with navigator.sendBeacon. The
+beacon view only appends the event to a Redis list, so the request never
+waits on the database; `ingest_analytics` (a long-running process, one per
+deployment) drains the list in batches into AnalyticsEvent rows and
+CardAnalytics counters. Without Redis each event is written to the database
+directly.
+
+Each batch is moved atomically onto a processing list and only dropped from
+there once its rows are committed. A batch left behind by a crash is stored
+again by the next run, so events are stored at least once and never lost.
+"""
+import json
+
+import redis
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import F
+
+from infikar.cards.models import Card
+from infikar.ratelimit import client_ip
+from infikar.redis_client import get_redis, get_script
+from .models import AnalyticsEvent, CardAnalytics
+
+QUEUE_KEY = 'analytics:beacon'
+PROCESSING_KEY = 'analytics:beacon:processing'
+EVENT_TYPES = ('view', 'click')
+
+COUNTERS = {'view': 'total_views', 'click': 'total_clicks'}
+
+# Move up to ARGV[1] events from the head of the queue onto the processing list
+CLAIM_BATCH_SCRIPT = """
+local items = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+if #items > 0 then
+    redis.call('LTRIM', KEYS[1], #items, -1)
+    redis.call('RPUSH', KEYS[2], unpack(items))
+end
+return items
+"""
+
+
+def parse_event(body, request):
+    """
+    Validate a beacon payload and attach the request details.
+    Returns the event dict, or None when the payload is not usable.
+    """
+    try:
+        payload = json.loads(body or b'{}')
+        card_id = int(payload.get('card'))
+    except (ValueError, TypeError, AttributeError):
+        return None
+    
+    event_type = payload.get('event')
+    if event_type not in EVENT_TYPES:
+        return None
+    
+    metadata = {}
+    if event_type == 'click' and payload.get('link') is not None:
+        try:
+            metadata['link'] = int(payload['link'])
+        except (ValueError, TypeError):
+            return None
+    
+    return {
+        'card': card_id,
+        'event': event_type,
+        'ip': client_ip(request),
+        'user_agent': request.headers.get('User-Agent', '')[:500],
+        'referer': request.headers.get('Referer', '')[:200],
+        'metadata': metadata,
+    }
+
+
+def enqueue(event):
+    """
+    Push an event onto the Redis queue.
+    Returns False when Redis is not available and the caller must store it.
+    """
+    client = get_redis()
+    if client is None:
+        return False
+    try:
+        client.rpush(QUEUE_KEY, json.dumps(event))
+    except redis.RedisError:
+        return False
+    return True
+
+
+def queue_depth():
+    """Events waiting in the Redis queue, or None without Redis"""
+    client = get_redis()
+    if client is None:
+        return None
+    try:
+        return client.llen(QUEUE_KEY)
+    except redis.RedisError:
+        return None
+
+
+def _build_events(events, content_type):
+    return [
+        AnalyticsEvent(
+            content_type=content_type,
+            object_id=event['card'],
+            event_type=event['event'],
+            ip_address=event['ip'] or '0.0.0.0',
+            user_agent=event['user_agent'],
+            referer=event['referer'],
+            metadata=event['metadata'],
+        )
+        for event in events
+    ]
+
+
+def store_events(events):
+    """
+    Write events for existing cards with one bulk insert and bump the card
+    counters with one UPDATE per card. Returns the number of events stored.
+    """
+    card_ids = set(Card.objects.filter(pk__in={event['card'] for event in events}).values_list('pk', flat=True))
+    events = [event for event in events if event['card'] in card_ids]
+    if not events:
+        return 0
+    
+    counts = {}
+    for event in events:
+        per_card = counts.setdefault(event['card'], {'total_views': 0, 'total_clicks': 0})
+        per_card[COUNTERS[event['event']]] += 1
+    
+    content_type = ContentType.objects.get_for_model(Card)
+    with transaction.atomic():
+        AnalyticsEvent.objects.bulk_create(_build_events(events, content_type))
+        CardAnalytics.objects.bulk_create([CardAnalytics(card_id=card_id) for card_id in counts], ignore_conflicts=True)
+        for card_id, per_card in counts.items():
+            CardAnalytics.objects.filter(card_id=card_id).update(
+                total_views=F('total_views') + per_card['total_views'],
+                total_clicks=F('total_clicks') + per_card['total_clicks'],
+            )
+    return len(events)
+
+
+def _claim_batch(client, batch_size):
+    """The unfinished batch of a previous run if there is one, else a new batch from the queue"""
+    raw = client.lrange(PROCESSING_KEY, 0, -1)
+    if raw:
+        return raw
+    script = get_script(client, CLAIM_BATCH_SCRIPT)
+    return script(keys=[QUEUE_KEY, PROCESSING_KEY], args=[batch_size])
+
+
+def ingest_events(batch_size=1000):
+    """
+    Drain the beacon queue into the database, one batch at a time.
+    Returns the number of events stored.
+    """
+    client = get_redis()
+    if client is None:
+        return 0
+    
+    stored = 0
+    while True:
+        raw = _claim_batch(client, batch_size)
+        if not raw:
+            return stored
+        
+        events = []
+        for item in raw:
+            try:
+                events.append(json.loads(item))
+            except ValueError:
+                continue
+        stored += store_events(events)
+        # Only now that the rows are committed is the batch done
+        client.delete(PROCESSING_KEY)
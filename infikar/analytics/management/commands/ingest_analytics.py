@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from infikar.analytics.beacon import ingest_events
+
+
+class Command(BaseCommand):
+    help = 'Write queued analytics beacon events from Redis into the database (run one per deployment)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of events to write per batch (default: 1000)'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5.0,
+            help='Seconds to wait between drains of the queue (default: 5)'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Drain the queue once and exit'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            stored = ingest_events(batch_size=options['batch_size'])
+            if options['once']:
+                self.stdout.write(self.style.SUCCESS(f'✅ Stored {stored} analytics events'))
+                break
+            if stored:
+                self.stdout.write(f'  📈 Stored {stored} analytics events')
+            time.sleep(options['interval'])
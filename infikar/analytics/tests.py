@@ -1,3 +1,79 @@
+import json
+from unittest import mock, skipIf
+
+from django.contrib.auth import get_user_model
+from django.db import DatabaseError
 from django.test import TestCase
 
-# Create your tests here.
+from infikar.cards.models import Card, CardTemplate
+from . import beacon
+from .models import AnalyticsEvent, CardAnalytics
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+User = get_user_model()
+
+
+def _event(card_id, event_type='view'):
+    return {
+        'card': card_id, 'event': event_type, 'ip': '127.0.0.1',
+        'user_agent': 'test', 'referer': '', 'metadata': {},
+    }
+
+
+@skipIf(fakeredis is None, 'fakeredis is not installed')
+class BeaconIngestTests(TestCase):
+    """Draining the beacon queue from an in-process Redis with Lua support"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(email='owner@example.com', password='x', username='owner', is_active=True)
+        template = CardTemplate.objects.create(name='Default', slug='default')
+        cls.card = Card.objects.create(user=user, template=template, title='Card', card_type='link')
+    
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        patcher = mock.patch.object(beacon, 'get_redis', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def enqueue(self, count, event_type='view'):
+        for _ in range(count):
+            self.assertTrue(beacon.enqueue(_event(self.card.pk, event_type)))
+    
+    def test_ingest_in_batches(self):
+        self.enqueue(5)
+        self.enqueue(2, 'click')
+        
+        self.assertEqual(beacon.ingest_events(batch_size=3), 7)
+        
+        analytics = CardAnalytics.objects.get(card=self.card)
+        self.assertEqual((analytics.total_views, analytics.total_clicks), (5, 2))
+        self.assertEqual(self.redis.llen(beacon.QUEUE_KEY), 0)
+        self.assertEqual(self.redis.llen(beacon.PROCESSING_KEY), 0)
+    
+    def test_failed_batch_is_kept(self):
+        self.enqueue(5)
+        
+        with mock.patch.object(beacon, 'store_events', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                beacon.ingest_events(batch_size=3)
+        
+        # The failed batch waits on the processing list, the rest in the queue
+        self.assertEqual(self.redis.llen(beacon.PROCESSING_KEY), 3)
+        self.assertEqual(self.redis.llen(beacon.QUEUE_KEY), 2)
+        
+        self.assertEqual(beacon.ingest_events(batch_size=3), 5)
+        self.assertEqual(AnalyticsEvent.objects.count(), 5)
+        self.assertEqual(self.redis.llen(beacon.PROCESSING_KEY), 0)
+    
+    def test_beacon_view_queues_event(self):
+        response = self.client.post(
+            '/analytics/beacon/', json.dumps({'card': self.card.pk, 'event': 'click'}), content_type='text/plain',
+        )
+        
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(json.loads(self.redis.lindex(beacon.QUEUE_KEY, 0))['event'], 'click')
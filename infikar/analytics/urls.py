@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
@@ -6,4 +7,5 @@ app_name = 'analytics'
 urlpatterns = [
     # Analytics dashboard
     path('', views.AnalyticsDashboardView.as_view(), name='dashboard'),
+    path('beacon/', views.abeacon if settings.SERVER_MODE == 'asgi' else views.beacon, name='beacon'),
 ]
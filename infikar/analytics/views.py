@@ -1,5 +1,45 @@
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, HttpResponseBadRequest
 from django.shortcuts import render
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from django.views.generic import TemplateView
 
+from infikar.db.routers import use_replica
+from infikar.ratelimit import ratelimit
+from .beacon import enqueue, parse_event, store_events
+
+
+@method_decorator(use_replica, name='dispatch')
 class AnalyticsDashboardView(TemplateView):
-    template_name = 'analytics/dashboard.html'
\ No newline at end of file
+    template_name = 'analytics/dashboard.html'
+
+
+@csrf_exempt
+@require_POST
+@ratelimit('analytics_beacon')
+def beacon(request):
+    """Record a card view or link click sent with navigator.sendBeacon"""
+    event = parse_event(request.body, request)
+    if event is None:
+        return HttpResponseBadRequest()
+    
+    # Queue the event in Redis; without it, write it straight to the database
+    if not enqueue(event):
+        store_events([event])
+    return HttpResponse(status=204)
+
+
+@csrf_exempt
+@require_POST
+@ratelimit('analytics_beacon')
+async def abeacon(request):
+    """beacon for ASGI workers (SERVER_MODE=asgi)"""
+    event = parse_event(request.body, request)
+    if event is None:
+        return HttpResponseBadRequest()
+    
+    if not await sync_to_async(enqueue, thread_sensitive=False)(event):
+        await sync_to_async(store_events)([event])
+    return HttpResponse(status=204)
@@ -0,0 +1,23 @@
+"""
+Cache access for async views.
+
+Django's cache.aget()/aset() run on the single thread the async ORM also uses,
+so every lookup from every in-flight request queues behind the others and
+behind database queries. Cache backends are thread-safe, so these helpers run
+on the default executor instead.
+"""
+from asgiref.sync import sync_to_async
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+
+
+async def aget(key, default=None, alias='default'):
+    return await sync_to_async(lambda: caches[alias].get(key, default), thread_sensitive=False)()
+
+
+async def aset(key, value, timeout=DEFAULT_TIMEOUT, alias='default'):
+    await sync_to_async(lambda: caches[alias].set(key, value, timeout), thread_sensitive=False)()
+
+
+async def adelete(key, alias='default'):
+    await sync_to_async(lambda: caches[alias].delete(key), thread_sensitive=False)()
@@ -0,0 +1,314 @@
+"""
+Benchmarks for the public pages and the dashboard paths.
+
+Each scenario sends requests through the full Django stack (middleware, views,
+templates, database and cache) with the test client, from one or more threads.
+It reports throughput and p50/p95/p99 latency. Requests target objects sampled
+with a fixed seed from whatever database DATABASE_URL points at: SQLite or a
+local MySQL seeded with infikar.accounts.dummy_data. Results can be saved as a
+baseline in benchmarks/<name>.json and compared with later runs.
+"""
+import json
+import math
+import os
+import platform
+import random
+import threading
+import time
+from dataclasses import asdict, dataclass
+
+import django
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from infikar.cards.models import Card, LinkContent
+
+User = get_user_model()
+
+# Settings for the duration of a run: production-like, minus the per-IP limits
+RUN_SETTINGS = {
+    'DEBUG': False,
+    'RATELIMIT_ENABLE': False,
+    'QUERY_BUDGET_STRICT': False,
+}
+
+
+@dataclass
+class Result:
+    requests: int
+    errors: int
+    seconds: float
+    throughput: float
+    mean_ms: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class Targets:
+    """Objects the scenarios request, sampled deterministically from the database"""
+    
+    def __init__(self, seed=0, size=200):
+        rng = random.Random(seed)
+        
+        published = list(
+            Card.objects.filter(published_version__isnull=False, is_hidden=False, user__is_active=True)
+            .order_by('pk')
+            .values_list('user__username', 'slug')
+        )
+        if not published:
+            raise ValueError('No published cards to benchmark; seed a dataset first')
+        self.cards = rng.sample(published, min(size, len(published)))
+        self.usernames = sorted({username for username, _ in self.cards})
+        
+        link_cards = list(
+            Card.objects.filter(card_type='link', user__is_active=True)
+            .annotate(links=Count('link_contents'))
+            .filter(links__gte=2)
+            .order_by('pk')
+            .values_list('pk', 'user_id')
+        )
+        self.link_cards = rng.sample(link_cards, min(size, len(link_cards)))
+        self.owners = sorted({user_id for _, user_id in self.link_cards})
+
+
+class Scenario:
+    """One kind of request. Subclasses build the request for a target."""
+    name = None
+    login = False
+    writes = False  # changes data in the database it runs against
+    
+    def __init__(self, targets):
+        self.targets = targets
+    
+    def owner(self, rng):
+        """User the client is logged in as, for scenarios that need a login"""
+        return rng.choice(self.targets.owners)
+    
+    def send(self, client, rng, owner_id):
+        raise NotImplementedError
+    
+    def failed(self, response):
+        return response.status_code >= 400
+
+
+class ProfileScenario(Scenario):
+    name = 'profile'
+    
+    def send(self, client, rng, owner_id):
+        return client.get(f'/@{rng.choice(self.targets.usernames)}/')
+
+
+class CardDetailScenario(Scenario):
+    name = 'card_detail'
+    
+    def send(self, client, rng, owner_id):
+        username, slug = rng.choice(self.targets.cards)
+        return client.get(f'/@{username}/{slug}/')
+
+
+class DashboardScenario(Scenario):
+    name = 'dashboard'
+    login = True
+    
+    def send(self, client, rng, owner_id):
+        return client.get('/app/dashboard/')
+
+
+class UsernameCheckScenario(Scenario):
+    name = 'username_check'
+    
+    def send(self, client, rng, owner_id):
+        # Half taken names, half free ones
+        if rng.random() < 0.5:
+            username = rng.choice(self.targets.usernames)
+        else:
+            username = f'free{rng.randrange(10 ** 9)}'
+        return client.post('/auth/check-username/', json.dumps({'username': username}), content_type='application/json')
+
+
+class LinkReorderScenario(Scenario):
+    name = 'link_reorder'
+    login = True
+    writes = True
+    
+    def __init__(self, targets):
+        super().__init__(targets)
+        self.links = {}
+    
+    def send(self, client, rng, owner_id):
+        card_id = rng.choice([card_id for card_id, user_id in self.targets.link_cards if user_id == owner_id])
+        if card_id not in self.links:
+            self.links[card_id] = list(LinkContent.objects.filter(card_id=card_id).values_list('pk', flat=True))
+        moved, after = rng.sample(self.links[card_id], 2)
+        return client.post(
+            f'/app/cards/manage/{card_id}/links/reorder/',
+            json.dumps({'move': {'id': moved, 'after': after}}),
+            content_type='application/json',
+        )
+    
+    def failed(self, response):
+        return response.status_code >= 400 or response.json().get('status') != 'success'
+
+
+SCENARIOS = {
+    scenario.name: scenario
+    for scenario in (ProfileScenario, CardDetailScenario, DashboardScenario, UsernameCheckScenario, LinkReorderScenario)
+}
+
+
+def _worker(scenario, count, seed, latencies, errors, start):
+    rng = random.Random(seed)
+    client = Client()
+    owner_id = None
+    if scenario.login:
+        owner_id = scenario.owner(rng)
+        client.force_login(User.objects.get(pk=owner_id))
+    
+    start.wait()
+    try:
+        for _ in range(count):
+            started = time.perf_counter()
+            try:
+                response = scenario.send(client, rng, owner_id)
+                failed = scenario.failed(response)
+            except Exception:
+                failed = True
+            latencies.append(time.perf_counter() - started)
+            if failed:
+                errors.append(1)
+    finally:
+        connections.close_all()
+
+
+def run_scenario(scenario, requests, concurrency=1, warmup=20, seed=0):
+    """Send `requests` requests from `concurrency` threads after `warmup` untimed ones"""
+    if warmup:
+        _worker(scenario, warmup, seed, [], [], _Ready())
+    
+    latencies, errors = [], []
+    start = threading.Barrier(concurrency + 1)
+    per_thread = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+    threads = [
+        threading.Thread(target=_worker, args=(scenario, count, seed + 1 + i, latencies, errors, start))
+        for i, count in enumerate(per_thread)
+    ]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    began = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - began
+    
+    latencies.sort()
+    return Result(
+        requests=len(latencies),
+        errors=len(errors),
+        seconds=round(seconds, 3),
+        throughput=round(len(latencies) / seconds, 1) if seconds else 0.0,
+        mean_ms=round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+        p50_ms=round(percentile(latencies, 0.50) * 1000, 2),
+        p95_ms=round(percentile(latencies, 0.95) * 1000, 2),
+        p99_ms=round(percentile(latencies, 0.99) * 1000, 2),
+    )
+
+
+class _Ready:
+    """Stand-in for the barrier when warming up on the calling thread"""
+    
+    def wait(self):
+        pass
+
+
+def cpu_model():
+    """CPU model name, from /proc/cpuinfo where there is one"""
+    try:
+        with open('/proc/cpuinfo') as f:
+            for line in f:
+                if line.startswith('model name'):
+                    return line.partition(':')[2].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+def run(names, requests, concurrency=1, warmup=20, seed=0):
+    """Results by scenario name, plus a description of the run"""
+    with override_settings(**RUN_SETTINGS):
+        targets = Targets(seed=seed)
+        results = {}
+        for name in names:
+            scenario = SCENARIOS[name](targets)
+            results[name] = asdict(run_scenario(scenario, requests, concurrency=concurrency, warmup=warmup, seed=seed))
+    
+    meta = {
+        'database': connections[DEFAULT_DB_ALIAS].vendor,
+        'requests': requests,
+        'concurrency': concurrency,
+        'warmup': warmup,
+        'seed': seed,
+        'users': User.objects.count(),
+        'cards': Card.objects.count(),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'host': platform.node(),
+        'cpu': cpu_model(),
+        'cpus': os.cpu_count(),
+        'architecture': platform.machine(),
+        'recorded_at': timezone.now().isoformat(timespec='seconds'),
+    }
+    return {'meta': meta, 'results': results}
+
+
+# Runs that differ in these measure different things. The hardware is matched
+# by CPU model and count rather than hostname, which changes with every container
+COMPARABLE_META = ('database', 'concurrency', 'users', 'seed', 'cpu', 'cpus', 'python')
+
+
+def mismatched_meta(baseline, current):
+    """Run settings that differ between the baseline and this run"""
+    return [
+        key for key in COMPARABLE_META
+        if baseline['meta'].get(key) != current['meta'].get(key)
+    ]
+
+
+def compare(baseline, current, tolerance):
+    """
+    Per scenario changes against a baseline, in percent. A scenario regressed
+    when its p95 latency grew, or its throughput fell, by more than `tolerance`.
+    """
+    rows = []
+    for name, result in current['results'].items():
+        before = baseline['results'].get(name)
+        if before is None:
+            rows.append({'scenario': name, 'regressed': False, 'new': True})
+            continue
+        
+        def change(field):
+            return round((result[field] - before[field]) / before[field] * 100, 1) if before[field] else 0.0
+        
+        row = {
+            'scenario': name,
+            'new': False,
+            'throughput': change('throughput'),
+            'p50_ms': change('p50_ms'),
+            'p95_ms': change('p95_ms'),
+            'p99_ms': change('p99_ms'),
+        }
+        row['regressed'] = row['p95_ms'] > tolerance or row['throughput'] < -tolerance
+        rows.append(row)
+    return rows
@@ -0,0 +1,226 @@
+"""
+Redis cache with a local-memory failover.
+
+The backend does not touch the network when settings are imported. The Redis
+connection opens on first use. If Redis errors, the process switches to an
+in-process LocMemCache and a background thread pings Redis every
+HEALTH_CHECK_INTERVAL seconds. Once a ping succeeds the process switches back
+and drops its local entries, because they may be stale by then.
+
+Writes made while failed over never reach Redis, so its copy of those keys
+(a bumped catalog version, dropped entitlements) is stale too. The keys are
+remembered and deleted from Redis before the process switches back. `mode` and
+`stats()` report which store is serving, for monitoring.
+"""
+import logging
+import os
+import threading
+import time
+
+import redis
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.locmem import LocMemCache
+from django_redis.cache import RedisCache
+from django_redis.exceptions import ConnectionInterrupted
+
+from infikar.metrics import CACHE_LOCAL_MODE, record_cache_lookups
+
+logger = logging.getLogger(__name__)
+
+REDIS = 'redis'
+LOCAL = 'local'
+
+REDIS_ERRORS = (redis.RedisError, ConnectionInterrupted, OSError)
+
+_MISSING = object()
+
+
+class FailoverCache(BaseCache):
+    """
+    Cache backend serving from Redis while it is reachable and from local
+    memory while it is not. LOCATION and OPTIONS are those of django-redis,
+    plus OPTIONS['HEALTH_CHECK_INTERVAL'] (seconds, default 5) and
+    OPTIONS['MAX_REPLAYED_KEYS'] (default 10000): past that many keys written
+    while failed over, every cache entry is deleted on recovery instead.
+    """
+    
+    def __init__(self, server, params):
+        super().__init__(params)
+        options = dict(params.get('OPTIONS', {}))
+        self.health_check_interval = options.pop('HEALTH_CHECK_INTERVAL', 5)
+        self.max_replayed_keys = options.pop('MAX_REPLAYED_KEYS', 10000)
+        
+        # Neither backend connects until it is used
+        self._redis = RedisCache(server, {**params, 'OPTIONS': options})
+        self._local = LocMemCache(f'failover-{id(self)}', {key: value for key, value in params.items() if key != 'OPTIONS'})
+        
+        self.mode = REDIS
+        self.failovers = 0
+        self.recoveries = 0
+        self.last_error = ''
+        self.mode_since = time.time()
+        self._lock = threading.Lock()
+        self._checker_pid = None
+        # (key, version) pairs written while failed over, and the versions whose
+        # entries are all deleted on recovery once there are too many keys
+        self._written = set()
+        self._flush_versions = set()
+    
+    def _fail_over(self, error):
+        with self._lock:
+            self.last_error = f'{type(error).__name__}: {error}'
+            if self.mode == REDIS:
+                self.mode = LOCAL
+                self.mode_since = time.time()
+                self.failovers += 1
+                CACHE_LOCAL_MODE.set(1)
+                logger.warning('Redis cache unavailable (%s); serving from local memory', self.last_error)
+            self._start_checker()
+    
+    def _start_checker(self):
+        # Threads do not survive fork, so a worker that inherited LOCAL mode starts its own
+        if self._checker_pid == os.getpid():
+            return
+        self._checker_pid = os.getpid()
+        threading.Thread(target=self._check_until_recovered, name='cache-health-check', daemon=True).start()
+    
+    def _check_until_recovered(self):
+        while True:
+            time.sleep(self.health_check_interval)
+            try:
+                self._redis.client.get_client(write=True).ping()
+            except REDIS_ERRORS as e:
+                self.last_error = f'{type(e).__name__}: {e}'
+                continue
+            
+            try:
+                self._replay_writes()
+            except REDIS_ERRORS as e:
+                self.last_error = f'{type(e).__name__}: {e}'
+                continue
+            
+            with self._lock:
+                if self._written or self._flush_versions:
+                    # Written to while the last batch was replayed
+                    continue
+                self.mode = REDIS
+                self.mode_since = time.time()
+                self.recoveries += 1
+                CACHE_LOCAL_MODE.set(0)
+                self._checker_pid = None
+                self._local.clear()
+            logger.info('Redis cache reachable again; switched back from local memory')
+            return
+    
+    def _remember_writes(self, keys, version):
+        version = self.version if version is None else version
+        with self._lock:
+            if version in self._flush_versions:
+                return
+            self._written.update((key, version) for key in keys)
+            if len(self._written) > self.max_replayed_keys:
+                self._flush_versions.update(written_version for _, written_version in self._written)
+                self._written.clear()
+    
+    def _replay_writes(self):
+        """Delete the keys written while failed over from Redis, whose copies are stale"""
+        with self._lock:
+            written, self._written = self._written, set()
+            flush_versions, self._flush_versions = self._flush_versions, set()
+        
+        try:
+            by_version = {}
+            for key, version in written:
+                by_version.setdefault(version, []).append(key)
+            for version, keys in by_version.items():
+                self._redis.delete_many(keys, version=version)
+            for version in flush_versions:
+                self._redis.delete_pattern('*', version=version)
+        except REDIS_ERRORS:
+            # Kept for the next attempt
+            with self._lock:
+                self._written |= written
+                self._flush_versions |= flush_versions
+            raise
+    
+    def _call(self, method, *args, writes=(), **kwargs):
+        if self.mode == REDIS:
+            try:
+                return getattr(self._redis, method)(*args, **kwargs)
+            except REDIS_ERRORS as e:
+                self._fail_over(e)
+        elif self._checker_pid != os.getpid():
+            with self._lock:
+                self._start_checker()
+        if writes:
+            self._remember_writes(writes, kwargs.get('version'))
+        return getattr(self._local, method)(*args, **kwargs)
+    
+    def get_redis(self):
+        """Raw Redis client while Redis is serving, otherwise None"""
+        if self.mode != REDIS:
+            return None
+        return self._redis.client.get_client(write=True)
+    
+    def stats(self):
+        return {
+            'mode': self.mode,
+            'mode_since': self.mode_since,
+            'failovers': self.failovers,
+            'recoveries': self.recoveries,
+            'last_error': self.last_error,
+        }
+    
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._call('add', key, value, timeout=timeout, version=version, writes=[key])
+    
+    def get(self, key, default=None, version=None):
+        value = self._call('get', key, default=_MISSING, version=version)
+        if value is _MISSING:
+            record_cache_lookups(0, 1)
+            return default
+        record_cache_lookups(1, 0)
+        return value
+    
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._call('set', key, value, timeout=timeout, version=version, writes=[key])
+    
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._call('touch', key, timeout=timeout, version=version)
+    
+    def delete(self, key, version=None):
+        return self._call('delete', key, version=version, writes=[key])
+    
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        values = self._call('get_many', keys, version=version)
+        record_cache_lookups(len(values), len(keys) - len(values))
+        return values
+    
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._call('set_many', data, timeout=timeout, version=version, writes=list(data))
+    
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        return self._call('delete_many', keys, version=version, writes=keys)
+    
+    def has_key(self, key, version=None):
+        return self._call('has_key', key, version=version)
+    
+    def incr(self, key, delta=1, version=None):
+        return self._call('incr', key, delta=delta, version=version, writes=[key])
+    
+    def decr(self, key, delta=1, version=None):
+        return self._call('decr', key, delta=delta, version=version, writes=[key])
+    
+    def clear(self):
+        self._local.clear()
+        if self.mode == REDIS:
+            self._call('clear')
+    
+    def close(self, **kwargs):
+        self._local.close(**kwargs)
+        try:
+            self._redis.close(**kwargs)
+        except REDIS_ERRORS:
+            pass
@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import CardTemplate, Card, LinkContent, AboutContent, RecommendationContent, RecommendationPick, SplashContent, YouTubeContent, YouTubeVideo
+
+from .models import CardTemplate, Card, CardVersion, LinkContent, AboutContent, RecommendationContent, RecommendationPick, SplashContent, YouTubeContent, YouTubeVideo
+from .versions import publish_cards
 
 
 @admin.register(CardTemplate)
@@ -16,6 +18,20 @@ class CardAdmin(admin.ModelAdmin):
     list_filter = ('card_type', 'is_published', 'is_draft', 'is_hidden', 'created_at')
     search_fields = ('title', 'user__username', 'user__email')
     ordering = ('-created_at',)
+    raw_id_fields = ('published_version',)
+    actions = ('publish_selected',)
+    
+    @admin.action(description='Publish selected cards')
+    def publish_selected(self, request, queryset):
+        versions = publish_cards(list(queryset.values_list('pk', flat=True)))
+        self.message_user(request, f'Published {len(versions)} cards')
+
+
+@admin.register(CardVersion)
+class CardVersionAdmin(admin.ModelAdmin):
+    list_display = ('card', 'number', 'created_at')
+    search_fields = ('card__title', 'card__user__username')
+    raw_id_fields = ('card',)
 
 
 @admin.register(LinkContent)
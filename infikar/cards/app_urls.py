@@ -9,12 +9,19 @@ urlpatterns = [
     
     # Card Management
     path('cards/create/', views.CardCreateView.as_view(), name='create'),
+    path('cards/reorder/', views.CardReorderView.as_view(), name='card_reorder'),
+    path('cards/export/', views.CardExportView.as_view(), name='export'),
+    path('cards/import/', views.CardImportView.as_view(), name='import'),
     path('cards/manage/<int:card_id>/', views.CardManageView.as_view(), name='manage'),
     path('cards/manage/<int:card_id>/publish/', views.CardPublishView.as_view(), name='publish'),
+    path('cards/manage/<int:card_id>/clone/', views.CardCloneView.as_view(), name='clone'),
     
     # Link Management
     path('cards/manage/<int:card_id>/links/add/', views.LinkCreateView.as_view(), name='link_add'),
     path('cards/links/<int:pk>/edit/', views.LinkUpdateView.as_view(), name='link_edit'),
     path('cards/links/<int:pk>/delete/', views.LinkDeleteView.as_view(), name='link_delete'),
     path('cards/manage/<int:card_id>/links/reorder/', views.LinkReorderView.as_view(), name='link_reorder'),
+    
+    # Recommendation picks
+    path('cards/manage/<int:card_id>/picks/<int:recommendation_id>/reorder/', views.PickReorderView.as_view(), name='pick_reorder'),
 ]
@@ -0,0 +1,186 @@
+import json
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from infikar.accounts.dummy_data import generate, username_for
+from infikar.accounts.username_index import rebuild_index
+from infikar.benchmark import SCENARIOS, compare, mismatched_meta, run
+
+User = get_user_model()
+
+BASELINE_DIR = settings.BASE_DIR / 'benchmarks'
+
+
+class Command(BaseCommand):
+    help = 'Measure throughput and p50/p95/p99 latency of the public and dashboard paths'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seed-users',
+            type=int,
+            default=0,
+            help='Seed a dataset with this many users first, unless the seed already exists (default: 0)'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Seed for the dataset and the request mix (default: 0)'
+        )
+        parser.add_argument(
+            '--scenarios',
+            default=','.join(SCENARIOS),
+            help=f'Comma-separated scenarios to run (default: {",".join(SCENARIOS)})'
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=500,
+            help='Timed requests per scenario (default: 500)'
+        )
+        parser.add_argument(
+            '--warmup',
+            type=int,
+            default=50,
+            help='Untimed requests per scenario before measuring (default: 50)'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=1,
+            help='Threads sending requests (default: 1). SQLite allows one writer, so link_reorder errors above 1'
+        )
+        parser.add_argument(
+            '--baseline',
+            help='Baseline name in benchmarks/ (default: the database vendor, e.g. sqlite or mysql)'
+        )
+        parser.add_argument(
+            '--save-baseline',
+            action='store_true',
+            help='Store these results as the baseline instead of comparing with it'
+        )
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=25.0,
+            help='Percent change in p95 latency or throughput counted as a regression (default: 25)'
+        )
+        parser.add_argument(
+            '--fail-on-regression',
+            action='store_true',
+            help='Exit with an error when a scenario regressed'
+        )
+        parser.add_argument(
+            '--allow-writes',
+            action='store_true',
+            help='Allow seeding and writing scenarios (link_reorder) with DEBUG off'
+        )
+        parser.add_argument(
+            '--output',
+            help='Also write the results as JSON to this file'
+        )
+    
+    def handle(self, *args, **options):
+        names = [name.strip() for name in options['scenarios'].split(',') if name.strip()]
+        unknown = set(names) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f'Unknown scenarios: {", ".join(sorted(unknown))}')
+        
+        # Outside development this may be a database people rely on
+        if not settings.DEBUG and not options['allow_writes']:
+            if options['seed_users']:
+                raise CommandError('--seed-users writes to the database; pass --allow-writes to seed with DEBUG off')
+            writing = [name for name in names if SCENARIOS[name].writes]
+            if writing:
+                raise CommandError(
+                    f'{", ".join(writing)} writes to the database; pass --allow-writes, '
+                    f'or leave it out of --scenarios, to run with DEBUG off'
+                )
+        
+        if options['seed_users']:
+            self.seed(options['seed_users'], options['seed'])
+        
+        self.stdout.write(self.style.SUCCESS(f'⏱️  Running {len(names)} scenarios, {options["requests"]} requests each...'))
+        try:
+            report = run(
+                names, options['requests'],
+                concurrency=options['concurrency'], warmup=options['warmup'], seed=options['seed'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        
+        self.write_results(report)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+        
+        baseline_path = BASELINE_DIR / f'{options["baseline"] or connections[DEFAULT_DB_ALIAS].vendor}.json'
+        if options['save_baseline']:
+            BASELINE_DIR.mkdir(exist_ok=True)
+            with open(baseline_path, 'w') as f:
+                json.dump(report, f, indent=2)
+                f.write('\n')
+            self.stdout.write(self.style.SUCCESS(f'✅ Saved baseline {baseline_path.relative_to(settings.BASE_DIR)}'))
+            return
+        
+        if not baseline_path.exists():
+            self.stdout.write(self.style.WARNING(f'No baseline at {baseline_path}; run with --save-baseline to record one'))
+            return
+        
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        mismatched = mismatched_meta(baseline, report)
+        if mismatched:
+            self.stdout.write(self.style.WARNING(
+                f'Not comparable with {baseline_path.name}: different {", ".join(mismatched)}'
+            ))
+            return
+        self.write_comparison(baseline, report, options['tolerance'])
+        
+        regressed = [row['scenario'] for row in compare(baseline, report, options['tolerance']) if row['regressed']]
+        if regressed and options['fail_on_regression']:
+            raise CommandError(f'Regressed against the baseline: {", ".join(regressed)}')
+    
+    def seed(self, users, seed):
+        if User.objects.filter(username=username_for(seed, 0)).exists():
+            self.stdout.write(f'  Dataset for seed {seed} already exists; not seeding')
+            return
+        
+        self.stdout.write(self.style.SUCCESS(f'🌱 Seeding {users} users (seed {seed})...'))
+        counts = generate(
+            users, seed=seed,
+            progress=lambda done, total: self.stdout.write(f'  {done}/{total} users'),
+        )
+        self.stdout.write('  ' + ', '.join(f'{count} {name}' for name, count in counts.items()))
+        if rebuild_index() is None:
+            self.stdout.write(self.style.WARNING('  Cache is not Redis-backed; username index not rebuilt'))
+    
+    def write_results(self, report):
+        meta = report['meta']
+        self.stdout.write(
+            f'\n{meta["database"]}, {meta["users"]} users, {meta["cards"]} cards, '
+            f'concurrency {meta["concurrency"]}'
+        )
+        self.stdout.write(f'{"scenario":<16}{"req/s":>9}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"errors":>8}')
+        for name, result in report['results'].items():
+            self.stdout.write(
+                f'{name:<16}{result["throughput"]:>9}{result["p50_ms"]:>9}{result["p95_ms"]:>9}'
+                f'{result["p99_ms"]:>9}{result["errors"]:>8}'
+            )
+    
+    def write_comparison(self, baseline, report, tolerance):
+        recorded = baseline['meta'].get('recorded_at', 'unknown')
+        self.stdout.write(f'\nChange against the baseline recorded {recorded} (%):')
+        self.stdout.write(f'{"scenario":<16}{"req/s":>9}{"p50":>9}{"p95":>9}{"p99":>9}')
+        for row in compare(baseline, report, tolerance):
+            if row['new']:
+                self.stdout.write(f'{row["scenario"]:<16}   not in the baseline')
+                continue
+            line = (
+                f'{row["scenario"]:<16}{row["throughput"]:>+9}{row["p50_ms"]:>+9}'
+                f'{row["p95_ms"]:>+9}{row["p99_ms"]:>+9}'
+            )
+            self.stdout.write(self.style.ERROR(line + '  regressed') if row['regressed'] else line)
@@ -0,0 +1,40 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from infikar.cards.models import Card
+from infikar.cards.portability import export_lines
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Export a user\'s cards, contents, picks and videos as JSON Lines'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='Owner of the cards to export')
+        parser.add_argument(
+            '--output',
+            help='File to write to (default: stdout)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Rows to fetch per database round trip (default: 500)'
+        )
+    
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['username']!r} does not exist")
+        
+        lines = export_lines(Card.objects.filter(user=user), chunk_size=options['chunk_size'])
+        if not options['output']:
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+        
+        with open(options['output'], 'w', encoding='utf-8') as output:
+            output.writelines(lines)
+        self.stdout.write(self.style.SUCCESS(f"✅ Exported cards for {user.username} to {options['output']}"))
@@ -0,0 +1,35 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from infikar.cards.portability import PortabilityError, import_records, parse_lines
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Import cards from a JSON Lines export into a user\'s account'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='Account to import the cards into')
+        parser.add_argument('path', help='Export file to read')
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Rows to insert per bulk statement (default: 500)'
+        )
+    
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['username']!r} does not exist")
+        
+        try:
+            with open(options['path'], encoding='utf-8') as source:
+                counts = import_records(user, parse_lines(source), chunk_size=options['chunk_size'])
+        except (OSError, PortabilityError) as e:
+            raise CommandError(str(e))
+        
+        summary = ', '.join(f'{count} {name}' for name, count in counts.items() if count)
+        self.stdout.write(self.style.SUCCESS(f'✅ Imported {summary or "nothing"} for {user.username}'))
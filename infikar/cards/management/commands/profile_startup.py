@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from infikar.startup import by_package, profile_startup
+
+
+class Command(BaseCommand):
+    help = 'Report the import time and memory of booting a web worker'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=15,
+            help='Rows to show per table (default: 15)'
+        )
+        parser.add_argument(
+            '--compare',
+            nargs='+',
+            default=[],
+            metavar='SETTINGS_MODULE',
+            help='Also boot with these settings modules and compare, e.g. infikar.settings_public'
+        )
+    
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('⏱️  Booting a worker under -X importtime...'))
+        try:
+            report = profile_startup()
+            others = [profile_startup(module) for module in options['compare']]
+        except RuntimeError as e:
+            raise CommandError(f'Worker failed to boot: {e}')
+        
+        self.write_summary(report)
+        limit = options['limit']
+        
+        self.stdout.write(f'\n{"package":<32}{"self ms":>10}{"modules":>9}')
+        for package, us, count in by_package(report['imports'])[:limit]:
+            self.stdout.write(f'{package:<32}{us / 1000:>10.1f}{count:>9}')
+        
+        self.stdout.write(f'\n{"first imported by project code":<48}{"cumulative ms":>14}')
+        for imported in self.project_imports(report['imports'])[:limit]:
+            self.stdout.write(f'{imported.name:<48}{imported.cumulative_us / 1000:>14.1f}')
+        
+        for other in others:
+            self.write_summary(other)
+            packages = {package for package, _, _ in by_package(report['imports'])}
+            dropped = packages - {package for package, _, _ in by_package(other['imports'])}
+            if dropped:
+                self.stdout.write(f'  Not loaded: {", ".join(sorted(dropped))}')
+    
+    def write_summary(self, report):
+        self.stdout.write(
+            f'\n{report["settings"]}: {report["seconds"] * 1000:.0f} ms, '
+            f'{report["modules"]} modules, {report["max_rss_kb"] / 1024:.1f} MB peak RSS'
+        )
+    
+    def project_imports(self, imports):
+        """Other packages' modules first imported by project code, by what a lazy import there would save"""
+        rows = []
+        parents = []
+        for imported in reversed(imports):
+            # importtime lists children before their parent, so walk backwards keeping the chain of parents
+            del parents[imported.depth:]
+            if parents and parents[-1].package == 'infikar' and imported.package != 'infikar':
+                rows.append(imported)
+            parents.append(imported)
+        return sorted(rows, key=lambda imported: -imported.cumulative_us)
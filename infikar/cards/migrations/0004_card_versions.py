@@ -0,0 +1,134 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:56
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Snapshot layout as of this migration, frozen here so later changes to
+# infikar.cards.versions do not change what it writes
+CONTENT_SECTIONS = (
+    ("links", "link_contents", None),
+    ("about", "about_contents", None),
+    ("recommendations", "recommendation_contents", ("picks", "picks")),
+    ("splash", "splash_contents", None),
+    ("youtube", "youtube_contents", ("videos", "videos")),
+)
+
+CARD_FIELDS = (
+    "title", "slug", "card_type", "social_links", "card_image",
+    "custom_font_family", "custom_font_weight", "custom_font_size",
+    "custom_text_transform", "custom_background_color",
+    "created_at", "updated_at", "published_at",
+)
+
+PREFETCH = tuple(
+    f"{related}__{nested[1]}" if nested else related
+    for _, related, nested in CONTENT_SECTIONS
+)
+
+
+def serialize(obj, field_names=None):
+    data = {"id": obj.pk}
+    for field in obj._meta.concrete_fields:
+        if field.is_relation or field.primary_key:
+            continue
+        if field_names is not None and field.name not in field_names:
+            continue
+        value = field.value_from_object(obj)
+        if isinstance(field, models.FileField):
+            value = value.url if value else ""
+        data[field.name] = value
+    return data
+
+
+def build_snapshot(card):
+    data = serialize(card, CARD_FIELDS)
+    data["card_type_display"] = card.get_card_type_display()
+    data["template"] = {"name": card.template.name, "slug": card.template.slug}
+
+    for key, related, nested in CONTENT_SECTIONS:
+        items = []
+        for obj in getattr(card, related).all():
+            item = serialize(obj)
+            if nested:
+                nested_key, nested_related = nested
+                item[nested_key] = [
+                    serialize(child) for child in getattr(obj, nested_related).all()
+                ]
+            items.append(item)
+        data[key] = items
+    return data
+
+
+def publish_existing_cards(apps, schema_editor):
+    """Snapshot every card that is already live so public pages keep showing it"""
+    Card = apps.get_model("cards", "Card")
+    CardVersion = apps.get_model("cards", "CardVersion")
+
+    cards = (
+        Card.objects.filter(is_published=True)
+        .select_related("template")
+        .prefetch_related(*PREFETCH)
+    )
+    for card in cards.iterator(chunk_size=500):
+        version = CardVersion.objects.create(
+            card=card, number=1, snapshot=build_snapshot(card)
+        )
+        Card.objects.filter(pk=card.pk).update(published_version=version)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("cards", "0003_card_card_image"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CardVersion",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("number", models.PositiveIntegerField()),
+                (
+                    "snapshot",
+                    models.JSONField(
+                        encoder=django.core.serializers.json.DjangoJSONEncoder
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "card",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="versions",
+                        to="cards.card",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["-number"],
+                "unique_together": {("card", "number")},
+            },
+        ),
+        migrations.AddField(
+            model_name="card",
+            name="published_version",
+            field=models.OneToOneField(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="cards.cardversion",
+            ),
+        ),
+        migrations.RunPython(publish_existing_cards, migrations.RunPython.noop),
+    ]
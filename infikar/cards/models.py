@@ -1,9 +1,12 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.db.models import DEFERRED
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.utils.text import slugify
 from django.urls import reverse
 
+from .slugs import save_with_unique_slug, slug_base
+
 User = get_user_model()
 
 
@@ -83,6 +86,11 @@ class Card(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     published_at = models.DateTimeField(null=True, blank=True)
     
+    # Snapshot served on public pages (see cards.versions)
+    published_version = models.OneToOneField(
+        'CardVersion', on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    
     class Meta:
         unique_together = ['user', 'slug']
         ordering = ['sort_order', 'created_at']
@@ -90,10 +98,26 @@ class Card(models.Model):
     def __str__(self):
         return f"{self.user.username}/{self.slug}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The public URL as loaded, so saves that keep it need no lookup (see signals.py)
+        loaded = dict(zip(field_names, values))
+        instance._loaded_url = tuple(loaded.get(name, DEFERRED) for name in ('user_id', 'slug', 'is_hidden'))
+        return instance
+    
     def save(self, *args, **kwargs):
-        if not self.slug:
-            self.slug = slugify(self.title)
-        super().save(*args, **kwargs)
+        if self.slug:
+            super().save(*args, **kwargs)
+            return
+        
+        # Allocate a free slug per user instead of failing on unique_together
+        save_with_unique_slug(
+            self,
+            Card.objects.filter(user_id=self.user_id).exclude(pk=self.pk),
+            slug_base(self.title, self._meta.get_field('slug').max_length),
+            lambda: super(Card, self).save(*args, **kwargs),
+        )
     
     def get_absolute_url(self):
         return reverse('card_detail', kwargs={'username': self.user.username, 'card_slug': self.slug})
@@ -102,6 +126,21 @@ class Card(models.Model):
         return reverse('card_preview', kwargs={'username': self.user.username, 'card_slug': self.slug})
 
 
+class CardVersion(models.Model):
+    """Render-ready snapshot of a card, its content and picks as it was published"""
+    card = models.ForeignKey(Card, on_delete=models.CASCADE, related_name='versions')
+    number = models.PositiveIntegerField()
+    snapshot = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        unique_together = ['card', 'number']
+        ordering = ['-number']
+    
+    def __str__(self):
+        return f"{self.snapshot.get('title', self.card_id)} v{self.number}"
+
+
 class CardContent(models.Model):
     """Base content model for different card types"""
     card = models.ForeignKey(Card, on_delete=models.CASCADE, related_name='contents')
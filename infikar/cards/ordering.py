@@ -0,0 +1,88 @@
+"""
+Ordering helpers shared by links, cards and recommendation picks.
+
+Positions are spaced ORDER_STEP apart, so moving one item normally just takes a
+key between its new neighbours and updates a single row. Full reorders, and
+renumbering when a gap runs out, are one transactional bulk_update (a single
+UPDATE ... CASE WHEN statement).
+"""
+from django.db import transaction
+from django.db.models import Max
+
+ORDER_STEP = 1024
+
+
+class ReorderError(Exception):
+    """Raised when a reorder references items outside the queryset or leaves some out"""
+
+
+def next_position(queryset, field, step=ORDER_STEP):
+    """Position for an item appended after every existing one"""
+    current = queryset.aggregate(last=Max(field))['last']
+    return step if current is None else current + step
+
+
+def _renumber(objs, field, step):
+    for index, obj in enumerate(objs, start=1):
+        setattr(obj, field, index * step)
+
+
+def apply_order(queryset, field, ordered_ids, step=ORDER_STEP):
+    """
+    Reorder items to match `ordered_ids`, which must list every item in the
+    queryset exactly once: renumbering only some of them would collide with
+    the positions of the rest.
+    All positions are written in one statement.
+    """
+    ids = [int(pk) for pk in ordered_ids]
+    if len(set(ids)) != len(ids):
+        raise ReorderError('Duplicate ids in reorder request')
+    
+    with transaction.atomic():
+        objs = {obj.pk: obj for obj in queryset.select_for_update().only('pk', field)}
+        if objs.keys() != set(ids):
+            raise ReorderError('Reorder request must list every item exactly once')
+        
+        ordered = [objs[pk] for pk in ids]
+        _renumber(ordered, field, step)
+        queryset.model.objects.bulk_update(ordered, [field])
+    return len(ordered)
+
+
+def move_item(queryset, field, item_id, after_id=None, before_id=None, step=ORDER_STEP):
+    """
+    Move one item directly after `after_id` (or before `before_id`; to the
+    front when neither is given).
+    Returns the number of rows written: 1 normally, all siblings when the
+    neighbouring keys leave no gap and the list is renumbered.
+    """
+    with transaction.atomic():
+        siblings = list(queryset.select_for_update().order_by(field, 'pk').only('pk', field))
+        by_id = {obj.pk: obj for obj in siblings}
+        
+        item = by_id.get(int(item_id))
+        anchor_id = after_id if after_id is not None else before_id
+        if item is None or (anchor_id is not None and int(anchor_id) not in by_id):
+            raise ReorderError('Move references an unknown id')
+        
+        remaining = [obj for obj in siblings if obj.pk != item.pk]
+        if after_id is not None:
+            index = next(i for i, obj in enumerate(remaining) if obj.pk == int(after_id)) + 1
+        elif before_id is not None:
+            index = next(i for i, obj in enumerate(remaining) if obj.pk == int(before_id))
+        else:
+            index = 0
+        
+        low = getattr(remaining[index - 1], field) if index > 0 else 0
+        high = getattr(remaining[index], field) if index < len(remaining) else low + 2 * step
+        
+        if high - low > 1:
+            setattr(item, field, (low + high) // 2)
+            item.save(update_fields=[field])
+            return 1
+        
+        # No room between the neighbours: space everything out again
+        remaining.insert(index, item)
+        _renumber(remaining, field, step)
+        queryset.model.objects.bulk_update(remaining, [field])
+        return len(remaining)
@@ -0,0 +1,331 @@
+"""
+Card import/export.
+
+Cards travel as JSON Lines: a header line followed by one record per row, with
+every parent written before its children (cards, then each content type, then
+picks and videos). Exports stream straight from database iterators, and imports
+parse line by line and write each record type with chunked bulk_create calls,
+so memory stays bounded by the chunk size rather than the size of the account.
+
+Images are exported as storage names. Imports from a file leave them blank,
+as a name could point at any object in media storage; only clone_card keeps
+them, sharing the files of the original.
+"""
+import json
+from collections import namedtuple
+from functools import lru_cache
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+
+from .models import (
+    AboutContent, Card, CardTemplate, LinkContent, RecommendationContent,
+    RecommendationPick, SplashContent, YouTubeContent, YouTubeVideo,
+)
+from .slugs import SlugAllocator
+from .versions import publish_cards
+
+FORMAT = 'infikar-cards'
+VERSION = 1
+CHUNK_SIZE = 500
+
+# name: record type in the file
+# parent: record type this one hangs off; parent_field: its foreign key
+# card_path: lookup from the model to its Card, used to scope exports
+RecordType = namedtuple('RecordType', 'name model parent parent_field card_path')
+
+RECORD_TYPES = (
+    RecordType('card', Card, None, None, 'pk'),
+    RecordType('link', LinkContent, 'card', 'card', 'card'),
+    RecordType('about', AboutContent, 'card', 'card', 'card'),
+    RecordType('recommendation', RecommendationContent, 'card', 'card', 'card'),
+    RecordType('pick', RecommendationPick, 'recommendation', 'recommendation', 'recommendation__card'),
+    RecordType('splash', SplashContent, 'card', 'card', 'card'),
+    RecordType('youtube', YouTubeContent, 'card', 'card', 'card'),
+    RecordType('video', YouTubeVideo, 'youtube', 'youtube_content', 'youtube_content__card'),
+)
+RECORD_TYPES_BY_NAME = {record_type.name: record_type for record_type in RECORD_TYPES}
+
+# Record types other records point at, so their new primary keys must be known
+PARENT_TYPES = frozenset(record_type.parent for record_type in RECORD_TYPES if record_type.parent)
+
+
+class PortabilityError(Exception):
+    """Raised when an import file is malformed or cannot be applied"""
+
+
+@lru_cache(maxsize=None)
+def _data_fields(model):
+    """Concrete, non-relational fields that carry user data"""
+    return tuple(
+        field for field in model._meta.concrete_fields
+        if not field.primary_key
+        and not field.is_relation
+        and not getattr(field, 'auto_now', False)
+        and not getattr(field, 'auto_now_add', False)
+    )
+
+
+def _dump(obj):
+    data = {}
+    for field in _data_fields(type(obj)):
+        value = field.value_from_object(obj)
+        if isinstance(field, models.FileField):
+            value = value.name if value else ''
+        data[field.name] = value
+    return data
+
+
+def _load(model, data, keep_files=False):
+    fields = {}
+    for field in _data_fields(model):
+        if isinstance(field, models.FileField) and not keep_files:
+            continue
+        if field.name in data:
+            try:
+                fields[field.name] = field.to_python(data[field.name])
+            except ValidationError as e:
+                raise PortabilityError(f'{model.__name__}.{field.name}: {e.messages[0]}')
+    return fields
+
+
+# Export
+
+
+def export_records(cards, chunk_size=CHUNK_SIZE):
+    """
+    Yield records for a queryset of cards and everything below them.
+    Each record type is read with one server-side iterator.
+    """
+    yield {'type': 'header', 'format': FORMAT, 'version': VERSION}
+    
+    for card in cards.select_related('template').order_by('pk').iterator(chunk_size=chunk_size):
+        yield {'type': 'card', 'ref': card.pk, 'template': card.template.slug, 'fields': _dump(card)}
+    
+    for record_type in RECORD_TYPES[1:]:
+        queryset = record_type.model.objects.filter(**{f'{record_type.card_path}__in': cards.values('pk')})
+        parent_attname = f'{record_type.parent_field}_id'
+        for obj in queryset.order_by(parent_attname, 'pk').iterator(chunk_size=chunk_size):
+            record = {'type': record_type.name, 'parent': getattr(obj, parent_attname), 'fields': _dump(obj)}
+            if record_type.name in PARENT_TYPES:
+                record['ref'] = obj.pk
+            yield record
+
+
+def export_lines(cards, chunk_size=CHUNK_SIZE):
+    """Export records encoded as JSON Lines"""
+    for record in export_records(cards, chunk_size=chunk_size):
+        yield json.dumps(record, cls=DjangoJSONEncoder) + '\n'
+
+
+# Import
+
+
+def parse_lines(lines):
+    """Decode JSON Lines one line at a time, checking the header first"""
+    header_seen = False
+    for line_number, line in enumerate(lines, start=1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.strip()
+        if not line:
+            continue
+        
+        try:
+            record = json.loads(line)
+        except ValueError:
+            raise PortabilityError(f'Line {line_number}: invalid JSON')
+        if not isinstance(record, dict):
+            raise PortabilityError(f'Line {line_number}: expected an object')
+        
+        if not header_seen:
+            if record.get('type') != 'header' or record.get('format') != FORMAT:
+                raise PortabilityError('Not an Infikar card export')
+            if record.get('version', 0) > VERSION:
+                raise PortabilityError(f"Unsupported export version {record.get('version')}")
+            header_seen = True
+            continue
+        
+        yield record
+    
+    if not header_seen:
+        raise PortabilityError('Import file is empty')
+
+
+class CardImporter:
+    """
+    Buffers records of one type and writes them with bulk_create.
+    Only the old -> new primary key maps of parent records are kept for the
+    whole import.
+    With `entitlements`, records that would take the user past their card or
+    per-card link limit are rejected as they are added.
+    """
+    
+    def __init__(self, user, chunk_size=CHUNK_SIZE, entitlements=None, keep_files=False):
+        self.user = user
+        self.chunk_size = chunk_size
+        self.entitlements = entitlements
+        self.keep_files = keep_files
+        self.card_count = Card.objects.filter(user=user).count() if entitlements else 0
+        self.link_counts = {}
+        self.counts = {record_type.name: 0 for record_type in RECORD_TYPES}
+        self.refs = {name: {} for name in PARENT_TYPES}
+        self.last_pks = {name: 0 for name in PARENT_TYPES}
+        self.buffer = []
+        self.buffer_type = None
+        self._templates = None
+        self.slugs = SlugAllocator(Card.objects.filter(user=user))
+        self.published_refs = []
+    
+    def add(self, record):
+        record_type = RECORD_TYPES_BY_NAME.get(record.get('type'))
+        if record_type is None:
+            raise PortabilityError(f"Unknown record type {record.get('type')!r}")
+        
+        if record_type is not self.buffer_type:
+            self.flush()
+            self.buffer_type = record_type
+        
+        fields = record.get('fields', {})
+        if not isinstance(fields, dict):
+            raise PortabilityError(f'{record_type.name} record fields must be an object')
+        
+        obj = record_type.model(**_load(record_type.model, fields, keep_files=self.keep_files))
+        if record_type.parent:
+            parent_pk = self.refs[record_type.parent].get(record.get('parent'))
+            if parent_pk is None:
+                raise PortabilityError(f'{record_type.name} record references an unknown {record_type.parent}')
+            setattr(obj, f'{record_type.parent_field}_id', parent_pk)
+            if record_type.name == 'link':
+                self._count_link(parent_pk)
+        else:
+            self._count_card()
+            self._prepare_card(obj, record)
+        
+        self.buffer.append((record.get('ref'), obj))
+        if self.chunk_size and len(self.buffer) >= self.chunk_size:
+            self.flush()
+    
+    def flush(self):
+        if not self.buffer:
+            return
+        
+        record_type = self.buffer_type
+        objs = [obj for _, obj in self.buffer]
+        record_type.model.objects.bulk_create(objs)
+        
+        if record_type.name in PARENT_TYPES:
+            if objs[0].pk is None:
+                self._fetch_pks(record_type, objs)
+            refs = self.refs[record_type.name]
+            for ref, obj in self.buffer:
+                refs[ref] = obj.pk
+            self.last_pks[record_type.name] = max(obj.pk for obj in objs)
+        
+        self.counts[record_type.name] += len(objs)
+        self.buffer = []
+    
+    def publish(self):
+        """Publish the imported cards that were live in the export"""
+        publish_cards([self.refs['card'][ref] for ref in self.published_refs])
+    
+    def _fetch_pks(self, record_type, objs):
+        """
+        Fill in primary keys on backends that do not return them from bulk
+        inserts (MySQL). Cards are found by their unique slug; other parents
+        only exist under cards created by this import, so the new rows are
+        the ones above the last key seen, in insertion order.
+        """
+        if record_type.model is Card:
+            pks = dict(Card.objects.filter(user=self.user, slug__in=[obj.slug for obj in objs]).values_list('slug', 'pk'))
+            for obj in objs:
+                obj.pk = pks[obj.slug]
+            return
+        
+        parent_attname = f'{record_type.parent_field}_id'
+        pks = list(
+            record_type.model.objects
+            .filter(**{f'{parent_attname}__in': {getattr(obj, parent_attname) for obj in objs}})
+            .filter(pk__gt=self.last_pks[record_type.name])
+            .order_by('pk')
+            .values_list('pk', flat=True)
+        )
+        if len(pks) != len(objs):
+            raise PortabilityError(f'Could not resolve new {record_type.name} rows')
+        for obj, pk in zip(objs, pks):
+            obj.pk = pk
+    
+    def _count_card(self):
+        self.card_count += 1
+        if self.entitlements and self.card_count > self.entitlements.card_limit:
+            raise PortabilityError(f'You have reached the maximum number of cards ({self.entitlements.card_limit})')
+    
+    def _count_link(self, card_pk):
+        self.link_counts[card_pk] = count = self.link_counts.get(card_pk, 0) + 1
+        if self.entitlements and count > self.entitlements.link_limit:
+            raise PortabilityError(f'A card has more than the maximum number of links ({self.entitlements.link_limit})')
+    
+    def _prepare_card(self, card, record):
+        if self._templates is None:
+            self._templates = dict(CardTemplate.objects.values_list('slug', 'pk'))
+        
+        template_id = self._templates.get(record.get('template'))
+        if template_id is None:
+            template_id = CardTemplate.objects.filter(is_active=True).values_list('pk', flat=True).first()
+            if template_id is None:
+                raise PortabilityError('No card template available')
+            self._templates[record.get('template')] = template_id
+        
+        card.user = self.user
+        card.template_id = template_id
+        
+        # Cards go live through a published snapshot once their content is in
+        if card.is_published:
+            self.published_refs.append(record.get('ref'))
+        card.is_published = False
+        card.is_draft = True
+        card.published_at = None
+        card.slug = self.slugs.allocate(card.slug or card.title)
+
+
+def import_records(user, records, chunk_size=CHUNK_SIZE):
+    """
+    Create cards for `user` from parsed records in one transaction, within
+    the limits of their plan. Returns the number of rows created per record type.
+    """
+    entitlements = user.get_entitlements()
+    importer = CardImporter(user, chunk_size=chunk_size, entitlements=entitlements)
+    if importer.card_count >= entitlements.card_limit:
+        raise PortabilityError(f'You have reached the maximum number of cards ({entitlements.card_limit})')
+    
+    with transaction.atomic():
+        for record in records:
+            importer.add(record)
+        importer.flush()
+        importer.publish()
+    return importer.counts
+
+
+def clone_card(card, user=None, title=None):
+    """
+    Deep-copy a card and all of its content, picks, videos and social links
+    into `user`'s account (the owner's by default). The copy starts unpublished.
+    Each record type is written with a single bulk_create and images are
+    shared with the original rather than copied. Returns the new card.
+    """
+    user = user or card.user
+    title = (title or f'{card.title} (Copy)')[:Card._meta.get_field('title').max_length]
+    
+    # No chunking: a card's content is bounded by the plan limits
+    importer = CardImporter(user, chunk_size=None, keep_files=True)
+    with transaction.atomic():
+        for record in export_records(Card.objects.filter(pk=card.pk)):
+            if record['type'] == 'header':
+                continue
+            if record['type'] == 'card':
+                record['fields'].update(title=title, slug='')
+            importer.add(record)
+        importer.flush()
+    
+    return Card.objects.get(pk=importer.refs['card'][card.pk])
@@ -0,0 +1,101 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import DEFERRED
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import Card
+from .versions import forget_public_lookups, invalidate_public_cards, invalidate_version
+
+User = get_user_model()
+
+# Card fields that decide which public URL serves a card, or whether any does
+PUBLIC_URL_FIELDS = ('slug', 'is_hidden')
+
+
+@receiver(post_delete, sender=Card)
+def card_deleted(sender, instance, **kwargs):
+    # Cached (username, slug) lookups fall through to the database once the
+    # snapshot they point at is gone, and then 404
+    if instance.published_version_id:
+        invalidate_version(instance.published_version_id)
+
+
+def _public_url(card):
+    return (card.user_id, card.slug, card.is_hidden)
+
+
+@receiver(pre_save, sender=Card)
+def remember_card_url(sender, instance, update_fields=None, **kwargs):
+    """Note the public URL a card had before this save"""
+    instance._previous_url = None
+    if instance.pk is None or instance._state.adding:
+        return
+    if update_fields is not None and not set(PUBLIC_URL_FIELDS + ('user',)) & set(update_fields):
+        return
+    # Unchanged since it was loaded or last saved: nothing to look up
+    if getattr(instance, '_loaded_url', None) == _public_url(instance):
+        return
+    instance._previous_url = (
+        Card.objects.filter(pk=instance.pk)
+        .values_list('user__username', 'slug', 'is_hidden')
+        .first()
+    )
+
+
+@receiver(post_save, sender=Card)
+def card_url_changed(sender, instance, created, update_fields=None, **kwargs):
+    """Repoint the cached public lookups when a card is renamed, moved or hidden"""
+    if update_fields is None or set(PUBLIC_URL_FIELDS + ('user',)) <= set(update_fields):
+        instance._loaded_url = _public_url(instance)
+    elif set(PUBLIC_URL_FIELDS + ('user',)) & set(update_fields):
+        # Only part of the URL was written: the row no longer matches either copy
+        instance._loaded_url = None
+    
+    previous = getattr(instance, '_previous_url', None)
+    if created or previous is None:
+        return
+    
+    username, slug, is_hidden = previous
+    if (username, slug, is_hidden) == (instance.user.username, instance.slug, instance.is_hidden):
+        return
+    
+    def invalidate():
+        if (username, slug) != (instance.user.username, instance.slug):
+            forget_public_lookups([(username, slug)])
+        invalidate_public_cards([instance])
+    transaction.on_commit(invalidate)
+
+
+@receiver(pre_save, sender=User)
+def remember_username(sender, instance, update_fields=None, **kwargs):
+    instance._previous_username = None
+    if instance.pk is None or instance._state.adding:
+        return
+    if update_fields is not None and 'username' not in update_fields:
+        return
+    if getattr(instance, '_loaded_username', DEFERRED) == instance.username:
+        return
+    instance._previous_username = User.objects.filter(pk=instance.pk).values_list('username', flat=True).first()
+
+
+@receiver(post_save, sender=User)
+def username_changed(sender, instance, created, update_fields=None, **kwargs):
+    """Move the cached public lookups of a renamed user's cards to the new username"""
+    if update_fields is None or 'username' in update_fields:
+        instance._loaded_username = instance.username
+    
+    previous = getattr(instance, '_previous_username', None)
+    if created or not previous or previous == instance.username:
+        return
+    
+    cards = list(Card.objects.filter(user=instance))
+    if not cards:
+        return
+    for card in cards:
+        card.user = instance
+    
+    def invalidate():
+        forget_public_lookups([(previous, card.slug) for card in cards])
+        invalidate_public_cards(cards)
+    transaction.on_commit(invalidate)
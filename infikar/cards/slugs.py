@@ -0,0 +1,72 @@
+"""
+Slug allocation for cards.
+
+Slugs are unique per user. The next free suffix is found from the user's slugs
+that start with the base (one `slug LIKE 'base%'` query on the (user, slug)
+index) instead of inserting and retrying until one sticks.
+"""
+from django.db import IntegrityError, transaction
+from django.utils.text import slugify
+
+# Room kept at the end of generated slugs for a '-<n>' suffix
+SUFFIX_ROOM = 8
+
+
+def slug_base(text, max_length=100):
+    return slugify(text)[:max_length - SUFFIX_ROOM].strip('-') or 'card'
+
+
+def pick_slug(base, taken):
+    """
+    `base` if it is free, otherwise `base-<n>` with the lowest free n from 2.
+    Numbers the user put in a slug themselves are not suffixes: with "summer"
+    and "summer-2024" taken, the next "summer" is "summer-2", not "summer-2025".
+    """
+    if base not in taken:
+        return base
+    
+    suffix = 2
+    while f'{base}-{suffix}' in taken:
+        suffix += 1
+    return f'{base}-{suffix}'
+
+
+def next_free_slug(queryset, base):
+    """Next free slug for `base` among the slugs in `queryset` (one query)"""
+    taken = set(queryset.filter(slug__startswith=base).values_list('slug', flat=True))
+    return pick_slug(base, taken)
+
+
+def save_with_unique_slug(instance, queryset, base, save):
+    """
+    Give `instance` the next free slug and save it.
+    If a concurrent request takes the same slug first, the insert is rolled
+    back to a savepoint and retried once with a freshly allocated slug.
+    """
+    instance.slug = next_free_slug(queryset, base)
+    try:
+        with transaction.atomic():
+            save()
+    except IntegrityError:
+        instance.slug = next_free_slug(queryset, base)
+        with transaction.atomic():
+            save()
+
+
+class SlugAllocator:
+    """
+    Allocates many slugs for one user with a single query, for bulk inserts.
+    Slugs handed out are remembered so one batch never repeats itself.
+    """
+    
+    def __init__(self, queryset):
+        self.queryset = queryset
+        self._taken = None
+    
+    def allocate(self, text):
+        if self._taken is None:
+            self._taken = set(self.queryset.values_list('slug', flat=True))
+        
+        slug = pick_slug(slug_base(text), self._taken)
+        self._taken.add(slug)
+        return slug
@@ -1,3 +1,522 @@
-from django.test import TestCase
+import json
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.models.query import QuerySet
+from django.http import Http404
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from infikar.benchmark import mismatched_meta
+from infikar.querybudget import QueryProfile, check_profile, fingerprint
+from infikar.subscriptions.entitlements import Entitlements
+
+from .models import Card, CardTemplate, LinkContent, RecommendationContent, RecommendationPick
+from .ordering import ORDER_STEP, ReorderError, apply_order, move_item
+from .portability import PortabilityError, clone_card, export_lines, import_records, parse_lines
+from .slugs import pick_slug
+from .versions import publish_cards
+from .views import AsyncCardDetailView, AsyncUserProfileView
+
+User = get_user_model()
+
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class PublicPageQueryBudgetTests(TestCase):
+    """The public pages stay within QUERY_BUDGETS and run no query in a loop"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='owner@example.com', password='x', username='owner', is_active=True)
+        template = CardTemplate.objects.create(name='Default', slug='default')
+        cls.cards = [
+            Card.objects.create(user=cls.user, template=template, title=f'Card {i}', card_type='link')
+            for i in range(6)
+        ]
+        LinkContent.objects.bulk_create([
+            LinkContent(card=card, title=f'Link {i}', url='https://example.com', sort_order=i)
+            for card in cls.cards
+            for i in range(5)
+        ])
+        publish_cards([card.pk for card in cls.cards])
+    
+    def test_home(self):
+        self.assertEqual(self.client.get(reverse('cards:home')).status_code, 200)
+    
+    def test_user_profile(self):
+        self.assertEqual(self.client.get(f'/@{self.user.username}/').status_code, 200)
+    
+    def test_card_detail(self):
+        for card in self.cards:
+            self.assertEqual(self.client.get(f'/@{self.user.username}/{card.slug}/').status_code, 200)
+    
+    def test_plan_list(self):
+        self.assertEqual(self.client.get(reverse('subscriptions:plan_list')).status_code, 200)
+
+
+class QueryProfileTests(SimpleTestCase):
+
+    def test_fingerprint_collapses_literals(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE id = 12 AND name = 'a''b'"),
+            fingerprint("SELECT *  FROM t WHERE id = 7 AND name = 'c'"),
+        )
+        self.assertEqual(
+            fingerprint('SELECT * FROM t WHERE id IN (1, 2, 3)'),
+            'SELECT * FROM t WHERE id IN (...)',
+        )
+    
+    @override_settings(QUERY_BUDGETS={'view': 10}, QUERY_REPEAT_THRESHOLD=5)
+    def test_repeated_query_is_reported_with_origin(self):
+        profile = QueryProfile()
+        for pk in range(5):
+            profile.record(f'SELECT * FROM card WHERE id = {pk}')
+        
+        problems = check_profile('view', profile)
+        self.assertEqual(len(problems), 1)
+        self.assertIn('Probable N+1 in view: 5x', problems[0])
+        self.assertIn('infikar/cards/tests.py', problems[0])
+    
+    @override_settings(QUERY_BUDGETS={'view': 3}, QUERY_REPEAT_THRESHOLD=5)
+    def test_budget(self):
+        profile = QueryProfile()
+        for table in ('a', 'b', 'c', 'd'):
+            profile.record(f'SELECT * FROM {table}')
+        
+        self.assertEqual(check_profile('view', profile), ['view ran 4 queries (budget 3)'])
+
+
+def _without_returned_pks(bulk_create):
+    """Wrap QuerySet.bulk_create to behave like MySQL, which returns no primary keys"""
+    def wrapper(self, objs, *args, **kwargs):
+        objs = bulk_create(self, objs, *args, **kwargs)
+        for obj in objs:
+            obj.pk = None
+        return objs
+    return wrapper
+
+
+class PortabilityTests(TestCase):
+    """Card export and import"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(email='owner@example.com', password='x', username='owner', is_active=True)
+        cls.other = User.objects.create_user(email='other@example.com', password='x', username='other', is_active=True)
+        CardTemplate.objects.create(name='Default', slug='default')
+        template = CardTemplate.objects.get()
+        cls.cards = [
+            Card.objects.create(
+                user=cls.owner, template=template, title=f'Card {i}', card_type='link',
+                card_image='cards/card_images/owner.png',
+            )
+            for i in range(3)
+        ]
+        LinkContent.objects.bulk_create([
+            LinkContent(card=card, title=f'{card.title} link {i}', url='https://example.com', sort_order=i)
+            for card in cls.cards
+            for i in range(4)
+        ])
+        recommendation = RecommendationContent.objects.create(card=cls.cards[0], title='Picks')
+        RecommendationPick.objects.bulk_create([
+            RecommendationPick(recommendation=recommendation, order_number=i, title=f'Pick {i}')
+            for i in range(3)
+        ])
+        publish_cards([cls.cards[0].pk])
+    
+    def setUp(self):
+        self.other._entitlements = Entitlements(card_limit=10, link_limit=100)
+    
+    def export(self):
+        return list(export_lines(Card.objects.filter(user=self.owner)))
+    
+    def import_lines(self, lines, **kwargs):
+        return import_records(self.other, parse_lines(lines), **kwargs)
+    
+    def assert_copied(self):
+        for card in self.cards:
+            copy = Card.objects.get(user=self.other, title=card.title)
+            self.assertEqual(
+                list(copy.link_contents.order_by('sort_order').values_list('title', flat=True)),
+                list(card.link_contents.order_by('sort_order').values_list('title', flat=True)),
+            )
+        self.assertEqual(
+            list(RecommendationPick.objects.filter(recommendation__card__user=self.other)
+                 .order_by('order_number').values_list('title', flat=True)),
+            ['Pick 0', 'Pick 1', 'Pick 2'],
+        )
+    
+    def test_round_trip(self):
+        counts = self.import_lines(self.export())
+        
+        self.assertEqual(counts['card'], 3)
+        self.assertEqual(counts['link'], 12)
+        self.assertEqual(counts['pick'], 3)
+        self.assert_copied()
+        
+        # Only the card that was live in the export is published again
+        published = Card.objects.filter(user=self.other, is_published=True)
+        self.assertEqual(list(published.values_list('title', flat=True)), ['Card 0'])
+        self.assertIsNotNone(published.get().published_version_id)
+    
+    def test_chunked_flushing(self):
+        counts = self.import_lines(self.export(), chunk_size=2)
+        
+        self.assertEqual(counts['link'], 12)
+        self.assert_copied()
+    
+    def test_fetch_pks_without_returned_pks(self):
+        with mock.patch.object(QuerySet, 'bulk_create', _without_returned_pks(QuerySet.bulk_create)):
+            self.import_lines(self.export(), chunk_size=2)
+        
+        self.assert_copied()
+    
+    def test_import_blanks_files(self):
+        self.import_lines(self.export())
+        
+        self.assertFalse(Card.objects.filter(user=self.other).exclude(card_image='').exists())
+    
+    def test_clone_keeps_files(self):
+        copy = clone_card(self.cards[1], user=self.other)
+        
+        self.assertEqual(copy.card_image.name, 'cards/card_images/owner.png')
+        self.assertEqual(copy.link_contents.count(), 4)
+    
+    def test_slugs(self):
+        exported = [json.loads(line) for line in self.export()]
+        self.assertEqual(
+            [record['fields']['slug'] for record in exported if record['type'] == 'card'], ['card-0', 'card-1', 'card-2'],
+        )
+        
+        template = CardTemplate.objects.get()
+        for slug in ('card-0', 'card-0-2024'):
+            Card.objects.create(user=self.other, template=template, title=slug, slug=slug, card_type='link')
+        self.import_lines(self.export())
+        
+        # Imported cards keep their slugs where they are free
+        imported = Card.objects.filter(user=self.other, title__startswith='Card ')
+        self.assertEqual(sorted(imported.values_list('slug', flat=True)), ['card-0-2', 'card-1', 'card-2'])
+        
+        # Copies are named after their title
+        self.assertEqual(clone_card(self.cards[1], user=self.other).slug, 'card-1-copy')
+        self.assertEqual(clone_card(self.cards[1], user=self.other).slug, 'card-1-copy-2')
+    
+    def test_card_limit(self):
+        self.other._entitlements = Entitlements(card_limit=2, link_limit=100)
+        
+        with self.assertRaisesMessage(PortabilityError, 'maximum number of cards (2)'):
+            self.import_lines(self.export())
+        self.assertFalse(Card.objects.filter(user=self.other).exists())
+    
+    def test_card_limit_already_reached(self):
+        self.other._entitlements = Entitlements(card_limit=0, link_limit=100)
+        
+        with self.assertRaisesMessage(PortabilityError, 'maximum number of cards (0)'):
+            import_records(self.other, iter(()))
+    
+    def test_link_limit(self):
+        self.other._entitlements = Entitlements(card_limit=10, link_limit=3)
+        
+        with self.assertRaisesMessage(PortabilityError, 'maximum number of links (3)'):
+            self.import_lines(self.export(), chunk_size=2)
+        self.assertFalse(Card.objects.filter(user=self.other).exists())
+    
+    def test_malformed_input(self):
+        header = json.dumps({'type': 'header', 'format': 'infikar-cards', 'version': 1})
+        card = json.dumps({'type': 'card', 'ref': 1, 'template': 'default', 'fields': {'title': 'A'}})
+        cases = {
+            'invalid JSON': [header, '{"type": '],
+            'Not an Infikar card export': [card],
+            'Import file is empty': [],
+            "Unknown record type 'widget'": [header, json.dumps({'type': 'widget'})],
+            'references an unknown card': [header, json.dumps({'type': 'link', 'parent': 99, 'fields': {}})],
+            'fields must be an object': [header, json.dumps({'type': 'card', 'ref': 1, 'fields': []})],
+            'Unsupported export version': [json.dumps({'type': 'header', 'format': 'infikar-cards', 'version': 2})],
+        }
+        for message, lines in cases.items():
+            with self.subTest(message), self.assertRaisesMessage(PortabilityError, message):
+                self.import_lines(lines)
+        self.assertFalse(Card.objects.filter(user=self.other).exists())
+    
+    def test_import_view_reports_errors(self):
+        self.client.force_login(self.other)
+        upload = SimpleUploadedFile('cards.jsonl', b'not json')
+        
+        response = self.client.post(reverse('app:import'), {'file': upload})
+        
+        self.assertRedirects(response, reverse('app:dashboard'), fetch_redirect_response=False)
+        self.assertEqual(
+            [str(message) for message in get_messages(response.wsgi_request)],
+            ['Import failed: Line 1: invalid JSON'],
+        )
+
+
+class PickSlugTests(SimpleTestCase):
+
+    def test_free_base(self):
+        self.assertEqual(pick_slug('summer', set()), 'summer')
+        self.assertEqual(pick_slug('summer', {'summer-2'}), 'summer')
+    
+    def test_suffixes(self):
+        self.assertEqual(pick_slug('summer', {'summer'}), 'summer-2')
+        self.assertEqual(pick_slug('summer', {'summer', 'summer-2', 'summer-3'}), 'summer-4')
+        self.assertEqual(pick_slug('summer-2024', {'summer-2024'}), 'summer-2024-2')
+    
+    def test_numbers_in_other_slugs_are_not_suffixes(self):
+        self.assertEqual(pick_slug('summer', {'summer', 'summer-2024'}), 'summer-2')
+        self.assertEqual(pick_slug('summer', {'summer', 'summer-party-3', 'summers-5'}), 'summer-2')
+
+
+class PublicCardCacheTests(TestCase):
+    """Cached public lookups follow a card when its URL changes"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='owner@example.com', password='x', username='owner', is_active=True)
+        template = CardTemplate.objects.create(name='Default', slug='default')
+        cls.card = Card.objects.create(user=cls.user, template=template, title='Card', slug='card', card_type='link')
+        publish_cards([cls.card.pk])
+    
+    def setUp(self):
+        cache.clear()
+        self.card.refresh_from_db()
+        # Warm the cached lookup
+        self.assertEqual(self.client.get('/@owner/card/').status_code, 200)
+    
+    def save(self, obj):
+        with self.captureOnCommitCallbacks(execute=True):
+            obj.save()
+    
+    def test_hidden_card(self):
+        self.card.is_hidden = True
+        self.save(self.card)
+        
+        self.assertEqual(self.client.get('/@owner/card/').status_code, 404)
+    
+    def test_slug_change(self):
+        self.card.slug = 'renamed'
+        self.save(self.card)
+        
+        self.assertEqual(self.client.get('/@owner/card/').status_code, 404)
+        self.assertEqual(self.client.get('/@owner/renamed/').status_code, 200)
+    
+    def test_username_change(self):
+        self.user.username = 'newname'
+        self.save(self.user)
+        
+        self.assertEqual(self.client.get('/@owner/card/').status_code, 404)
+        self.assertEqual(self.client.get('/@newname/card/').status_code, 200)
+    
+    def assert_no_lookup(self, obj):
+        with CaptureQueriesContext(connection) as queries:
+            self.save(obj)
+        self.assertEqual([query['sql'].split()[0] for query in queries], ['UPDATE'])
+    
+    def test_unrelated_saves_run_no_lookup(self):
+        card = Card.objects.get(pk=self.card.pk)
+        card.title = 'Renamed title'
+        self.assert_no_lookup(card)
+        
+        user = User.objects.get(pk=self.user.pk)
+        user.first_name = 'Owner'
+        self.assert_no_lookup(user)
+        
+        # The saved values are what later saves compare against
+        card.slug = 'renamed'
+        self.save(card)
+        card.title = 'Card'
+        self.assert_no_lookup(card)
+        self.assertEqual(self.client.get('/@owner/renamed/').status_code, 200)
+
+
+class AsyncPublicViewTests(TestCase):
+    """The ASGI variants of the public pages render the same snapshots"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='owner@example.com', password='x', username='owner', is_active=True)
+        template = CardTemplate.objects.create(name='Default', slug='default')
+        cls.card = Card.objects.create(user=cls.user, template=template, title='Card', slug='card', card_type='link')
+        publish_cards([cls.card.pk])
+    
+    def setUp(self):
+        self.factory = RequestFactory()
+    
+    def get(self, view_class, **kwargs):
+        request = self.factory.get('/')
+        request.user = self.user
+        return async_to_sync(view_class.as_view())(request, **kwargs)
+    
+    def test_profile(self):
+        response = self.get(AsyncUserProfileView, username='owner')
+        self.assertContains(response, 'Card')
+        
+        with self.assertRaises(Http404):
+            self.get(AsyncUserProfileView, username='nobody')
+    
+    def test_card_detail(self):
+        response = self.get(AsyncCardDetailView, username='owner', card_slug='card')
+        self.assertContains(response, 'Card')
+        
+        with self.assertRaises(Http404):
+            self.get(AsyncCardDetailView, username='owner', card_slug='missing')
+
+
+@override_settings(DEBUG=False)
+class BenchmarkCommandTests(TestCase):
+    """The benchmark only writes to the database in development or when allowed to"""
+    
+    def test_refuses_seeding(self):
+        with self.assertRaisesMessage(CommandError, '--allow-writes'):
+            call_command('benchmark', '--seed-users', '10', '--scenarios', 'profile', stdout=StringIO())
+        self.assertFalse(User.objects.exists())
+    
+    def test_refuses_writing_scenarios(self):
+        with self.assertRaisesMessage(CommandError, 'link_reorder writes to the database'):
+            call_command('benchmark', stdout=StringIO())
+    
+    def test_read_only_scenarios_run(self):
+        # Gets past the guard, then stops on the empty database
+        with self.assertRaisesMessage(CommandError, 'No published cards'):
+            call_command('benchmark', '--scenarios', 'profile,card_detail', stdout=StringIO())
+    
+    def test_baselines_compare_only_on_the_same_hardware(self):
+        meta = {'database': 'sqlite', 'concurrency': 1, 'users': 10, 'seed': 0, 'python': '3.11.7',
+                'host': 'ci-1', 'cpu': 'AMD EPYC 7B13', 'cpus': 8}
+        
+        self.assertEqual(mismatched_meta({'meta': meta}, {'meta': {**meta, 'host': 'ci-2'}}), [])
+        self.assertEqual(mismatched_meta({'meta': meta}, {'meta': {**meta, 'cpu': 'Apple M2', 'cpus': 10}}), ['cpu', 'cpus'])
+
+
+class ReorderTests(TestCase):
+    """Full reorders and single moves of links, cards and picks"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='owner@example.com', password='x', username='owner', is_active=True)
+        other = User.objects.create_user(email='other@example.com', password='x', username='other', is_active=True)
+        template = CardTemplate.objects.create(name='Default', slug='default')
+        cls.cards = [
+            Card.objects.create(user=cls.user, template=template, title=f'Card {i}', card_type='link', sort_order=i)
+            for i in range(3)
+        ]
+        cls.other_card = Card.objects.create(user=other, template=template, title='Other', card_type='link')
+        cls.links = LinkContent.objects.bulk_create([
+            LinkContent(card=cls.cards[0], title=f'Link {i}', url='https://example.com', sort_order=(i + 1) * ORDER_STEP)
+            for i in range(4)
+        ])
+        cls.foreign_link = LinkContent.objects.create(card=cls.other_card, title='Foreign', url='https://example.com')
+        cls.recommendation = RecommendationContent.objects.create(card=cls.cards[0], title='Picks')
+        cls.picks = RecommendationPick.objects.bulk_create([
+            RecommendationPick(recommendation=cls.recommendation, order_number=i + 1, title=f'Pick {i}')
+            for i in range(3)
+        ])
+    
+    def setUp(self):
+        self.client.force_login(self.user)
+    
+    def link_queryset(self):
+        return LinkContent.objects.filter(card=self.cards[0])
+    
+    def link_ids(self):
+        return list(self.link_queryset().order_by('sort_order').values_list('pk', flat=True))
+    
+    def post(self, url, data):
+        return self.client.post(url, json.dumps(data), content_type='application/json')
+    
+    def test_apply_order(self):
+        ids = [link.pk for link in reversed(self.links)]
+        
+        self.assertEqual(apply_order(self.link_queryset(), 'sort_order', ids), 4)
+        
+        self.assertEqual(self.link_ids(), ids)
+        positions = self.link_queryset().order_by('sort_order').values_list('sort_order', flat=True)
+        self.assertEqual(list(positions), [ORDER_STEP, 2 * ORDER_STEP, 3 * ORDER_STEP, 4 * ORDER_STEP])
+    
+    def test_apply_order_rejects_partial_and_foreign_ids(self):
+        ids = [link.pk for link in self.links]
+        for bad in (ids[:2], ids + [self.foreign_link.pk], ids[1:] + [self.foreign_link.pk], ids + ids[:1]):
+            with self.assertRaises(ReorderError):
+                apply_order(self.link_queryset(), 'sort_order', bad)
+        self.assertEqual(self.link_ids(), ids)
+    
+    def test_move_item_to_first_and_last(self):
+        first, second, third, last = (link.pk for link in self.links)
+        
+        self.assertEqual(move_item(self.link_queryset(), 'sort_order', last), 1)
+        self.assertEqual(self.link_ids(), [last, first, second, third])
+        
+        self.assertEqual(move_item(self.link_queryset(), 'sort_order', last, after_id=third), 1)
+        self.assertEqual(self.link_ids(), [first, second, third, last])
+        
+        self.assertEqual(move_item(self.link_queryset(), 'sort_order', first, before_id=third), 1)
+        self.assertEqual(self.link_ids(), [second, first, third, last])
+        
+        with self.assertRaises(ReorderError):
+            move_item(self.link_queryset(), 'sort_order', first, after_id=self.foreign_link.pk)
+    
+    def test_move_item_renumbers_without_a_gap(self):
+        picks = RecommendationPick.objects.filter(recommendation=self.recommendation)
+        first, second, last = (pick.pk for pick in self.picks)
+        
+        # Dense numbers leave no key between neighbours
+        self.assertEqual(move_item(picks, 'order_number', last, after_id=first, step=1), 3)
+        
+        numbers = picks.order_by('order_number').values_list('pk', 'order_number')
+        self.assertEqual(list(numbers), [(first, 1), (last, 2), (second, 3)])
+    
+    def test_card_reorder_view(self):
+        url = reverse('app:card_reorder')
+        ids = [card.pk for card in reversed(self.cards)]
+        
+        response = self.post(url, {'card_orders': [{'id': pk, 'order': i} for i, pk in enumerate(ids)]})
+        
+        self.assertEqual(response.json(), {'status': 'success', 'updated': 3})
+        self.assertEqual(list(Card.objects.filter(user=self.user).values_list('pk', flat=True)), ids)
+        
+        # Another user's card is not part of this user's order
+        orders = [{'id': pk, 'order': i} for i, pk in enumerate(ids + [self.other_card.pk])]
+        self.assertEqual(self.post(url, {'card_orders': orders}).status_code, 400)
+    
+    def test_link_reorder_view(self):
+        url = reverse('app:link_reorder', args=[self.cards[0].pk])
+        first, second, third, last = (link.pk for link in self.links)
+        
+        response = self.post(url, {'link_orders': [{'id': first, 'order': 2}, {'id': second, 'order': 1}]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.link_ids(), [first, second, third, last])
+        
+        # Moves to the first and last positions, as sent by the drag-and-drop list
+        self.assertEqual(self.post(url, {'move': {'id': third, 'after': None}}).json()['updated'], 1)
+        self.assertEqual(self.post(url, {'move': {'id': first, 'after': last}}).json()['updated'], 1)
+        self.assertEqual(self.link_ids(), [third, second, last, first])
+        
+        response = self.post(url, {'move': {'id': self.foreign_link.pk, 'after': None}})
+        self.assertEqual(response.status_code, 400)
+    
+    def test_pick_reorder_view(self):
+        url = reverse('app:pick_reorder', args=[self.cards[0].pk, self.recommendation.pk])
+        ids = [pick.pk for pick in reversed(self.picks)]
+        
+        response = self.post(url, {'pick_orders': [{'id': pk, 'order': i} for i, pk in enumerate(ids)]})
+        
+        self.assertEqual(response.json()['updated'], 3)
+        numbers = RecommendationPick.objects.order_by('order_number').values_list('pk', 'order_number')
+        self.assertEqual(list(numbers), [(pk, i) for i, pk in enumerate(ids, start=1)])
+        
+        response = self.post(url, {'pick_orders': [{'id': ids[0], 'order': 0}]})
+        self.assertEqual(response.status_code, 400)
+        
+        # The picks are only reachable under their own card
+        url = reverse('app:pick_reorder', args=[self.other_card.pk, self.recommendation.pk])
+        response = self.post(url, {'pick_orders': [{'id': pk, 'order': i} for i, pk in enumerate(ids)]})
+        self.assertEqual(response.status_code, 400)
@@ -1,11 +1,18 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
 app_name = 'cards'
 
+# Async views only pay off under ASGI workers; sync workers get sync views
+if settings.SERVER_MODE == 'asgi':
+    UserProfileView, CardDetailView = views.AsyncUserProfileView, views.AsyncCardDetailView
+else:
+    UserProfileView, CardDetailView = views.UserProfileView, views.CardDetailView
+
 urlpatterns = [
     # Public URLs (no prefix)
     path('', views.HomeView.as_view(), name='home'),
-    path('@<str:username>/', views.UserProfileView.as_view(), name='user_profile'),
-    path('@<str:username>/<str:card_slug>/', views.CardDetailView.as_view(), name='card_detail'),
+    path('@<str:username>/', UserProfileView.as_view(), name='user_profile'),
+    path('@<str:username>/<str:card_slug>/', CardDetailView.as_view(), name='card_detail'),
 ]
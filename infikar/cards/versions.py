@@ -0,0 +1,279 @@
+"""
+Published card snapshots.
+
+The live Card row and its content are the working copy edited from the manage
+pages. Publishing serializes the card, its content, picks and videos into one
+render-ready JSON blob (a CardVersion) and points Card.published_version at it
+in the same transaction. Public pages read only snapshots: a cached
+(username, slug) -> version id lookup, then one primary-key read. Each read has
+a sync and an async version, for the sync and async public views.
+
+Plans with drafts (can_save_drafts) keep edits unpublished until the owner
+publishes again; on other plans an edit to a published card is published
+straight away.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from infikar import async_cache
+from .models import Card, CardVersion
+
+# snapshot key, related name on the card, optional nested (key, related name)
+CONTENT_SECTIONS = (
+    ('links', 'link_contents', None),
+    ('about', 'about_contents', None),
+    ('recommendations', 'recommendation_contents', ('picks', 'picks')),
+    ('splash', 'splash_contents', None),
+    ('youtube', 'youtube_contents', ('videos', 'videos')),
+)
+
+CARD_FIELDS = (
+    'title', 'slug', 'card_type', 'social_links', 'card_image',
+    'custom_font_family', 'custom_font_weight', 'custom_font_size',
+    'custom_text_transform', 'custom_background_color',
+    'created_at', 'updated_at', 'published_at',
+)
+
+# Snapshot timestamps templates format with the date filter
+DATETIME_KEYS = ('created_at', 'updated_at', 'published_at')
+
+PREFETCH = tuple(
+    f'{related}__{nested[1]}' if nested else related
+    for _, related, nested in CONTENT_SECTIONS
+)
+
+
+def _serialize(obj, field_names=None):
+    data = {'id': obj.pk}
+    for field in obj._meta.concrete_fields:
+        if field.is_relation or field.primary_key:
+            continue
+        if field_names is not None and field.name not in field_names:
+            continue
+        value = field.value_from_object(obj)
+        if isinstance(field, models.FileField):
+            value = value.url if value else ''
+        data[field.name] = value
+    return data
+
+
+def build_snapshot(card):
+    """
+    Serialize a card and everything its public pages render.
+    Prefetch PREFETCH (and select the template) to build it in a fixed number of queries.
+    """
+    data = _serialize(card, CARD_FIELDS)
+    data['card_type_display'] = card.get_card_type_display()
+    data['template'] = {'name': card.template.name, 'slug': card.template.slug}
+    
+    for key, related, nested in CONTENT_SECTIONS:
+        items = []
+        for obj in getattr(card, related).all():
+            item = _serialize(obj)
+            if nested:
+                nested_key, nested_related = nested
+                item[nested_key] = [_serialize(child) for child in getattr(obj, nested_related).all()]
+            items.append(item)
+        data[key] = items
+    return data
+
+
+def load_snapshot(snapshot):
+    """Snapshot ready for templates, with its timestamps parsed back into datetimes"""
+    data = dict(snapshot)
+    for key in DATETIME_KEYS:
+        if data.get(key):
+            data[key] = parse_datetime(data[key])
+    return data
+
+
+def _public_cache_key(username, slug):
+    return f'public_card:{username}:{slug}'
+
+
+def _version_cache_key(version_id):
+    return f'card_version:{version_id}'
+
+
+def invalidate_public_cards(cards):
+    """
+    Point the cached public lookups at the cards' current versions.
+    Written through rather than deleted, so a read from a lagging replica
+    cannot put the previous version back into the cache.
+    """
+    cache.set_many({
+        _public_cache_key(card.user.username, card.slug): 0 if card.is_hidden else (card.published_version_id or 0)
+        for card in cards
+    }, settings.PUBLIC_CARD_CACHE_TTL)
+
+
+def forget_public_lookups(lookups):
+    """Drop the cached public lookups of (username, slug) pairs a card no longer answers to"""
+    cache.delete_many([_public_cache_key(username, slug) for username, slug in lookups])
+
+
+def invalidate_version(version_id):
+    cache.delete(_version_cache_key(version_id))
+
+
+def publish_cards(card_ids):
+    """
+    Snapshot and publish cards in one transaction.
+    Content is prefetched for all cards at once and the new versions are
+    written with one bulk insert. Returns the new versions.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        cards = list(
+            Card.objects
+            .select_for_update(of=('self',))
+            .select_related('template', 'user')
+            .prefetch_related(*PREFETCH)
+            .filter(pk__in=card_ids)
+            .order_by('pk')
+        )
+        if not cards:
+            return []
+        
+        numbers = dict(
+            CardVersion.objects.filter(card__in=cards)
+            .values_list('card_id')
+            .annotate(last=Max('number'))
+        )
+        
+        versions = []
+        for card in cards:
+            card.published_at = now
+            versions.append(CardVersion(
+                card=card,
+                number=numbers.get(card.pk, 0) + 1,
+                snapshot=build_snapshot(card),
+            ))
+        CardVersion.objects.bulk_create(versions)
+        
+        if versions[0].pk is None:
+            # MySQL does not return keys from bulk inserts; (card, number) is unique
+            pks = {
+                (card_id, number): pk
+                for pk, card_id, number in CardVersion.objects.filter(card__in=cards).values_list('pk', 'card_id', 'number')
+            }
+            for version in versions:
+                version.pk = pks[(version.card_id, version.number)]
+        
+        for card, version in zip(cards, versions):
+            card.published_version = version
+            card.is_published = True
+            card.is_draft = False
+        Card.objects.bulk_update(cards, ['published_version', 'is_published', 'is_draft', 'published_at'])
+        
+        # Keep a short history; the live version is always the newest
+        stale = models.Q()
+        for version in versions:
+            stale |= models.Q(card_id=version.card_id, number__lte=version.number - settings.CARD_VERSION_HISTORY)
+        CardVersion.objects.filter(stale).delete()
+        
+        transaction.on_commit(lambda: invalidate_public_cards(cards))
+    return versions
+
+
+def publish_card(card):
+    """Publish the card's current content. Returns the new CardVersion."""
+    return publish_cards([card.pk])[0]
+
+
+def unpublish_card(card):
+    """Take a card off the public pages; its content becomes a draft again"""
+    Card.objects.filter(pk=card.pk).update(published_version=None, is_published=False, is_draft=True)
+    card.published_version = None
+    card.is_published = False
+    card.is_draft = True
+    transaction.on_commit(lambda: invalidate_public_cards([card]))
+
+
+def record_edit(card_id, user):
+    """
+    Note an edit to a card's content.
+    With drafts the published snapshot stays as is and the card is flagged as
+    having unpublished changes; without them, a published card is republished.
+    """
+    published = Card.objects.filter(pk=card_id, user=user, published_version__isnull=False)
+    if user.get_entitlements().can_save_drafts:
+        published.update(is_draft=True)
+    elif published.exists():
+        publish_cards([card_id])
+
+
+def get_public_snapshot(username, slug):
+    """
+    Published snapshot for a public card URL, or None.
+    The version id is cached (including misses). Versions never change once
+    written, so their snapshots are cached too and a warm read never touches
+    the database; a cold one is a single primary-key lookup.
+    """
+    key = _public_cache_key(username, slug)
+    version_id = cache.get(key)
+    if version_id is None:
+        version_id = Card.objects.filter(
+            user__username=username, slug=slug, is_hidden=False,
+        ).values_list('published_version_id', flat=True).first() or 0
+        cache.set(key, version_id, settings.PUBLIC_CARD_CACHE_TTL)
+    if not version_id:
+        return None
+    
+    version_key = _version_cache_key(version_id)
+    snapshot = cache.get(version_key)
+    if snapshot is None:
+        snapshot = CardVersion.objects.filter(pk=version_id).values_list('snapshot', flat=True).first()
+        if snapshot is None:
+            # The card was deleted since the id was cached
+            cache.delete(key)
+            return None
+        cache.set(version_key, snapshot, settings.CARD_VERSION_CACHE_TTL)
+    return load_snapshot(snapshot)
+
+
+def _profile_snapshots(user):
+    return (
+        Card.objects
+        .filter(user=user, is_hidden=False, published_version__isnull=False)
+        .order_by('sort_order', 'created_at')
+        .values_list('published_version__snapshot', flat=True)
+    )
+
+
+def get_profile_snapshots(user):
+    """Published snapshots of a user's visible cards, in profile order, in one query"""
+    return [load_snapshot(snapshot) for snapshot in _profile_snapshots(user)]
+
+
+async def aget_public_snapshot(username, slug):
+    """Async get_public_snapshot"""
+    key = _public_cache_key(username, slug)
+    version_id = await async_cache.aget(key)
+    if version_id is None:
+        version_id = await Card.objects.filter(
+            user__username=username, slug=slug, is_hidden=False,
+        ).values_list('published_version_id', flat=True).afirst() or 0
+        await async_cache.aset(key, version_id, settings.PUBLIC_CARD_CACHE_TTL)
+    if not version_id:
+        return None
+    
+    version_key = _version_cache_key(version_id)
+    snapshot = await async_cache.aget(version_key)
+    if snapshot is None:
+        snapshot = await CardVersion.objects.filter(pk=version_id).values_list('snapshot', flat=True).afirst()
+        if snapshot is None:
+            # The card was deleted since the id was cached
+            await async_cache.adelete(key)
+            return None
+        await async_cache.aset(version_key, snapshot, settings.CARD_VERSION_CACHE_TTL)
+    return load_snapshot(snapshot)
+
+
+async def aget_profile_snapshots(user):
+    """Async get_profile_snapshots"""
+    return [load_snapshot(snapshot) async for snapshot in _profile_snapshots(user)]
@@ -1,21 +1,30 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.views.generic import TemplateView, ListView, DetailView, CreateView, UpdateView, DeleteView
+from django.views.generic import View, TemplateView, ListView, DetailView, CreateView, UpdateView, DeleteView
 from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
 from django.contrib import messages
 from django.urls import reverse_lazy
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.db import transaction
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 import json
-from .models import Card, CardTemplate, LinkContent
+from infikar.db.routers import use_replica
+from .models import Card, CardTemplate, LinkContent, RecommendationPick
 from .forms import CardCreateForm, LinkCreateForm
+from .ordering import ORDER_STEP, ReorderError, apply_order, move_item, next_position
+from .portability import PortabilityError, clone_card, export_lines, import_records, parse_lines
+from .versions import (
+    aget_profile_snapshots, aget_public_snapshot, get_profile_snapshots, get_public_snapshot,
+    publish_card, record_edit, unpublish_card,
+)
 
 User = get_user_model()
 
 
+@method_decorator(use_replica, name='dispatch')
 class HomeView(TemplateView):
     template_name = 'cards/home.html'
     
@@ -26,37 +35,62 @@ class HomeView(TemplateView):
         return context
 
 
-class UserProfileView(DetailView):
-    model = User
+@method_decorator(use_replica, name='get')
+class UserProfileView(View):
+    """Public profile page"""
     template_name = "cards/user_profile.html"
-    context_object_name = 'profile_user'
-    slug_field = 'username'
-    slug_url_kwarg = 'username'
     
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        user = self.get_object()
-        context['cards'] = Card.objects.filter(
-            user=user, 
-            is_published=True, 
-            is_hidden=False
-        ).order_by('sort_order')
-        return context
+    def get(self, request, username):
+        try:
+            profile_user = User.objects.select_related('profile').get(username=username)
+        except User.DoesNotExist:
+            raise Http404('User not found')
+        
+        context = {
+            'profile_user': profile_user,
+            'cards': get_profile_snapshots(profile_user),
+        }
+        return render(request, self.template_name, context)
 
 
-class CardDetailView(DetailView):
-    model = Card
+@method_decorator(use_replica, name='get')
+class AsyncUserProfileView(UserProfileView):
+    """Public profile page for ASGI workers (SERVER_MODE=asgi)"""
+    
+    async def get(self, request, username):
+        try:
+            profile_user = await User.objects.select_related('profile').aget(username=username)
+        except User.DoesNotExist:
+            raise Http404('User not found')
+        
+        context = {
+            'profile_user': profile_user,
+            'cards': await aget_profile_snapshots(profile_user),
+        }
+        return render(request, self.template_name, context)
+
+
+@method_decorator(use_replica, name='get')
+class CardDetailView(View):
+    """Public card page, rendered from the card's published snapshot"""
     template_name = "cards/card_detail.html"
-    context_object_name = 'card'
-    
-    def get_object(self):
-        username = self.kwargs['username']
-        card_slug = self.kwargs['card_slug']
-        return Card.objects.get(
-            user__username=username,
-            slug=card_slug,
-            is_published=True
-        )
+    
+    def get(self, request, username, card_slug):
+        card = get_public_snapshot(username, card_slug)
+        if card is None:
+            raise Http404('Card not found')
+        return render(request, self.template_name, {'card': card, 'username': username})
+
+
+@method_decorator(use_replica, name='get')
+class AsyncCardDetailView(CardDetailView):
+    """Public card page for ASGI workers (SERVER_MODE=asgi)"""
+    
+    async def get(self, request, username, card_slug):
+        card = await aget_public_snapshot(username, card_slug)
+        if card is None:
+            raise Http404('Card not found')
+        return render(request, self.template_name, {'card': card, 'username': username})
 
 
 class DashboardView(TemplateView):
@@ -77,6 +111,38 @@ class DashboardView(TemplateView):
         return context
 
 
+@method_decorator(login_required, name='dispatch')
+class CardExportView(TemplateView):
+    """Download all of the user's cards as JSON Lines"""
+    
+    def get(self, request):
+        response = StreamingHttpResponse(
+            export_lines(Card.objects.filter(user=request.user)),
+            content_type='application/x-ndjson',
+        )
+        response['Content-Disposition'] = f'attachment; filename="{request.user.username}-cards.jsonl"'
+        return response
+
+
+@method_decorator(login_required, name='dispatch')
+class CardImportView(TemplateView):
+    """Import cards from an uploaded JSON Lines export"""
+    
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            messages.error(request, 'Choose an export file to import')
+            return redirect('app:dashboard')
+        
+        try:
+            counts = import_records(request.user, parse_lines(upload))
+        except (PortabilityError, UnicodeDecodeError) as e:
+            messages.error(request, f'Import failed: {e}')
+        else:
+            messages.success(request, f"Imported {counts['card']} cards successfully!")
+        return redirect('app:dashboard')
+
+
 class CardCreateView(TemplateView):
     """Create a new card with dynamic form handling"""
     template_name = 'cards/card_create.html'
@@ -105,7 +171,11 @@ class CardCreateView(TemplateView):
             if form.is_valid():
                 form.instance.user = request.user
                 form.instance.template = CardTemplate.objects.first()
-                form.save()
+                publish = form.cleaned_data.get('is_published')
+                form.instance.is_published = False
+                card = form.save()
+                if publish:
+                    publish_card(card)
                 messages.success(request, f'Card "{form.instance.title}" created successfully!')
                 return redirect('app:dashboard')
             else:
@@ -145,7 +215,7 @@ class CardCreateView(TemplateView):
             }
             return render(request, 'cards/card_preview.html', context)
         
-        return redirect('cards:create')
+        return redirect('app:create')
     
     def create_link_collection(self, request):
         """Create a link collection card with links and social media"""
@@ -153,44 +223,43 @@ class CardCreateView(TemplateView):
             action = request.POST.get('action', 'publish')
             is_published = action == 'publish'
             
-            # Create the card
-            card = Card.objects.create(
-                user=request.user,
-                title=request.POST.get('title'),
-                card_type='link',
-                template_id=request.POST.get('template'),
-                is_published=is_published,
-                is_draft=not is_published
-            )
-            
-            # Handle card image upload
-            if 'card_image' in request.FILES:
-                card.card_image = request.FILES['card_image']
-                card.save()
-            
-            # Create links
             links_data = self.extract_links_data(request.POST, request.FILES)
-            for link_data in links_data:
-                if link_data.get('title') and link_data.get('url'):
-                    LinkContent.objects.create(
+            social_data = self.extract_social_data(request.POST)
+            
+            # One INSERT for the card (image and social links included) and
+            # one for all of its links
+            with transaction.atomic():
+                card = Card.objects.create(
+                    user=request.user,
+                    title=request.POST.get('title'),
+                    card_type='link',
+                    template_id=request.POST.get('template'),
+                    is_published=False,
+                    is_draft=True,
+                    card_image=request.FILES.get('card_image'),
+                    social_links=social_data,
+                )
+                
+                LinkContent.objects.bulk_create([
+                    LinkContent(
                         card=card,
                         title=link_data['title'],
                         url=link_data['url'],
                         link_text=link_data.get('link_text', ''),
                         description=link_data.get('description', ''),
-                        sort_order=len(card.link_contents.all())
+                        image=link_data.get('image'),
+                        sort_order=position * ORDER_STEP,
                     )
-            
-            # Create social media links (stored in card's social_links JSON field)
-            social_data = self.extract_social_data(request.POST)
-            if social_data:
-                card.social_links = social_data
-                card.save()
+                    for position, link_data in enumerate(links_data, start=1)
+                ])
+                
+                if is_published:
+                    publish_card(card)
             
             action_text = "published" if is_published else "saved as draft"
             messages.success(request, f'Link collection "{card.title}" {action_text} successfully!')
             return redirect('app:manage', card_id=card.id)
-            
+        
         except Exception as e:
             messages.error(request, f'Error creating card: {str(e)}')
             return redirect('app:create')
@@ -249,11 +318,14 @@ class CardManageView(TemplateView):
         card_id = self.kwargs['card_id']
         card = get_object_or_404(Card, id=card_id, user=self.request.user)
         
+        entitlements = self.request.user.get_entitlements()
         context['card'] = card
         context['links'] = card.link_contents.all().order_by('sort_order')
         context['link_count'] = card.link_contents.count()
-        context['link_limit'] = 100  # Free user limit
-        context['is_pro'] = self.request.user.is_staff  # Simple pro check for now
+        context['link_limit'] = entitlements.link_limit
+        context['is_pro'] = entitlements.is_pro
+        context['can_save_drafts'] = entitlements.can_save_drafts
+        context['has_unpublished_changes'] = card.published_version_id is not None and card.is_draft
         
         return context
     
@@ -269,10 +341,11 @@ class CardManageView(TemplateView):
                 social_links = data.get('social_links', {})
                 card.social_links = social_links
                 card.save()
+                record_edit(card.id, request.user)
                 return JsonResponse({'status': 'success'})
             else:
                 return JsonResponse({'status': 'error', 'message': 'Invalid action'})
-                
+        
         except Exception as e:
             return JsonResponse({'status': 'error', 'message': str(e)})
 
@@ -294,18 +367,20 @@ class LinkCreateView(CreateView):
         card = self.get_card()
         
         # Check link limit
-        if card.link_contents.count() >= 100:  # Free user limit
-            messages.error(self.request, 'You have reached the maximum number of links (100)')
+        link_limit = self.request.user.get_entitlements().link_limit
+        if card.link_contents.count() >= link_limit:
+            messages.error(self.request, f'You have reached the maximum number of links ({link_limit})')
             return redirect('app:manage', card_id=card.id)
         
         form.instance.card = card
-        form.instance.sort_order = card.link_contents.count()
+        form.instance.sort_order = next_position(card.link_contents.all(), 'sort_order')
         response = super().form_valid(form)
+        record_edit(card.id, self.request.user)
         messages.success(self.request, f'Link "{form.instance.title}" added successfully!')
         return response
     
     def get_success_url(self):
-        return reverse_lazy('cards:manage', kwargs={'card_id': self.kwargs['card_id']})
+        return reverse_lazy('app:manage', kwargs={'card_id': self.kwargs['card_id']})
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -327,8 +402,13 @@ class LinkUpdateView(UpdateView):
     def get_queryset(self):
         return LinkContent.objects.filter(card__user=self.request.user)
     
+    def form_valid(self, form):
+        response = super().form_valid(form)
+        record_edit(self.object.card_id, self.request.user)
+        return response
+    
     def get_success_url(self):
-        return reverse_lazy('cards:manage', kwargs={'card_id': self.object.card.id})
+        return reverse_lazy('app:manage', kwargs={'card_id': self.object.card.id})
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -349,7 +429,12 @@ class LinkDeleteView(DeleteView):
         return LinkContent.objects.filter(card__user=self.request.user)
     
     def get_success_url(self):
-        return reverse_lazy('cards:manage', kwargs={'card_id': self.object.card.id})
+        return reverse_lazy('app:manage', kwargs={'card_id': self.object.card.id})
+    
+    def form_valid(self, form):
+        response = super().form_valid(form)
+        record_edit(self.object.card_id, self.request.user)
+        return response
     
     def delete(self, request, *args, **kwargs):
         response = super().delete(request, *args, **kwargs)
@@ -357,32 +442,109 @@ class LinkDeleteView(DeleteView):
         return response
 
 
-@method_decorator(csrf_exempt, name='dispatch')
-@method_decorator(login_required, name='dispatch')
-class LinkReorderView(TemplateView):
-    """Handle drag-and-drop reordering of links"""
+class ReorderMixin:
+    """
+    Drag-and-drop reordering of the signed-in user's rows of `model`.
+    Accepts either a full order ({<orders_key>: [{id, order}, ...]}) or a single
+    move ({move: {id, after|before}}), which usually writes just one row.
+    Rows are limited to those whose `owner_field` is the user and whose
+    `url_filters` fields match the URL kwargs ({field: kwarg}).
+    """
+    model = None
+    owner_field = 'user'
+    url_filters = {}
+    orders_key = None
+    order_field = 'sort_order'
+    step = ORDER_STEP
     
-    def post(self, request, card_id):
+    def get_queryset(self):
+        filters = {field: self.kwargs[kwarg] for field, kwarg in self.url_filters.items()}
+        return self.model.objects.filter(**{self.owner_field: self.request.user}, **filters)
+    
+    def reordered(self):
+        """Called after a successful reorder"""
+    
+    def post(self, request, *args, **kwargs):
         try:
-            card = get_object_or_404(Card, id=card_id, user=request.user)
+            queryset = self.get_queryset()
             data = json.loads(request.body)
-            link_orders = data.get('link_orders', [])
+            move = data.get('move')
+            
+            if move:
+                updated = move_item(
+                    queryset, self.order_field, move.get('id'),
+                    after_id=move.get('after'), before_id=move.get('before'), step=self.step,
+                )
+            else:
+                orders = sorted(
+                    (item for item in data.get(self.orders_key, []) if item.get('id') and item.get('order') is not None),
+                    key=lambda item: item['order'],
+                )
+                updated = apply_order(queryset, self.order_field, [item['id'] for item in orders], step=self.step)
             
-            # Update sort orders
-            for item in link_orders:
-                link_id = item.get('id')
-                sort_order = item.get('order')
-                if link_id and sort_order is not None:
-                    LinkContent.objects.filter(
-                        id=link_id, 
-                        card=card
-                    ).update(sort_order=sort_order)
+            self.reordered()
             
-            return JsonResponse({'status': 'success'})
+            return JsonResponse({'status': 'success', 'updated': updated})
+        except ReorderError as e:
+            return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
         except Exception as e:
             return JsonResponse({'status': 'error', 'message': str(e)})
 
 
+@method_decorator(csrf_exempt, name='dispatch')
+@method_decorator(login_required, name='dispatch')
+class LinkReorderView(ReorderMixin, View):
+    """Handle drag-and-drop reordering of links"""
+    model = LinkContent
+    owner_field = 'card__user'
+    url_filters = {'card_id': 'card_id'}
+    orders_key = 'link_orders'
+    
+    def reordered(self):
+        record_edit(self.kwargs['card_id'], self.request.user)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+@method_decorator(login_required, name='dispatch')
+class CardReorderView(ReorderMixin, View):
+    """Handle drag-and-drop reordering of the user's cards"""
+    model = Card
+    orders_key = 'card_orders'
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+@method_decorator(login_required, name='dispatch')
+class PickReorderView(ReorderMixin, View):
+    """Handle reordering of recommendation picks"""
+    model = RecommendationPick
+    owner_field = 'recommendation__card__user'
+    url_filters = {'recommendation_id': 'recommendation_id', 'recommendation__card_id': 'card_id'}
+    orders_key = 'pick_orders'
+    order_field = 'order_number'
+    # Pick numbers are shown to visitors, so keep them dense (1, 2, 3, ...)
+    step = 1
+    
+    def reordered(self):
+        record_edit(self.kwargs['card_id'], self.request.user)
+
+
+@method_decorator(login_required, name='dispatch')
+class CardCloneView(TemplateView):
+    """Duplicate a card with all of its content"""
+    
+    def post(self, request, card_id):
+        card = get_object_or_404(Card, id=card_id, user=request.user)
+        
+        card_limit = request.user.get_entitlements().card_limit
+        if request.user.cards.count() >= card_limit:
+            messages.error(request, f'You have reached the maximum number of cards ({card_limit})')
+            return redirect('app:manage', card_id=card.id)
+        
+        clone = clone_card(card)
+        messages.success(request, f'Card "{card.title}" duplicated as "{clone.title}"!')
+        return redirect('app:manage', card_id=clone.id)
+
+
 @method_decorator(login_required, name='dispatch')
 class CardPublishView(TemplateView):
     """Publish or save as draft"""
@@ -392,17 +554,13 @@ class CardPublishView(TemplateView):
         action = request.POST.get('action')
         
         if action == 'publish':
-            card.is_published = True
-            card.is_draft = False
-            card.save()
+            publish_card(card)
             messages.success(request, f'Card "{card.title}" published successfully!')
         elif action == 'draft':
-            if request.user.is_staff:  # Pro users can save as draft
-                card.is_published = False
-                card.is_draft = True
-                card.save()
+            if request.user.get_entitlements().can_save_drafts:  # Pro users can save as draft
+                unpublish_card(card)
                 messages.success(request, f'Card "{card.title}" saved as draft!')
             else:
                 messages.error(request, 'Draft feature is only available for Pro users')
         
-        return redirect('cards:manage', card_id=card.id)
\ No newline at end of file
+        return redirect('app:manage', card_id=card.id)
\ No newline at end of file
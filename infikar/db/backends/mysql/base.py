@@ -0,0 +1,67 @@
+"""
+MySQL backend with an optional per-process connection pool.
+
+Enable it with OPTIONS['pool'] (True or a dict of ConnectionPool options) and
+CONN_MAX_AGE = 0. Closing the connection at the end of a request then returns
+the raw connection to the pool. A reused connection skips the session setup
+statements, because they already ran when it was opened. Without a pool this
+is the stock MySQL backend.
+"""
+import functools
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.mysql import base as mysql_base
+
+from infikar.db.pool import PoolTimeout, get_pool
+
+Database = mysql_base.Database
+
+
+def _ping(connection):
+    connection.ping()
+
+
+class DatabaseWrapper(mysql_base.DatabaseWrapper):
+    _reused_connection = False
+    
+    @property
+    def pool(self):
+        # Looked up on every use: a wrapper inherited through fork must not keep the parent's pool
+        options = self.settings_dict['OPTIONS'].get('pool')
+        if not options:
+            return None
+        if self.settings_dict['CONN_MAX_AGE'] != 0:
+            raise ImproperlyConfigured("Pooling doesn't support persistent connections.")
+        options = {} if options is True else dict(options)
+        options.setdefault('check', _ping)
+        return get_pool(self.alias, **options)
+    
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop('pool', None)
+        return params
+    
+    def get_new_connection(self, conn_params):
+        if self.pool is None:
+            return super().get_new_connection(conn_params)
+        
+        try:
+            connection, self._reused_connection = self.pool.acquire(
+                functools.partial(super().get_new_connection, conn_params)
+            )
+        except PoolTimeout as e:
+            raise Database.OperationalError(str(e)) from e
+        return connection
+    
+    def init_connection_state(self):
+        if self._reused_connection:
+            return
+        super().init_connection_state()
+    
+    def _close(self):
+        if self.pool is None or self.connection is None:
+            return super()._close()
+        
+        # Connections that saw errors or were left mid-transaction are not reused
+        reusable = not self.errors_occurred and not self.in_atomic_block and self.autocommit
+        self.pool.release(self.connection, reusable)
@@ -0,0 +1,225 @@
+"""
+Per-process database connection pools.
+
+Sync workers keep one persistent connection each (CONN_MAX_AGE with health
+checks). Threaded and async workers instead share a bounded pool per database
+alias: Django's connection wrapper returns its raw connection to the pool when
+it would close it and takes one back on the next query. The pool never holds
+more than max_size connections, so the number of workers times max_size is the
+whole MySQL budget, deploys included.
+"""
+import os
+import threading
+import time
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection becomes free within the timeout"""
+
+
+class PooledConnection:
+    __slots__ = ('connection', 'created_at', 'released_at')
+    
+    def __init__(self, connection):
+        self.connection = connection
+        self.created_at = time.monotonic()
+        self.released_at = self.created_at
+
+
+class ConnectionPool:
+    """
+    Bounded LIFO pool of raw DB-API connections.
+    Idle connections are health-checked before reuse once they have been idle
+    for check_interval seconds, and retired after max_lifetime seconds or when
+    left idle for max_idle seconds.
+    """
+    
+    def __init__(self, max_size=10, timeout=10, max_lifetime=1800, max_idle=300, check_interval=30, check=None):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.max_idle = max_idle
+        self.check_interval = check_interval
+        self.check = check
+        self.pid = os.getpid()
+        
+        self._idle = []
+        self._in_use = {}
+        self._opening = 0
+        self._cond = threading.Condition()
+        
+        self.connections_opened = 0
+        self.connections_closed = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.timeouts = 0
+        self.health_check_failures = 0
+    
+    @property
+    def size(self):
+        return len(self._idle) + len(self._in_use) + self._opening
+    
+    def acquire(self, connect):
+        """
+        Take a connection, opening one with `connect()` while below max_size.
+        Returns (connection, reused); raises PoolTimeout when the pool stays
+        exhausted for `timeout` seconds.
+        """
+        started = time.monotonic()
+        deadline = started + self.timeout
+        waited = False
+        entry = None
+        stale = []
+        
+        with self._cond:
+            while True:
+                stale += self._drain_idle(time.monotonic())
+                if self._idle:
+                    entry = self._idle.pop()
+                    self._in_use[id(entry.connection)] = entry
+                    break
+                if self.size < self.max_size:
+                    self._opening += 1
+                    break
+                
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolTimeout(f'No database connection available within {self.timeout}s ({self.max_size} in use)')
+                waited = True
+                self._cond.wait(remaining)
+            
+            self.checkouts += 1
+            if waited:
+                wait = time.monotonic() - started
+                self.waits += 1
+                self.wait_time += wait
+                self.max_wait_time = max(self.max_wait_time, wait)
+        
+        for old in stale:
+            self._close(old.connection)
+        
+        if entry is not None:
+            if self._healthy(entry):
+                return entry.connection, True
+            with self._cond:
+                del self._in_use[id(entry.connection)]
+                self._opening += 1
+        
+        try:
+            connection = connect()
+        except BaseException:
+            with self._cond:
+                self._opening -= 1
+                self._cond.notify()
+            raise
+        
+        entry = PooledConnection(connection)
+        with self._cond:
+            self._opening -= 1
+            self.connections_opened += 1
+            self._in_use[id(connection)] = entry
+        return connection, False
+    
+    def release(self, connection, reusable=True):
+        """Return a connection; it is closed instead when not reusable or too old"""
+        with self._cond:
+            entry = self._in_use.pop(id(connection), None)
+            now = time.monotonic()
+            keep = (
+                entry is not None
+                and reusable
+                and os.getpid() == self.pid
+                and now - entry.created_at < self.max_lifetime
+            )
+            if keep:
+                entry.released_at = now
+                self._idle.append(entry)
+            stale = self._drain_idle(now)
+            self._cond.notify()
+        
+        if not keep:
+            self._close(connection)
+        for entry in stale:
+            self._close(entry.connection)
+    
+    def close_all(self):
+        """Close every idle connection (connections in use close on release)"""
+        with self._cond:
+            idle, self._idle = self._idle, []
+        for entry in idle:
+            self._close(entry.connection)
+    
+    def stats(self):
+        with self._cond:
+            return {
+                'max_size': self.max_size,
+                'size': self.size,
+                'in_use': len(self._in_use),
+                'idle': len(self._idle),
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'wait_time_total': round(self.wait_time, 6),
+                'wait_time_max': round(self.max_wait_time, 6),
+                'timeouts': self.timeouts,
+                'connections_opened': self.connections_opened,
+                'connections_closed': self.connections_closed,
+                'health_check_failures': self.health_check_failures,
+            }
+    
+    def _drain_idle(self, now):
+        """Remove idle connections past max_idle or max_lifetime (oldest first)"""
+        stale = [
+            entry for entry in self._idle
+            if now - entry.released_at >= self.max_idle or now - entry.created_at >= self.max_lifetime
+        ]
+        if stale:
+            self._idle = [entry for entry in self._idle if entry not in stale]
+        return stale
+    
+    def _healthy(self, entry):
+        if self.check is None or time.monotonic() - entry.released_at < self.check_interval:
+            return True
+        try:
+            self.check(entry.connection)
+        except Exception:
+            with self._cond:
+                self.health_check_failures += 1
+            self._close(entry.connection)
+            return False
+        return True
+    
+    def _close(self, connection):
+        with self._cond:
+            self.connections_closed += 1
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, **options):
+    """
+    This process's pool for a database alias.
+    Pools inherited through fork (gunicorn preload_app) are discarded without
+    closing their connections, which belong to the parent.
+    """
+    pid = os.getpid()
+    with _pools_lock:
+        pool = _pools.get(alias)
+        if pool is None or pool.pid != pid:
+            pool = _pools[alias] = ConnectionPool(**options)
+        return pool
+
+
+def pool_stats():
+    """Pool metrics for every alias with a pool in this process"""
+    with _pools_lock:
+        pools = dict(_pools)
+    return {alias: pool.stats() for alias, pool in pools.items() if pool.pid == os.getpid()}
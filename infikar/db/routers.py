@@ -0,0 +1,222 @@
+"""
+Read replica routing.
+
+Reads go to a replica (DATABASE_REPLICAS) only in two cases: inside views
+wrapped with `use_replica` (the public pages), or for analytics models
+anywhere. Everything else stays on the primary. A request that writes pins the
+rest of its reads to the primary. ReplicaPinMiddleware then keeps that
+browser's reads on the primary for REPLICA_PIN_SECONDS, so people see their own
+edits. Replicas whose replication lag exceeds REPLICA_MAX_LAG are skipped until
+a later check finds them caught up. With no healthy replica, reads fall back to
+the primary.
+"""
+import contextvars
+import functools
+import random
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+PIN_COOKIE = 'db_pin'
+
+# App labels whose reads always go to a replica
+REPLICA_APPS = frozenset({'analytics'})
+
+
+class RoutingState:
+    """Per-request routing flags"""
+    
+    __slots__ = ('pinned', 'wrote')
+    
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+_state = contextvars.ContextVar('db_routing_state', default=None)
+_replica_reads = contextvars.ContextVar('db_replica_reads', default=False)
+
+
+def use_replica(view_func):
+    """Let a read-only view's queries go to a replica"""
+    if iscoroutinefunction(view_func):
+        @functools.wraps(view_func)
+        async def async_wrapped(*args, **kwargs):
+            token = _replica_reads.set(True)
+            try:
+                return await view_func(*args, **kwargs)
+            finally:
+                _replica_reads.reset(token)
+        return async_wrapped
+    
+    @functools.wraps(view_func)
+    def wrapped(*args, **kwargs):
+        token = _replica_reads.set(True)
+        try:
+            response = view_func(*args, **kwargs)
+            # Template responses run their queries while rendering
+            if hasattr(response, 'render') and not response.is_rendered:
+                response.render()
+            return response
+        finally:
+            _replica_reads.reset(token)
+    return wrapped
+
+
+# Replication lag
+
+_healthy = ()
+_checked_at = None
+_refresh_thread = None
+_lock = threading.Lock()
+
+
+def replica_lag(alias):
+    """
+    Seconds a replica is behind the primary, 0 for non-MySQL databases, or
+    None when replication is stopped or the replica cannot be reached.
+    """
+    connection = connections[alias]
+    if connection.vendor != 'mysql':
+        return 0
+    
+    try:
+        with connection.cursor() as cursor:
+            try:
+                cursor.execute('SHOW REPLICA STATUS')
+            except DatabaseError:
+                # MySQL before 8.0.22 and older MariaDB
+                cursor.execute('SHOW SLAVE STATUS')
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            status = dict(zip([column[0] for column in cursor.description], row))
+    except DatabaseError:
+        return None
+    lag = status.get('Seconds_Behind_Source', status.get('Seconds_Behind_Master'))
+    return None if lag is None else int(lag)
+
+
+def refresh_replica_health():
+    """Check every replica's lag and publish the ones within REPLICA_MAX_LAG"""
+    global _healthy, _checked_at
+    
+    healthy = []
+    try:
+        for alias in settings.DATABASE_REPLICAS:
+            lag = replica_lag(alias)
+            if lag is not None and lag <= settings.REPLICA_MAX_LAG:
+                healthy.append(alias)
+    finally:
+        # The connections belong to this thread and would otherwise leak
+        for alias in settings.DATABASE_REPLICAS:
+            connections[alias].close()
+    _healthy = tuple(healthy)
+    _checked_at = time.monotonic()
+    return _healthy
+
+
+def healthy_replicas():
+    """
+    Replicas found within REPLICA_MAX_LAG by the last check. Once that is more
+    than REPLICA_LAG_CHECK_INTERVAL seconds old, a background thread checks
+    again while requests keep using the last result, so no request waits on a
+    replica that is slow to answer. Until the first check completes, reads go
+    to the primary.
+    """
+    global _refresh_thread
+    
+    if not settings.DATABASE_REPLICAS:
+        return ()
+    if _checked_at is not None and time.monotonic() - _checked_at < settings.REPLICA_LAG_CHECK_INTERVAL:
+        return _healthy
+    
+    with _lock:
+        # A thread started before a fork is not alive in the child
+        if _refresh_thread is None or not _refresh_thread.is_alive():
+            _refresh_thread = threading.Thread(target=refresh_replica_health, name='replica-lag-check', daemon=True)
+            _refresh_thread.start()
+    return _healthy
+
+
+class ReplicaRouter:
+    """Send eligible reads to a healthy replica; writes and migrations to the primary"""
+    
+    def db_for_read(self, model, **hints):
+        if not (_replica_reads.get() or model._meta.app_label in REPLICA_APPS):
+            return None
+        
+        state = _state.get()
+        if state is not None and state.pinned:
+            return DEFAULT_DB_ALIAS
+        # Reads inside a transaction must see its own writes
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        
+        replicas = healthy_replicas()
+        return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+    
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None and model._meta.app_label not in REPLICA_APPS:
+            # Analytics events are not edits anyone needs to read back
+            state.pinned = state.wrote = True
+        return DEFAULT_DB_ALIAS
+    
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+    
+    def allow_migrate(self, db, app_label, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+class ReplicaPinMiddleware:
+    """
+    Give each request fresh routing state. Reads are pinned to the primary while
+    the browser's pin cookie is alive, and a request that writes sets the cookie.
+    """
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        
+        state = RoutingState(pinned=PIN_COOKIE in request.COOKIES)
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self._pin(state, response)
+    
+    async def __acall__(self, request):
+        state = RoutingState(pinned=PIN_COOKIE in request.COOKIES)
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self._pin(state, response)
+    
+    def _pin(self, state, response):
+        if state.wrote:
+            response.set_cookie(
+                PIN_COOKIE, '1',
+                max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite='Lax',
+                secure=settings.SESSION_COOKIE_SECURE,
+            )
+        return response
@@ -1,46 +1,212 @@
 """
-Health check endpoint for Docker containers
+Health check endpoints for load balancers and orchestrators.
+
+- /health/live/ answers from inside the process and touches nothing external.
+  A failure means the worker is stuck and should be restarted.
+- /health/ready/ reports whether the worker should receive traffic: the
+  database is reachable and the worker's connection pool is not saturated.
+- /health/ returns the readiness answer with every check in detail.
+
+Probes from any number of sources cost no queries. One background thread per
+process checks the database, Redis and the analytics queue every
+HEALTH_PROBE_INTERVAL seconds, and the endpoints serve its latest results. If
+those results are older than HEALTH_PROBE_TTL (the thread died), the next
+probe runs the checks itself.
+
+Every endpoint has a sync view and an async one (prefixed `a`), picked in the
+urlconf by SERVER_MODE.
 """
-from django.http import JsonResponse
-from django.db import connection
+import logging
+import os
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.core.cache import cache
-import redis
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.http import JsonResponse
 
+from infikar.cache import REDIS
+from infikar.db.pool import pool_stats
+from infikar.redis_client import get_redis
 
-def health_check(request):
-    """
-    Health check endpoint that verifies:
-    - Database connectivity
-    - Redis connectivity
-    - Basic application health
-    """
-    health_status = {
-        'status': 'healthy',
-        'checks': {}
-    }
+logger = logging.getLogger(__name__)
+
+HEALTHY = 'healthy'
+DEGRADED = 'degraded'
+UNHEALTHY = 'unhealthy'
+SATURATED = 'saturated'
+
+
+def _check_database():
+    with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+        cursor.execute("SELECT 1")
+    return HEALTHY
+
+
+def _check_redis():
+    if getattr(cache, 'mode', REDIS) != REDIS:
+        # Still serving, from this worker's memory, until Redis is back
+        return f'{DEGRADED}: serving from local memory'
+    client = get_redis()
+    if client is None:
+        return f'{UNHEALTHY}: not configured'
+    client.ping()
+    return HEALTHY
+
+
+def _check_analytics_queue():
+    from infikar.analytics.beacon import queue_depth
     
-    # Check database
+    depth = queue_depth()
+    if depth is None:
+        return {'status': f'{DEGRADED}: unavailable without Redis'}
+    status = SATURATED if depth >= settings.HEALTH_QUEUE_SATURATION else HEALTHY
+    return {'status': status, 'depth': depth}
+
+
+def _run(check):
     try:
-        with connection.cursor() as cursor:
-            cursor.execute("SELECT 1")
-        health_status['checks']['database'] = 'healthy'
+        return check()
     except Exception as e:
-        health_status['checks']['database'] = f'unhealthy: {str(e)}'
-        health_status['status'] = 'unhealthy'
+        return f'{UNHEALTHY}: {e}'
+
+
+class Probe:
+    """Latest dependency check results of this process, refreshed by a background thread"""
     
-    # Check Redis
-    try:
-        cache.set('health_check', 'ok', 10)
-        if cache.get('health_check') == 'ok':
-            health_status['checks']['redis'] = 'healthy'
-        else:
-            health_status['checks']['redis'] = 'unhealthy'
-            health_status['status'] = 'unhealthy'
-    except Exception as e:
-        health_status['checks']['redis'] = f'unhealthy: {str(e)}'
-        health_status['status'] = 'unhealthy'
+    def __init__(self):
+        self.results = None
+        self.checked_at = None
+        self._lock = threading.Lock()
+        self._thread_pid = None
+    
+    def refresh(self):
+        results = {
+            'database': _run(_check_database),
+            'redis': _run(_check_redis),
+            'analytics_queue': _run(_check_analytics_queue),
+        }
+        self.results, self.checked_at = results, time.monotonic()
+        return results
+    
+    def stale(self):
+        return self.checked_at is None or time.monotonic() - self.checked_at > settings.HEALTH_PROBE_TTL
+    
+    def refresh_if_stale(self):
+        with self._lock:
+            if self.stale():
+                self.refresh()
+    
+    def latest(self):
+        """Cached results and their age, running the checks here when they are missing or stale"""
+        self._start_thread()
+        if self.stale():
+            self.refresh_if_stale()
+        return self.results, time.monotonic() - self.checked_at
     
-    # Return appropriate status code
-    status_code = 200 if health_status['status'] == 'healthy' else 503
+    async def alatest(self):
+        """latest() for async views"""
+        self._start_thread()
+        if self.stale():
+            await sync_to_async(self.refresh_if_stale)()
+        return self.results, time.monotonic() - self.checked_at
     
-    return JsonResponse(health_status, status=status_code)
+    def _start_thread(self):
+        # Threads do not survive fork, so every worker starts its own
+        if self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread_pid == os.getpid():
+                return
+            self._thread_pid = os.getpid()
+            threading.Thread(target=self._refresh_forever, name='health-probe', daemon=True).start()
+    
+    def _refresh_forever(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception('Health probe failed')
+            finally:
+                # Returns a pooled connection; otherwise the next round reconnects
+                connections.close_all()
+            time.sleep(settings.HEALTH_PROBE_INTERVAL)
+
+
+probe = Probe()
+
+
+def pool_saturation():
+    """Connection pools of this worker, with the ones that have no room left marked saturated"""
+    pools = {}
+    for alias, stats in pool_stats().items():
+        saturated = stats['in_use'] >= stats['max_size'] * settings.HEALTH_POOL_SATURATION
+        pools[alias] = {'status': SATURATED if saturated else HEALTHY, **stats}
+    return pools
+
+
+def _readiness_report(checks, age):
+    """(ready, report) from the dependency checks and the live pool state"""
+    pools = pool_saturation()
+    ready = checks['database'] == HEALTHY and all(pool['status'] == HEALTHY for pool in pools.values())
+    report = {
+        'status': HEALTHY if ready else UNHEALTHY,
+        'checks': checks,
+        'checked_seconds_ago': round(age, 3),
+    }
+    if pools:
+        report['database_pools'] = pools
+    if hasattr(cache, 'stats'):
+        report['cache'] = cache.stats()
+    return ready, report
+
+
+def readiness():
+    """(ready, report) from the cached dependency checks and the live pool state"""
+    return _readiness_report(*probe.latest())
+
+
+async def areadiness():
+    """readiness() for async views"""
+    return _readiness_report(*await probe.alatest())
+
+
+def liveness(request):
+    """The worker is running and its thread answers"""
+    return JsonResponse({'status': 'alive', 'pid': os.getpid()})
+
+
+async def aliveness(request):
+    """liveness for ASGI workers: the event loop answers"""
+    return JsonResponse({'status': 'alive', 'pid': os.getpid()})
+
+
+def readiness_check(request):
+    """200 while this worker should get traffic, otherwise 503"""
+    ready, report = readiness()
+    return JsonResponse({'status': report['status']}, status=200 if ready else 503)
+
+
+async def areadiness_check(request):
+    """readiness_check for ASGI workers"""
+    ready, report = await areadiness()
+    return JsonResponse({'status': report['status']}, status=200 if ready else 503)
+
+
+def health_check(request):
+    """
+    Readiness with details:
+    - Database connectivity and connection pool saturation
+    - Redis connectivity
+    - Analytics beacon queue depth
+    """
+    ready, report = readiness()
+    return JsonResponse(report, status=200 if ready else 503)
+
+
+async def ahealth_check(request):
+    """health_check for ASGI workers"""
+    ready, report = await areadiness()
+    return JsonResponse(report, status=200 if ready else 503)
@@ -0,0 +1,291 @@
+"""
+Prometheus metrics.
+
+MetricsMiddleware records, per URL name:
+
+- request latency
+- request counts by status
+- requests in flight
+- database queries and query time per request
+
+The cache records hits and misses, and which workers are serving from local
+memory. The analytics beacon queue depth and the database connection pool
+stats are read when /metrics is scraped.
+
+Under gunicorn, PROMETHEUS_MULTIPROC_DIR (set in docker/gunicorn_conf.py)
+makes every worker write its samples to memory-mapped files in that
+directory. A scrape of any one worker then aggregates all of them.
+"""
+import contextvars
+import os
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+    generate_latest, multiprocess,
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+REQUEST_LATENCY = Histogram(
+    'infikar_http_request_duration_seconds', 'Request latency by URL name',
+    ['view', 'method'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+REQUESTS = Counter('infikar_http_requests_total', 'Requests by URL name and status', ['view', 'method', 'status'])
+REQUESTS_IN_PROGRESS = Gauge(
+    'infikar_http_requests_in_progress', 'Requests being handled across all workers',
+    multiprocess_mode='livesum',
+)
+
+DB_QUERIES = Histogram(
+    'infikar_db_queries_per_request', 'Database queries per request by URL name',
+    ['view'],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 250),
+)
+DB_QUERY_SECONDS = Counter('infikar_db_query_seconds_total', 'Time spent in database queries by URL name', ['view'])
+
+CACHE_REQUESTS = Counter('infikar_cache_requests_total', 'Cache lookups by result', ['result'])
+CACHE_LOCAL_MODE = Gauge(
+    'infikar_cache_local_mode_workers', 'Workers serving the cache from local memory (Redis failed over)',
+    multiprocess_mode='livesum',
+)
+
+UNRESOLVED = '<unresolved>'
+
+
+class RequestStats:
+    """Database work done while handling one request"""
+    
+    __slots__ = ('queries', 'query_time')
+    
+    def __init__(self):
+        self.queries = 0
+        self.query_time = 0.0
+
+
+_request_stats = contextvars.ContextVar('metrics_request_stats', default=None)
+
+
+def current_request_stats():
+    """Stats of the request being handled, or None outside a request"""
+    return _request_stats.get()
+
+
+def _record_query(execute, sql, params, many, context):
+    stats = _request_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.query_time += time.perf_counter() - started
+
+
+def _install_query_recorder(sender, connection, **kwargs):
+    # The wrapper list belongs to the connection object and survives reconnects
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+connection_created.connect(_install_query_recorder)
+
+
+def record_cache_lookups(hits, misses):
+    if hits:
+        CACHE_REQUESTS.labels(result='hit').inc(hits)
+    if misses:
+        CACHE_REQUESTS.labels(result='miss').inc(misses)
+
+
+class MetricsMiddleware:
+    """Time every request and count its queries, labelled with the URL name"""
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        
+        stats, token, started = self._start()
+        try:
+            response = self.get_response(request)
+        finally:
+            self._finish(request, stats, token, started)
+        self._count(request, response)
+        return response
+    
+    async def __acall__(self, request):
+        stats, token, started = self._start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            self._finish(request, stats, token, started)
+        self._count(request, response)
+        return response
+    
+    def _start(self):
+        REQUESTS_IN_PROGRESS.inc()
+        stats = RequestStats()
+        return stats, _request_stats.set(stats), time.perf_counter()
+    
+    def _finish(self, request, stats, token, started):
+        elapsed = time.perf_counter() - started
+        _request_stats.reset(token)
+        REQUESTS_IN_PROGRESS.dec()
+        
+        view = self._view_name(request)
+        REQUEST_LATENCY.labels(view=view, method=request.method).observe(elapsed)
+        DB_QUERIES.labels(view=view).observe(stats.queries)
+        if stats.query_time:
+            DB_QUERY_SECONDS.labels(view=view).inc(stats.query_time)
+    
+    def _count(self, request, response):
+        REQUESTS.labels(view=self._view_name(request), method=request.method, status=response.status_code).inc()
+    
+    @staticmethod
+    def _view_name(request):
+        match = getattr(request, 'resolver_match', None)
+        return match.view_name if match is not None else UNRESOLVED
+
+
+class AnalyticsQueueCollector:
+    """Depth of the analytics beacon queue, read from Redis at scrape time"""
+    
+    def describe(self):
+        # Lets the registry learn the metric name without a Redis round trip
+        return [self._family()]
+    
+    def collect(self):
+        from infikar.analytics.beacon import queue_depth
+        
+        depth = queue_depth()
+        if depth is not None:
+            family = self._family()
+            family.add_metric([], depth)
+            yield family
+    
+    @staticmethod
+    def _family():
+        return GaugeMetricFamily('infikar_analytics_queue_depth', 'Beacon events waiting for ingest_analytics')
+
+
+# pool_stats() key -> (metric name, help)
+POOL_GAUGES = {
+    'in_use': ('infikar_db_pool_connections_in_use', 'Pooled connections checked out'),
+    'idle': ('infikar_db_pool_connections_idle', 'Pooled connections waiting to be checked out'),
+    'max_size': ('infikar_db_pool_connections_max', 'Configured pool size'),
+    'wait_time_max': ('infikar_db_pool_wait_seconds_max', 'Longest wait for a free connection'),
+}
+POOL_COUNTERS = {
+    'checkouts': ('infikar_db_pool_checkouts', 'Connections handed out by the pool'),
+    'waits': ('infikar_db_pool_waits', 'Checkouts that had to wait for a free connection'),
+    'wait_time_total': ('infikar_db_pool_wait_seconds', 'Time spent waiting for a free connection'),
+    'timeouts': ('infikar_db_pool_timeouts', 'Checkouts that gave up waiting'),
+    'connections_opened': ('infikar_db_pool_connections_opened', 'Database connections opened by the pool'),
+    'connections_closed': ('infikar_db_pool_connections_closed', 'Database connections closed by the pool'),
+}
+
+
+# The same series for multiprocess mode, where each worker's pool lives in its
+# own process: workers write their stats to the shared files and the scrape
+# sums them over live workers. registry=None keeps them out of REGISTRY.
+POOL_WORKER_GAUGES = {
+    key: Gauge(
+        name if key in POOL_GAUGES else f'{name}_total', doc, ['alias'], registry=None,
+        multiprocess_mode='livemax' if key == 'wait_time_max' else 'livesum',
+    )
+    for key, (name, doc) in {**POOL_GAUGES, **POOL_COUNTERS}.items()
+}
+
+
+def publish_pool_stats(**kwargs):
+    """Write this worker's pool stats to the multiprocess files"""
+    from infikar.db.pool import pool_stats
+    
+    for alias, stats in pool_stats().items():
+        for key, gauge in POOL_WORKER_GAUGES.items():
+            gauge.labels(alias=alias).set(stats[key])
+
+
+class PoolCollector:
+    """
+    Connection pool usage, waits and churn per database alias, read from
+    pool_stats() at scrape time. In multiprocess mode it only refreshes the
+    scraping worker's POOL_WORKER_GAUGES, which MultiProcessCollector reports.
+    """
+    
+    def __init__(self, multiprocess=False):
+        self.multiprocess = multiprocess
+    
+    def describe(self):
+        return [] if self.multiprocess else list(self._families().values())
+    
+    def collect(self):
+        from infikar.db.pool import pool_stats
+        
+        if self.multiprocess:
+            publish_pool_stats()
+            return []
+        
+        families = self._families()
+        for alias, stats in sorted(pool_stats().items()):
+            for key, family in families.items():
+                family.add_metric([alias], stats[key])
+        return list(families.values())
+    
+    @staticmethod
+    def _families():
+        families = {key: GaugeMetricFamily(name, doc, labels=['alias']) for key, (name, doc) in POOL_GAUGES.items()}
+        families.update(
+            (key, CounterMetricFamily(name, doc, labels=['alias'])) for key, (name, doc) in POOL_COUNTERS.items()
+        )
+        return families
+
+
+def _registry():
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        # A fresh registry per scrape, aggregating every worker's files
+        registry = CollectorRegistry()
+        # Registered first, so this worker's pool stats are current when the files are read
+        registry.register(PoolCollector(multiprocess=True))
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(AnalyticsQueueCollector())
+        return registry
+    return REGISTRY
+
+
+if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+    # Connections go back to the pool on request_finished, and this receiver
+    # is connected after Django's, so in-use counts are taken once they have
+    request_finished.connect(publish_pool_stats)
+else:
+    REGISTRY.register(AnalyticsQueueCollector())
+    REGISTRY.register(PoolCollector())
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint; requires METRICS_TOKEN as a bearer token.
+    Without a token it only answers with DEBUG on (the URL is not even routed
+    otherwise).
+    """
+    if settings.METRICS_TOKEN:
+        if not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {settings.METRICS_TOKEN}'):
+            return HttpResponseForbidden()
+    elif not settings.DEBUG:
+        return HttpResponseForbidden()
+    return HttpResponse(generate_latest(_registry()), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,182 @@
+"""
+Per-request query budgets and N+1 detection.
+
+QueryBudgetMiddleware profiles a sample of requests (QUERY_PROFILE_SAMPLE_RATE).
+Each query of a profiled request is fingerprinted, meaning its SQL with
+literals and IN lists collapsed, and attributed to the template line or
+project code that ran it. Two problems are reported when the response is done:
+
+- The request ran more queries than its view's budget (QUERY_BUDGETS by URL
+  name, otherwise QUERY_BUDGET_DEFAULT).
+- One query shape repeated QUERY_REPEAT_THRESHOLD times or more, the usual
+  sign of a lazy relation loaded inside a loop.
+
+In production both are logged. With QUERY_BUDGET_STRICT (used by the tests)
+every request is profiled and a problem raises QueryBudgetExceeded.
+"""
+import contextvars
+import logging
+import os
+import random
+import re
+import sys
+from collections import Counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__)) + os.sep
+THIS_FILE = os.path.abspath(__file__)
+BASE_DIR = os.path.dirname(os.path.dirname(THIS_FILE))
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+\b')
+_IN_LIST = re.compile(r'\bIN \((?:[^()]*)\)', re.IGNORECASE)
+_SPACE = re.compile(r'\s+')
+
+
+class QueryBudgetExceeded(Exception):
+    """Raised in strict mode when a request breaks its query budget or repeats a query"""
+
+
+def fingerprint(sql):
+    """SQL shape with literals and IN lists collapsed, so repeats of one query compare equal"""
+    sql = _STRING.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    sql = _NUMBER.sub('?', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def query_origin():
+    """
+    Where the running query comes from: the innermost template node being
+    rendered, otherwise the innermost frame of project code.
+    """
+    frame = sys._getframe(2)
+    code_origin = None
+    while frame is not None:
+        node = frame.f_locals.get('self') if frame.f_code.co_name == 'render_annotated' else None
+        origin = getattr(node, 'origin', None)
+        if origin is not None:
+            token = getattr(node, 'token', None)
+            return f'{origin.template_name or origin.name}:{token.lineno if token else "?"}'
+        
+        filename = frame.f_code.co_filename
+        if code_origin is None and filename.startswith(PROJECT_DIR) and filename != THIS_FILE:
+            code_origin = f'{os.path.relpath(filename, BASE_DIR)}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return code_origin or 'unknown'
+
+
+class QueryProfile:
+    """Queries run while handling one profiled request"""
+    
+    __slots__ = ('count', 'shapes', 'origins')
+    
+    def __init__(self):
+        self.count = 0
+        self.shapes = Counter()
+        self.origins = {}
+    
+    def record(self, sql):
+        shape = fingerprint(sql)
+        self.count += 1
+        self.shapes[shape] += 1
+        if shape not in self.origins:
+            self.origins[shape] = query_origin()
+    
+    def repeated(self, threshold):
+        """(shape, times, origin) for every query shape run at least `threshold` times"""
+        return [
+            (shape, times, self.origins[shape])
+            for shape, times in self.shapes.most_common()
+            if times >= threshold
+        ]
+
+
+_profile = contextvars.ContextVar('querybudget_profile', default=None)
+
+
+def _record_query(execute, sql, params, many, context):
+    profile = _profile.get()
+    if profile is not None:
+        profile.record(sql)
+    return execute(sql, params, many, context)
+
+
+def _install(connection):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def _install_on_connect(sender, connection, **kwargs):
+    _install(connection)
+
+
+connection_created.connect(_install_on_connect)
+
+
+def check_profile(view, profile):
+    """Problems found in a request's profile, as messages"""
+    budget = settings.QUERY_BUDGETS.get(view, settings.QUERY_BUDGET_DEFAULT)
+    problems = []
+    if budget is not None and profile.count > budget:
+        problems.append(f'{view} ran {profile.count} queries (budget {budget})')
+    for shape, times, origin in profile.repeated(settings.QUERY_REPEAT_THRESHOLD):
+        problems.append(f'Probable N+1 in {view}: {times}x from {origin}: {shape[:300]}')
+    return problems
+
+
+class QueryBudgetMiddleware:
+    """Profile sampled requests and report query budget and N+1 problems"""
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        
+        profile, token = self._start()
+        try:
+            return self.get_response(request)
+        finally:
+            self._finish(request, profile, token)
+    
+    async def __acall__(self, request):
+        profile, token = self._start()
+        try:
+            return await self.get_response(request)
+        finally:
+            self._finish(request, profile, token)
+    
+    def _start(self):
+        if not (settings.QUERY_BUDGET_STRICT or random.random() < settings.QUERY_PROFILE_SAMPLE_RATE):
+            return None, None
+        # Connections opened before this module was imported missed connection_created
+        for connection in connections.all(initialized_only=True):
+            _install(connection)
+        profile = QueryProfile()
+        return profile, _profile.set(profile)
+    
+    def _finish(self, request, profile, token):
+        if profile is None:
+            return
+        _profile.reset(token)
+        
+        match = getattr(request, 'resolver_match', None)
+        problems = check_profile(match.view_name if match else request.path, profile)
+        if not problems:
+            return
+        if settings.QUERY_BUDGET_STRICT:
+            raise QueryBudgetExceeded('; '.join(problems))
+        for problem in problems:
+            logger.warning(problem)
@@ -0,0 +1,186 @@
+"""
+Token-bucket rate limiting.
+
+Buckets live in Redis and are updated by a single Lua script, so concurrent
+workers never race on the same bucket. When the cache is not Redis-backed, or
+Redis is unreachable, each process falls back to its own in-memory buckets.
+"""
+import functools
+import math
+import threading
+import time
+
+import redis
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+
+from infikar.redis_client import get_redis, get_script
+
+KEY_PREFIX = 'ratelimit'
+
+# KEYS[1] = bucket key; ARGV = capacity, refill rate (tokens per second)
+# Returns {allowed (0/1), milliseconds until a token is available}
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+
+local allowed = 0
+local retry_ms = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+else
+    retry_ms = math.ceil((1 - tokens) / rate * 1000)
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, retry_ms}
+"""
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """Parse a rate such as '30/m' into (capacity, period in seconds)"""
+    count, _, unit = rate.partition('/')
+    return int(count), PERIODS[unit.strip().lower()[:1]]
+
+
+class LocalTokenBuckets:
+    """In-process token buckets used when Redis is unavailable"""
+    
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+    
+    def consume(self, key, capacity, rate):
+        now = time.monotonic()
+        with self._lock:
+            tokens, ts = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - ts) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._prune(now, capacity / rate)
+        
+        retry_after = 0 if allowed else (1 - tokens) / rate
+        return allowed, retry_after
+    
+    def _prune(self, now, refill_time):
+        # Buckets idle long enough to have refilled carry no state worth keeping
+        for key, (_, ts) in list(self._buckets.items()):
+            if now - ts >= refill_time:
+                del self._buckets[key]
+
+
+_local_buckets = LocalTokenBuckets()
+
+
+def consume(key, rate):
+    """
+    Take one token from the bucket for a key.
+    Returns (allowed, seconds until the next token is available).
+    """
+    capacity, period = parse_rate(rate)
+    refill_rate = capacity / period
+    
+    client = get_redis()
+    if client is not None:
+        try:
+            script = get_script(client, TOKEN_BUCKET_SCRIPT)
+            allowed, retry_ms = script(keys=[f'{KEY_PREFIX}:{key}'], args=[capacity, refill_rate])
+            return bool(allowed), int(retry_ms) / 1000
+        except redis.RedisError:
+            pass
+    
+    return _local_buckets.consume(key, capacity, refill_rate)
+
+
+def client_ip(request):
+    """
+    Client IP address, honouring X-Forwarded-For only when configured to.
+    Each of the RATELIMIT_PROXY_COUNT proxies in front of us appends the
+    address it saw, so the client is that many entries from the right;
+    anything further left was sent by the client and can be forged.
+    """
+    if settings.RATELIMIT_TRUST_X_FORWARDED_FOR:
+        forwarded = [entry.strip() for entry in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',')]
+        proxy_count = settings.RATELIMIT_PROXY_COUNT
+        if proxy_count > 0 and len(forwarded) >= proxy_count and forwarded[-proxy_count]:
+            return forwarded[-proxy_count]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def is_rate_limited(request, scope):
+    """
+    Check a request against the per-IP and per-session buckets for a scope.
+    Returns (limited, retry_after seconds).
+    """
+    if not settings.RATELIMIT_ENABLE:
+        return False, 0
+    
+    rate = settings.RATELIMITS[scope]
+    keys = [f'{scope}:ip:{client_ip(request)}']
+    session = getattr(request, 'session', None)
+    if session is not None and session.session_key:
+        keys.append(f'{scope}:session:{session.session_key}')
+    
+    retry_after = 0
+    for key in keys:
+        allowed, wait = consume(key, rate)
+        if not allowed:
+            retry_after = max(retry_after, wait)
+    return retry_after > 0, retry_after
+
+
+def rate_limited_response(request, retry_after):
+    """429 response in the format the caller expects"""
+    retry_after = max(1, math.ceil(retry_after))
+    message = f'Too many requests. Please try again in {retry_after} seconds.'
+    
+    if request.content_type == 'application/json' or request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        response = JsonResponse({'status': 'error', 'available': False, 'message': message}, status=429)
+    else:
+        response = HttpResponse(message, status=429, content_type='text/plain')
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+def ratelimit(scope, methods=('POST',)):
+    """
+    View decorator applying the token buckets for a scope.
+    Only requests using one of `methods` consume tokens.
+    """
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            @functools.wraps(view_func)
+            async def async_wrapped(request, *args, **kwargs):
+                if request.method in methods:
+                    # The bucket check is a short Redis round trip and never touches the database
+                    limited, retry_after = await sync_to_async(is_rate_limited, thread_sensitive=False)(request, scope)
+                    if limited:
+                        return rate_limited_response(request, retry_after)
+                return await view_func(request, *args, **kwargs)
+            return async_wrapped
+        
+        @functools.wraps(view_func)
+        def wrapped(request, *args, **kwargs):
+            if request.method in methods:
+                limited, retry_after = is_rate_limited(request, scope)
+                if limited:
+                    return rate_limited_response(request, retry_after)
+            return view_func(request, *args, **kwargs)
+        return wrapped
+    return decorator
@@ -0,0 +1,49 @@
+"""
+Shared access to the raw Redis client behind the Django cache
+"""
+import weakref
+
+from django.core.cache import caches
+
+# Lua scripts registered per client: {client: {source: Script}}
+_scripts = weakref.WeakKeyDictionary()
+
+
+def get_redis(alias='default'):
+    """
+    Return the raw Redis client for a cache alias.
+    Returns None when the cache is not Redis-backed, or is a FailoverCache
+    currently serving from local memory, so callers can degrade to their
+    database or in-process path.
+    """
+    from infikar.cache import FailoverCache
+    
+    cache = caches[alias]
+    if isinstance(cache, FailoverCache):
+        return cache.get_redis()
+    
+    try:
+        from django_redis import get_redis_connection
+    except ImportError:
+        return None
+    
+    if not hasattr(cache, 'client'):
+        return None
+    
+    try:
+        return get_redis_connection(alias)
+    except NotImplementedError:
+        return None
+
+
+def get_script(client, source):
+    """
+    Lua script registered once per client. Calls send EVALSHA and load the
+    script only when Redis does not have it yet.
+    """
+    scripts = _scripts.setdefault(client, {})
+    script = scripts.get(source)
+    if script is None:
+        # Two threads may both register it; that only costs one extra Script object
+        script = scripts[source] = client.register_script(source)
+    return script
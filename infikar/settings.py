@@ -74,8 +74,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "infikar.metrics.MetricsMiddleware",  # outermost, so it times the whole stack
+    "infikar.querybudget.QueryBudgetMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "infikar.db.routers.ReplicaPinMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -127,6 +130,39 @@ else:
         }
     }
 
+# Read replicas, one URL each (routing in infikar/db/routers.py)
+DATABASE_REPLICAS = []
+for index, url in enumerate(env.list('DATABASE_REPLICA_URLS', default=[])):
+    alias = f'replica_{index}'
+    DATABASES[alias] = environ.Env.db_url_config(url)
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['infikar.db.routers.ReplicaRouter']
+REPLICA_MAX_LAG = env.int('REPLICA_MAX_LAG', default=5)  # seconds behind the primary before a replica is skipped
+REPLICA_LAG_CHECK_INTERVAL = 5  # seconds between lag checks in each worker
+REPLICA_PIN_SECONDS = 10  # reads stay on the primary this long after a browser writes
+
+# MySQL connections (infikar/db/backends/mysql): sync workers keep a persistent,
+# health-checked connection; threaded/async workers share a bounded pool instead
+SERVER_MODE = env('SERVER_MODE', default='wsgi')
+DATABASE_POOL_SIZE = env.int('DATABASE_POOL_SIZE', default=10 if SERVER_MODE == 'asgi' else 0)
+for database in DATABASES.values():
+    if database['ENGINE'] != 'django.db.backends.mysql':
+        continue
+    database['ENGINE'] = 'infikar.db.backends.mysql'
+    database['CONN_HEALTH_CHECKS'] = True
+    if DATABASE_POOL_SIZE:
+        database['CONN_MAX_AGE'] = 0
+        database.setdefault('OPTIONS', {})['pool'] = {
+            'max_size': DATABASE_POOL_SIZE,
+            'timeout': env.float('DATABASE_POOL_TIMEOUT', default=10),  # seconds to wait for a free connection
+            'max_lifetime': env.int('DATABASE_POOL_MAX_LIFETIME', default=1800),
+            'max_idle': env.int('DATABASE_POOL_MAX_IDLE', default=300),
+        }
+    else:
+        database['CONN_MAX_AGE'] = env.int('DATABASE_CONN_MAX_AGE', default=60)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -223,28 +259,36 @@ SOCIALACCOUNT_PROVIDERS = {
 # Redis configuration
 REDIS_URL = env('REDIS_URL', default='redis://localhost:6379/0')
 
-# Try Redis, fallback to local memory cache if Redis is not available
-try:
-    import redis
-    r = redis.Redis.from_url(REDIS_URL)
-    r.ping()
-    CACHES = {
-        "default": {
-            "BACKEND": "django_redis.cache.RedisCache",
-            "LOCATION": REDIS_URL,
-            "OPTIONS": {
-                "CLIENT_CLASS": "django_redis.client.DefaultClient",
-            }
-        }
-    }
-except:
-    # Fallback to local memory cache if Redis is not available
-    CACHES = {
-        "default": {
-            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
-            "LOCATION": "unique-snowflake",
+# Redis cache that fails over to local memory while Redis is unreachable
+# (infikar/cache.py); nothing connects until the cache is first used
+CACHES = {
+    "default": {
+        "BACKEND": "infikar.cache.FailoverCache",
+        "LOCATION": REDIS_URL,
+        "OPTIONS": {
+            "CLIENT_CLASS": "django_redis.client.DefaultClient",
+            "SOCKET_CONNECT_TIMEOUT": 1,  # seconds; an outage must not stall requests
+            "SOCKET_TIMEOUT": 1,
+            "HEALTH_CHECK_INTERVAL": 5,  # seconds between Redis pings while failed over
         }
     }
+}
+
+# Username availability index (Redis Bloom filter)
+USERNAME_BLOOM_CAPACITY = env.int('USERNAME_BLOOM_CAPACITY', default=1000000)
+USERNAME_BLOOM_ERROR_RATE = 0.001
+USERNAME_NEGATIVE_CACHE_TTL = 60  # seconds
+
+# Rate limiting (token buckets per IP and per session, see infikar/ratelimit.py)
+RATELIMIT_ENABLE = env.bool('RATELIMIT_ENABLE', default=True)
+RATELIMIT_TRUST_X_FORWARDED_FOR = env.bool('RATELIMIT_TRUST_X_FORWARDED_FOR', default=False)  # True behind a reverse proxy, see env.example
+RATELIMIT_PROXY_COUNT = env.int('RATELIMIT_PROXY_COUNT', default=1)  # proxies that append to X-Forwarded-For, see env.example
+RATELIMITS = {
+    'username_check': '30/m',
+    'signup': '5/m',
+    'login': '10/m',
+    'analytics_beacon': '120/m',
+}
 
 # Celery configuration
 CELERY_BROKER_URL = REDIS_URL
@@ -277,3 +321,51 @@ FREE_SOCIAL_LINKS = 5
 PRO_SOCIAL_LINKS = 10
 FREE_PICKS_LIMIT = 50
 PRO_PICKS_LIMIT = 100
+FREE_LINK_LIMIT = 100
+PRO_LINK_LIMIT = 100
+
+# Hours an auto-renewing subscription stays active past end_date while the renewal payment arrives
+SUBSCRIPTION_RENEWAL_GRACE_HOURS = 24
+
+# Payment webhooks
+STRIPE_WEBHOOK_SECRET = env('STRIPE_WEBHOOK_SECRET', default='')
+STRIPE_WEBHOOK_TOLERANCE = 300  # seconds between signing and delivery
+WEBHOOK_MAX_ATTEMPTS = 5
+WEBHOOK_CLAIM_TIMEOUT = 600  # seconds before events claimed by a run that died are taken over
+
+# Seconds between plan catalog version checks in each worker
+PLAN_CATALOG_CHECK_INTERVAL = 5
+
+# Coupons
+COUPON_RESERVATION_TIMEOUT = 900  # seconds a checkout holds a coupon use
+COUPON_PLANS_CACHE_TTL = 3600
+
+# Resolved plan limits and feature flags are cached per user (seconds)
+ENTITLEMENTS_CACHE_TTL = 300
+
+# Published card snapshots
+PUBLIC_CARD_CACHE_TTL = 300  # seconds a (username, slug) -> published version lookup is cached
+CARD_VERSION_HISTORY = 10  # published versions kept per card
+CARD_VERSION_CACHE_TTL = 86400  # snapshots are immutable, so they can be cached for long
+
+# Prometheus scrape endpoint (/metrics): scrapers must send this as a bearer token.
+# Unset, /metrics is only served with DEBUG on.
+METRICS_TOKEN = env('METRICS_TOKEN', default='')
+
+# Query budgets (infikar/querybudget.py): queries allowed per request by URL name
+QUERY_BUDGETS = {
+    'cards:home': 3,
+    'cards:user_profile': 3,
+    'cards:card_detail': 2,
+    'subscriptions:plan_list': 2,
+}
+QUERY_BUDGET_DEFAULT = 50  # for views without their own budget
+QUERY_REPEAT_THRESHOLD = 5  # one query shape run this often in a request is reported as a probable N+1
+QUERY_PROFILE_SAMPLE_RATE = env.float('QUERY_PROFILE_SAMPLE_RATE', default=0.01)  # share of requests profiled and logged
+QUERY_BUDGET_STRICT = env.bool('QUERY_BUDGET_STRICT', default=False)  # profile every request and raise on violations
+
+# Health probes (infikar/health.py): one background check of the dependencies per process
+HEALTH_PROBE_INTERVAL = 5  # seconds between dependency checks
+HEALTH_PROBE_TTL = 15  # results older than this are re-checked by the probe that finds them
+HEALTH_POOL_SATURATION = 0.9  # share of a connection pool in use at which the worker reports not ready
+HEALTH_QUEUE_SATURATION = env.int('HEALTH_QUEUE_SATURATION', default=100000)  # beacon events waiting before the queue is reported saturated
@@ -0,0 +1,44 @@
+"""
+Settings for workers that only serve the public pages.
+
+Select with DJANGO_SETTINGS_MODULE=infikar.settings_public on the workers that
+take the public pages, and route /admin/ (and preferably /app/) to workers
+running the full settings. This profile is the full settings minus apps the
+public pages never use: the admin, allauth with its four social providers
+(and, through them, requests and urllib3), crispy forms and django-extensions.
+Workers boot faster and use less memory; `manage.py profile_startup --compare
+infikar.settings_public` shows by how much. Run migrations and other
+management commands with the full settings.
+"""
+from infikar.settings import *  # noqa: F401,F403
+from infikar.settings import AUTHENTICATION_BACKENDS, INSTALLED_APPS, MIDDLEWARE
+
+PUBLIC_EXCLUDED_APPS = {
+    "django.contrib.admin",
+    "django.contrib.sites",
+    "allauth",
+    "allauth.account",
+    "allauth.socialaccount",
+    "allauth.socialaccount.providers.google",
+    "allauth.socialaccount.providers.microsoft",
+    "allauth.socialaccount.providers.apple",
+    "allauth.socialaccount.providers.github",
+    "crispy_forms",
+    "crispy_tailwind",
+    "django_extensions",
+}
+
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in PUBLIC_EXCLUDED_APPS]
+
+MIDDLEWARE = [
+    middleware for middleware in MIDDLEWARE
+    if middleware != "allauth.account.middleware.AccountMiddleware"
+]
+
+# Sign-in goes through ModelBackend (allauth's URLs are not routed), so sessions stay valid here
+AUTHENTICATION_BACKENDS = [
+    backend for backend in AUTHENTICATION_BACKENDS
+    if not backend.startswith("allauth.")
+]
+
+ROOT_URLCONF = "infikar.urls_public"
@@ -0,0 +1,95 @@
+"""
+Worker startup profiling.
+
+Starts a fresh interpreter under `python -X importtime`, loads the project the
+way a web worker does (WSGI application plus URLconf) and reports the time,
+the peak memory and the imports that cost the most. Use it to compare settings
+profiles, e.g. infikar.settings with infikar.settings_public, and to catch a
+module-level import of a heavy library before it ships.
+"""
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from dataclasses import dataclass
+
+# Runs in the child: everything a worker does before its first request
+WORKER_BOOT = """
+import json, resource, sys, time
+started = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+get_wsgi_application()
+from django.urls import get_resolver
+get_resolver().url_patterns
+seconds = time.perf_counter() - started
+try:
+    # ru_maxrss would include the parent's memory from before exec
+    with open('/proc/self/status') as f:
+        max_rss = next(int(line.split()[1]) for line in f if line.startswith('VmHWM:'))
+except OSError:
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        max_rss //= 1024
+print(json.dumps({'seconds': seconds, 'max_rss_kb': max_rss}))
+"""
+
+
+@dataclass
+class Import:
+    name: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+    
+    @property
+    def package(self):
+        return self.name.split('.')[0]
+
+
+def parse_importtime(lines):
+    """Imports from `-X importtime` output, in the order they finished"""
+    imports = []
+    for line in lines:
+        if not line.startswith('import time:'):
+            continue
+        try:
+            self_us, cumulative_us, name = line[len('import time:'):].split('|')
+            self_us, cumulative_us = int(self_us), int(cumulative_us)
+        except ValueError:
+            # The header line
+            continue
+        stripped = name.lstrip()
+        imports.append(Import(stripped.rstrip(), self_us, cumulative_us, (len(name) - len(stripped) - 1) // 2))
+    return imports
+
+
+def by_package(imports):
+    """(package, self time in µs, modules) for every top-level package, slowest first"""
+    totals = defaultdict(lambda: [0, 0])
+    for imported in imports:
+        totals[imported.package][0] += imported.self_us
+        totals[imported.package][1] += 1
+    return sorted(((package, us, count) for package, (us, count) in totals.items()), key=lambda row: -row[1])
+
+
+def profile_startup(settings_module=None):
+    """Boot a worker in a subprocess and return its timings, memory and imports"""
+    env = dict(os.environ)
+    if settings_module:
+        env['DJANGO_SETTINGS_MODULE'] = settings_module
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', WORKER_BOOT],
+        env=env, capture_output=True, text=True,
+    )
+    if completed.returncode:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else 'Worker boot failed')
+    
+    imports = parse_importtime(completed.stderr.splitlines())
+    report = json.loads(completed.stdout.strip().splitlines()[-1])
+    report.update(
+        settings=env.get('DJANGO_SETTINGS_MODULE'),
+        modules=len(imports),
+        imports=imports,
+    )
+    return report
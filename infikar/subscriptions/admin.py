@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import SubscriptionPlan, UserSubscription, Payment, Coupon
+from .models import SubscriptionPlan, UserSubscription, Payment, Coupon, WebhookEvent
 
 
 @admin.register(SubscriptionPlan)
@@ -32,3 +32,11 @@ class CouponAdmin(admin.ModelAdmin):
     list_filter = ('coupon_type', 'is_active', 'valid_from', 'valid_until')
     search_fields = ('code', 'name')
     ordering = ('-created_at',)
+
+
+@admin.register(WebhookEvent)
+class WebhookEventAdmin(admin.ModelAdmin):
+    list_display = ('event_id', 'event_type', 'customer_id', 'status', 'attempts', 'received_at', 'processed_at')
+    list_filter = ('provider', 'status', 'event_type')
+    search_fields = ('event_id', 'customer_id')
+    ordering = ('-received_at',)
@@ -0,0 +1,122 @@
+"""
+In-process subscription plan catalog.
+
+Plans change rarely, so each worker keeps an immutable snapshot of every plan
+with prices and yearly discounts precomputed. A version token in the shared
+cache is bumped whenever an admin edits a plan; workers compare it at most
+every PLAN_CATALOG_CHECK_INTERVAL seconds and reload on mismatch.
+"""
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+from .entitlements import FEATURE_FLAGS
+
+VERSION_KEY = 'plan_catalog:version'
+
+
+class PlanEntry:
+    """Read-only copy of a SubscriptionPlan row"""
+    
+    __slots__ = (
+        'id', 'pk', 'name', 'plan_type', 'billing_cycle', 'billing_cycle_display',
+        'price_monthly', 'price_yearly', 'yearly_discount',
+        'card_limit', 'social_links_limit', 'picks_limit', 'trial_days',
+        'is_active', 'is_popular',
+    ) + FEATURE_FLAGS
+    
+    def __init__(self, plan):
+        set_field = super().__setattr__
+        for name in self.__slots__:
+            if name == 'billing_cycle_display':
+                set_field(name, plan.get_billing_cycle_display())
+            elif name == 'yearly_discount':
+                set_field(name, plan.get_yearly_discount())
+            else:
+                set_field(name, getattr(plan, name))
+    
+    def __setattr__(self, name, value):
+        raise AttributeError('PlanEntry is immutable')
+    
+    def __str__(self):
+        return f"{self.name} ({self.billing_cycle_display})"
+    
+    def get_price(self, billing_cycle=None):
+        """Get price for specific billing cycle"""
+        if billing_cycle == 'yearly':
+            return self.price_yearly
+        return self.price_monthly
+    
+    def get_yearly_discount(self):
+        return self.yearly_discount
+
+
+class PlanCatalog:
+    """Immutable snapshot of all plans at one catalog version"""
+    
+    __slots__ = ('version', 'plans', '_by_id')
+    
+    def __init__(self, version, plans):
+        self.version = version
+        self.plans = tuple(plans)
+        self._by_id = {plan.id: plan for plan in self.plans}
+    
+    def get(self, plan_id):
+        return self._by_id.get(plan_id)
+    
+    def active_plans(self):
+        return tuple(plan for plan in self.plans if plan.is_active)
+
+
+_catalog = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def _current_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # First worker to notice a missing key picks the version everyone uses
+        cache.add(VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def load_catalog(version=None):
+    """Load every plan from the database into a new catalog"""
+    from .models import SubscriptionPlan
+    
+    # Always from the primary: a lagging replica would keep old plans until the next version bump
+    plans = [PlanEntry(plan) for plan in SubscriptionPlan.objects.using(DEFAULT_DB_ALIAS)]
+    return PlanCatalog(version, plans)
+
+
+def get_catalog():
+    """
+    Get this worker's plan catalog.
+    The shared version token is checked at most every PLAN_CATALOG_CHECK_INTERVAL seconds.
+    """
+    global _catalog, _checked_at
+    
+    catalog = _catalog
+    now = time.monotonic()
+    if catalog is not None and now - _checked_at < settings.PLAN_CATALOG_CHECK_INTERVAL:
+        return catalog
+    
+    with _lock:
+        version = _current_version()
+        if _catalog is None or _catalog.version != version:
+            _catalog = load_catalog(version)
+        _checked_at = time.monotonic()
+        return _catalog
+
+
+def invalidate_catalog():
+    """Publish a new catalog version so every worker reloads on its next check"""
+    global _catalog
+    cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+    _catalog = None
@@ -0,0 +1,251 @@
+"""
+Coupon redemption under high concurrency.
+
+With Redis, a checkout first reserves a use, then confirms it once payment
+succeeds. Reservations expire on their own, and one Lua script checks the limit
+and takes the reservation atomically. Confirmed uses are counted in Redis and
+copied into Coupon.used_count in batches by `reconcile_coupon_usage`. The
+script counts the larger of the Redis and database counts, so uses confirmed
+in the database while Redis was unreachable still count once it is back.
+
+Without Redis, reserving only checks availability. Confirming consumes the use
+with a conditional UPDATE ... WHERE used_count < usage_limit, so the limit can
+never be oversold.
+"""
+import time
+import uuid
+from datetime import timedelta
+
+import redis
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from infikar.redis_client import get_redis, get_script
+from .models import Coupon
+
+DIRTY_SET_KEY = 'coupons:dirty'
+
+# KEYS: used counter, reservations zset
+# ARGV: used_count from the database, usage limit (-1 for none), now (ms), expiry (ms), token
+RESERVE_SCRIPT = """
+local used = math.max(tonumber(redis.call('GET', KEYS[1]) or 0), tonumber(ARGV[1]))
+redis.call('SET', KEYS[1], used)
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', ARGV[3])
+local held = redis.call('ZCARD', KEYS[2])
+local limit = tonumber(ARGV[2])
+if limit >= 0 and used + held >= limit then
+    return 0
+end
+redis.call('ZADD', KEYS[2], ARGV[4], ARGV[5])
+-- The key lives as long as its longest reservation, so a shorter one never cuts an earlier one short
+local last = redis.call('ZRANGE', KEYS[2], -1, -1, 'WITHSCORES')
+redis.call('PEXPIREAT', KEYS[2], last[2])
+return 1
+"""
+
+# KEYS: used counter, reservations zset, dirty set
+# ARGV: token, now (ms), coupon id
+CONFIRM_SCRIPT = """
+local expires = redis.call('ZSCORE', KEYS[2], ARGV[1])
+if not expires then
+    return 0
+end
+redis.call('ZREM', KEYS[2], ARGV[1])
+if tonumber(expires) < tonumber(ARGV[2]) then
+    return 0
+end
+redis.call('INCR', KEYS[1])
+redis.call('SADD', KEYS[3], ARGV[3])
+return 1
+"""
+
+# KEYS: used counter. Counts a use confirmed in the database, unless the counter
+# is not seeded yet (the next reservation seeds it from the database).
+INCR_IF_SEEDED_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('INCR', KEYS[1])
+end
+return 0
+"""
+
+
+class CouponUnavailable(Exception):
+    """Raised when a coupon cannot be redeemed (expired, sold out or not applicable)"""
+
+
+class Reservation:
+    """A held coupon use, to be confirmed or released by the checkout"""
+    
+    __slots__ = ('coupon_id', 'token', 'expires_at', 'backend')
+    
+    def __init__(self, coupon_id, token, expires_at, backend):
+        self.coupon_id = coupon_id
+        self.token = token
+        self.expires_at = expires_at
+        self.backend = backend
+    
+    def __repr__(self):
+        return f"<Reservation coupon={self.coupon_id} backend={self.backend}>"
+
+
+def _used_key(coupon_id):
+    return f'coupon:{coupon_id}:used'
+
+
+def _reservations_key(coupon_id):
+    return f'coupon:{coupon_id}:reservations'
+
+
+def _plans_cache_key(coupon_id):
+    return f'coupon:{coupon_id}:plans'
+
+
+def get_applicable_plan_ids(coupon):
+    """IDs of the plans a coupon applies to (empty means every plan), cached per coupon"""
+    key = _plans_cache_key(coupon.pk)
+    plan_ids = cache.get(key)
+    if plan_ids is None:
+        plan_ids = frozenset(coupon.applicable_plans.values_list('pk', flat=True))
+        cache.set(key, plan_ids, settings.COUPON_PLANS_CACHE_TTL)
+    return plan_ids
+
+
+def invalidate_applicable_plans(coupon_id):
+    cache.delete(_plans_cache_key(coupon_id))
+
+
+def is_applicable(coupon, plan):
+    plan_ids = get_applicable_plan_ids(coupon)
+    return not plan_ids or plan.pk in plan_ids
+
+
+def _has_capacity(coupon_id):
+    return Coupon.objects.filter(pk=coupon_id).filter(
+        Q(usage_limit__isnull=True) | Q(used_count__lt=F('usage_limit'))
+    ).exists()
+
+
+def reserve_coupon(coupon, plan=None, timeout=None):
+    """
+    Reserve one use of a coupon.
+    Returns a Reservation, or raises CouponUnavailable.
+    """
+    now = timezone.now()
+    if not (coupon.is_active and coupon.valid_from <= now <= coupon.valid_until):
+        raise CouponUnavailable('This coupon is not valid')
+    if plan is not None and not is_applicable(coupon, plan):
+        raise CouponUnavailable('This coupon does not apply to the selected plan')
+    
+    timeout = timeout or settings.COUPON_RESERVATION_TIMEOUT
+    token = uuid.uuid4().hex
+    expires_ms = int((time.time() + timeout) * 1000)
+    expires_at = now + timedelta(seconds=timeout)
+    
+    client = get_redis()
+    if client is not None:
+        try:
+            limit = coupon.usage_limit if coupon.usage_limit is not None else -1
+            reserved = get_script(client, RESERVE_SCRIPT)(
+                keys=[_used_key(coupon.pk), _reservations_key(coupon.pk)],
+                args=[coupon.used_count, limit, int(time.time() * 1000), expires_ms, token],
+            )
+        except redis.RedisError:
+            pass
+        else:
+            if not reserved:
+                raise CouponUnavailable('This coupon has reached its usage limit')
+            return Reservation(coupon.pk, token, expires_at, 'redis')
+    
+    if not _has_capacity(coupon.pk):
+        raise CouponUnavailable('This coupon has reached its usage limit')
+    return Reservation(coupon.pk, token, expires_at, 'database')
+
+
+def confirm_reservation(reservation):
+    """
+    Turn a reservation into a counted use once payment succeeds.
+    Returns False if the reservation expired or the coupon sold out meanwhile.
+    """
+    if reservation.backend == 'redis':
+        client = get_redis()
+        if client is not None:
+            try:
+                return bool(get_script(client, CONFIRM_SCRIPT)(
+                    keys=[_used_key(reservation.coupon_id), _reservations_key(reservation.coupon_id), DIRTY_SET_KEY],
+                    args=[reservation.token, int(time.time() * 1000), reservation.coupon_id],
+                ))
+            except redis.RedisError:
+                pass
+    
+    # Conditional UPDATE: consumes a use only while the limit has not been reached
+    updated = Coupon.objects.filter(pk=reservation.coupon_id).filter(
+        Q(usage_limit__isnull=True) | Q(used_count__lt=F('usage_limit'))
+    ).update(used_count=F('used_count') + 1, updated_at=timezone.now())
+    if updated:
+        _count_in_redis(reservation.coupon_id)
+    return bool(updated)
+
+
+def _count_in_redis(coupon_id):
+    """Add a use confirmed in the database to the Redis counter, when Redis is reachable"""
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        get_script(client, INCR_IF_SEEDED_SCRIPT)(keys=[_used_key(coupon_id)])
+    except redis.RedisError:
+        # RESERVE_SCRIPT takes the database count into account once Redis is back
+        pass
+
+
+def release_reservation(reservation):
+    """Give a reserved use back (checkout abandoned or payment failed)"""
+    if reservation.backend != 'redis':
+        return
+    
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        client.zrem(_reservations_key(reservation.coupon_id), reservation.token)
+    except redis.RedisError:
+        pass
+
+
+def reconcile_coupon_usage(batch_size=100):
+    """
+    Copy confirmed Redis use counts into Coupon.used_count.
+    Each batch is a single UPDATE; counts only ever move forward.
+    Returns the number of coupons reconciled.
+    """
+    client = get_redis()
+    if client is None:
+        return 0
+    
+    reconciled = 0
+    while True:
+        coupon_ids = [int(coupon_id) for coupon_id in client.spop(DIRTY_SET_KEY, batch_size) or []]
+        if not coupon_ids:
+            return reconciled
+        
+        counts = client.mget([_used_key(coupon_id) for coupon_id in coupon_ids])
+        whens = [
+            When(pk=coupon_id, then=Greatest(F('used_count'), Value(int(count))))
+            for coupon_id, count in zip(coupon_ids, counts)
+            if count is not None
+        ]
+        if not whens:
+            continue
+        try:
+            Coupon.objects.filter(pk__in=coupon_ids).update(
+                used_count=Case(*whens, default=F('used_count')),
+                updated_at=timezone.now(),
+            )
+        except Exception:
+            # Put the popped ids back so the next run reconciles them
+            client.sadd(DIRTY_SET_KEY, *coupon_ids)
+            raise
+        reconciled += len(whens)
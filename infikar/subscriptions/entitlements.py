@@ -0,0 +1,147 @@
+"""
+Per-user entitlements: plan limits and feature flags.
+
+A user's active UserSubscription -> SubscriptionPlan is resolved once, cached in
+Redis, and memoized on the user object so every limit check in a request reads
+the same resolved object instead of re-querying subscriptions.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+CACHE_KEY_PREFIX = 'entitlements'
+
+FEATURE_FLAGS = (
+    'can_save_drafts',
+    'can_hide_cards',
+    'has_analytics',
+    'has_google_analytics',
+    'has_custom_templates',
+    'has_auto_fetch',
+    'has_youtube_api',
+)
+
+# Features granted when a user has no subscription row, by legacy tier
+FREE_FEATURES = {'has_auto_fetch'}
+PRO_FEATURES = set(FEATURE_FLAGS)
+
+
+class Entitlements:
+    """Resolved limits and feature flags for one user"""
+    
+    __slots__ = (
+        'plan_id', 'is_pro', 'card_limit', 'social_links_limit', 'picks_limit',
+        'link_limit', 'expires_at',
+    ) + FEATURE_FLAGS
+    
+    def __init__(self, **values):
+        for name in self.__slots__:
+            setattr(self, name, values.get(name))
+    
+    def __repr__(self):
+        return f"<Entitlements plan={self.plan_id} pro={self.is_pro}>"
+    
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+    
+    @property
+    def is_expired(self):
+        return self.expires_at is not None and self.expires_at <= timezone.now()
+    
+    def cache_timeout(self):
+        """Cache for the configured TTL, but never past the point the entitlements lapse"""
+        timeout = settings.ENTITLEMENTS_CACHE_TTL
+        if self.expires_at is not None:
+            remaining = int((self.expires_at - timezone.now()).total_seconds())
+            timeout = max(1, min(timeout, remaining))
+        return timeout
+
+
+def _limits_for_tier(is_pro):
+    if is_pro:
+        return {
+            'card_limit': settings.PRO_CARD_LIMIT,
+            'social_links_limit': settings.PRO_SOCIAL_LINKS,
+            'picks_limit': settings.PRO_PICKS_LIMIT,
+            'link_limit': settings.PRO_LINK_LIMIT,
+        }
+    return {
+        'card_limit': settings.FREE_CARD_LIMIT,
+        'social_links_limit': settings.FREE_SOCIAL_LINKS,
+        'picks_limit': settings.FREE_PICKS_LIMIT,
+        'link_limit': settings.FREE_LINK_LIMIT,
+    }
+
+
+def free_entitlements():
+    """Entitlements for anonymous users and users without any paid access"""
+    values = _limits_for_tier(False)
+    values.update({flag: flag in FREE_FEATURES for flag in FEATURE_FLAGS})
+    return Entitlements(plan_id=None, is_pro=False, expires_at=None, **values)
+
+
+def resolve_entitlements(user):
+    """Resolve entitlements from the database, bypassing every cache"""
+    from .catalog import get_catalog
+    from .models import UserSubscription
+    
+    # Plans come from the in-process catalog, so only the subscription row is queried
+    subscription = UserSubscription.objects.filter(user_id=user.pk).first()
+    plan = get_catalog().get(subscription.plan_id) if subscription is not None else None
+    
+    if plan is not None and subscription.is_active:
+        is_pro = plan.plan_type == 'pro'
+        values = {
+            'card_limit': plan.card_limit,
+            'social_links_limit': plan.social_links_limit,
+            'picks_limit': plan.picks_limit,
+            'link_limit': _limits_for_tier(is_pro)['link_limit'],
+        }
+        values.update({flag: getattr(plan, flag) for flag in FEATURE_FLAGS})
+        if subscription.status == 'trial':
+            expires_at = subscription.trial_end_date
+        else:
+            expires_at = subscription.end_date
+        return Entitlements(plan_id=plan.pk, is_pro=is_pro, expires_at=expires_at, **values)
+    
+    # No active subscription row: fall back to the tier stored on the user
+    is_pro = bool(user.is_pro_user)
+    values = _limits_for_tier(is_pro)
+    features = PRO_FEATURES if is_pro else FREE_FEATURES
+    values.update({flag: flag in features for flag in FEATURE_FLAGS})
+    expires_at = user.trial_end_date if is_pro and user.subscription_tier == 'pro_trial' else None
+    return Entitlements(plan_id=None, is_pro=is_pro, expires_at=expires_at, **values)
+
+
+def cache_key(user_id):
+    return f'{CACHE_KEY_PREFIX}:{user_id}'
+
+
+def get_entitlements(user):
+    """
+    Get entitlements for a user.
+    Memoized on the user object for the rest of the request and cached across
+    requests until the subscription changes or the access period ends.
+    """
+    if not getattr(user, 'is_authenticated', False):
+        return free_entitlements()
+    
+    entitlements = getattr(user, '_entitlements', None)
+    if entitlements is not None and not entitlements.is_expired:
+        return entitlements
+    
+    key = cache_key(user.pk)
+    data = cache.get(key)
+    entitlements = Entitlements(**data) if data else None
+    if entitlements is None or entitlements.is_expired:
+        entitlements = resolve_entitlements(user)
+        cache.set(key, entitlements.as_dict(), entitlements.cache_timeout())
+    
+    user._entitlements = entitlements
+    return entitlements
+
+
+def invalidate_entitlements(*user_ids):
+    """Drop cached entitlements after a subscription, plan or tier change"""
+    if user_ids:
+        cache.delete_many([cache_key(user_id) for user_id in user_ids])
@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from infikar.subscriptions.webhooks import process_pending_events
+
+
+class Command(BaseCommand):
+    help = 'Apply stored payment webhook events, keeping each customer\'s events in order'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Number of worker threads (default: 4)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Maximum events to load per batch (default: 500)'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=1.0,
+            help='Seconds to wait when the queue is empty (default: 1)'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Process a single batch and exit'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            applied = process_pending_events(workers=options['workers'], batch_size=options['batch_size'])
+            if applied:
+                self.stdout.write(f'  💳 Applied {applied} webhook events')
+            if options['once']:
+                break
+            if applied < options['batch_size']:
+                time.sleep(options['interval'])
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from infikar.subscriptions.coupons import reconcile_coupon_usage
+
+
+class Command(BaseCommand):
+    help = 'Write confirmed coupon redemptions from Redis into Coupon.used_count'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Number of coupons to update per statement (default: 100)'
+        )
+
+    def handle(self, *args, **options):
+        reconciled = reconcile_coupon_usage(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'✅ Reconciled usage for {reconciled} coupons'))
@@ -0,0 +1,35 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from infikar.subscriptions.sweeper import expiring_subscriptions, sweep_subscriptions
+
+
+class Command(BaseCommand):
+    help = 'Expire lapsed trials and subscriptions in bulk (run periodically, e.g. from cron every few minutes)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Number of subscriptions to expire per UPDATE (default: 500)'
+        )
+        parser.add_argument(
+            '--expiring-within',
+            type=int,
+            default=3,
+            help='Also report subscriptions lapsing within this many days (default: 3)'
+        )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        result = sweep_subscriptions(now=now, chunk_size=options['chunk_size'])
+        
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Expired {result['trials']} trials and {result['subscriptions']} subscriptions"
+        ))
+        
+        expiring = expiring_subscriptions(now, timedelta(days=options['expiring_within'])).count()
+        self.stdout.write(f"  ⏳ {expiring} lapsing within {options['expiring_within']} days")
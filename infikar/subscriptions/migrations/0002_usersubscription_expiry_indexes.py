@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:46
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("subscriptions", "0001_initial"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="usersubscription",
+            index=models.Index(
+                fields=["status", "end_date"], name="subscriptio_status_93cc56_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="usersubscription",
+            index=models.Index(
+                fields=["status", "trial_end_date"],
+                name="subscriptio_status_0a81bd_idx",
+            ),
+        ),
+    ]
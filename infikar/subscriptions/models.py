@@ -109,6 +109,13 @@ class UserSubscription(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        indexes = [
+            # Range scans used by the expiry sweeper
+            models.Index(fields=['status', 'end_date']),
+            models.Index(fields=['status', 'trial_end_date']),
+        ]
+    
     def __str__(self):
         return f"{self.user.username} - {self.plan.name}"
     
@@ -186,6 +193,7 @@ class Payment(models.Model):
     # External payment system
     stripe_payment_intent_id = models.CharField(max_length=100, blank=True)
     stripe_charge_id = models.CharField(max_length=100, blank=True)
+    stripe_invoice_id = models.CharField(max_length=100, blank=True, db_index=True)
     
     # Billing period
     billing_period_start = models.DateTimeField()
@@ -259,3 +267,41 @@ class Coupon(models.Model):
             discount = min(self.discount_value, amount)
         
         return max(0, amount - discount)
+
+
+class WebhookEvent(models.Model):
+    """Raw payment provider webhook events, stored before they are applied"""
+    
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('processed', 'Processed'),
+        ('ignored', 'Ignored'),
+        ('failed', 'Failed'),
+    ]
+    
+    provider = models.CharField(max_length=20, default='stripe')
+    event_id = models.CharField(max_length=255, unique=True)
+    event_type = models.CharField(max_length=100)
+    customer_id = models.CharField(max_length=100, blank=True)
+    payload = models.JSONField()
+    
+    # Processing state
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    
+    # Timestamps
+    provider_created_at = models.DateTimeField(null=True, blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['provider_created_at', 'id']
+        indexes = [
+            models.Index(fields=['status', 'provider_created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.event_type} ({self.event_id}) - {self.status}"
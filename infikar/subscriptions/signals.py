@@ -0,0 +1,51 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .catalog import invalidate_catalog
+from .coupons import invalidate_applicable_plans
+from .entitlements import invalidate_entitlements
+from .models import Coupon, SubscriptionPlan, UserSubscription
+
+User = get_user_model()
+
+# User fields that feed the legacy (no subscription row) entitlements
+TIER_FIELDS = {'subscription_tier', 'subscription_end_date', 'trial_end_date'}
+
+
+@receiver([post_save, post_delete], sender=UserSubscription)
+def subscription_changed(sender, instance, **kwargs):
+    invalidate_entitlements(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=SubscriptionPlan)
+def plan_changed(sender, instance, **kwargs):
+    # A worker reloading before the commit would keep the old rows under the new version
+    transaction.on_commit(invalidate_catalog)
+    user_ids = UserSubscription.objects.filter(plan_id=instance.pk).values_list('user_id', flat=True)
+    invalidate_entitlements(*user_ids)
+
+
+@receiver(post_save, sender=User)
+def user_tier_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or TIER_FIELDS.intersection(update_fields):
+        invalidate_entitlements(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Coupon)
+def coupon_changed(sender, instance, **kwargs):
+    invalidate_applicable_plans(instance.pk)
+
+
+@receiver(m2m_changed, sender=Coupon.applicable_plans.through)
+def coupon_plans_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        # Changed from the plan side: every affected coupon needs a refresh
+        coupon_ids = pk_set if pk_set is not None else Coupon.objects.values_list('pk', flat=True)
+        for coupon_id in coupon_ids:
+            invalidate_applicable_plans(coupon_id)
+    else:
+        invalidate_applicable_plans(instance.pk)
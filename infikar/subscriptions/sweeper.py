@@ -0,0 +1,75 @@
+"""
+Batched expiry sweeper for trials and subscriptions.
+
+Lapsed rows are found with indexed range queries on (status, end_date) and
+(status, trial_end_date) and moved to 'expired' with bulk UPDATEs, one chunk at
+a time. The denormalized tier on User and any cached entitlements are refreshed
+for the same chunk.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .entitlements import invalidate_entitlements
+from .models import UserSubscription
+
+User = get_user_model()
+
+
+def expired_trials(now):
+    return UserSubscription.objects.filter(status='trial', trial_end_date__lte=now)
+
+
+def expired_subscriptions(now):
+    """
+    Active subscriptions past their end date.
+    Auto-renewing subscriptions get a grace period for the renewal payment to arrive.
+    """
+    grace = timedelta(hours=settings.SUBSCRIPTION_RENEWAL_GRACE_HOURS)
+    return UserSubscription.objects.filter(status='active', end_date__lte=now).filter(
+        Q(auto_renew=False) | Q(end_date__lte=now - grace)
+    )
+
+
+def expiring_subscriptions(now, within):
+    """Trials and subscriptions that lapse within the given timedelta"""
+    return UserSubscription.objects.filter(
+        Q(status='trial', trial_end_date__gt=now, trial_end_date__lte=now + within) |
+        Q(status='active', end_date__gt=now, end_date__lte=now + within)
+    )
+
+
+def _expire_in_chunks(queryset, now, chunk_size):
+    expired = 0
+    while True:
+        pks = list(queryset.order_by('pk').values_list('pk', flat=True)[:chunk_size])
+        if not pks:
+            return expired
+        
+        with transaction.atomic():
+            # Lock the rows and re-apply the lapse conditions, so a subscription
+            # renewed since the read above is neither expired nor downgraded
+            lapsed = dict(queryset.filter(pk__in=pks).select_for_update().values_list('pk', 'user_id'))
+            UserSubscription.objects.filter(pk__in=lapsed).update(status='expired', updated_at=now)
+            User.objects.filter(pk__in=lapsed.values()).update(subscription_tier='free', updated_at=now)
+        expired += len(lapsed)
+        invalidate_entitlements(*lapsed.values())
+        
+        if len(pks) < chunk_size:
+            return expired
+
+
+def sweep_subscriptions(now=None, chunk_size=500):
+    """
+    Expire lapsed trials and subscriptions.
+    Returns a dict with the number of rows expired per kind.
+    """
+    now = now or timezone.now()
+    return {
+        'trials': _expire_in_chunks(expired_trials(now), now, chunk_size),
+        'subscriptions': _expire_in_chunks(expired_subscriptions(now), now, chunk_size),
+    }
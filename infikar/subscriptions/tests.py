@@ -1,3 +1,522 @@
-from django.test import TestCase
+import contextlib
+import json
+import threading
+import time
+from datetime import timedelta
+from unittest import mock, skipIf
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DatabaseError, connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import catalog, coupons, sweeper, webhooks
+from .entitlements import get_entitlements
+from .models import Coupon, Payment, SubscriptionPlan, UserSubscription, WebhookEvent
+from .webhooks import claim_pending_events, compute_signature, process_pending_events
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+User = get_user_model()
+
+WEBHOOK_SECRET = 'whsec_test'
+
+
+class FakeStripe:
+    """Local stand-in for the payment provider: builds and delivers signed events"""
+    
+    def __init__(self, client, secret=WEBHOOK_SECRET):
+        self.client = client
+        self.secret = secret
+        self.sequence = 0
+        self.clock = int(time.time()) - 3600
+    
+    def event(self, event_type, obj):
+        self.sequence += 1
+        self.clock += 1
+        return {
+            'id': f'evt_{self.sequence}',
+            'type': event_type,
+            'created': self.clock,
+            'data': {'object': obj},
+        }
+    
+    def deliver(self, event, secret=None):
+        payload = json.dumps(event).encode('utf-8')
+        timestamp = int(time.time())
+        signature = compute_signature(payload, timestamp, secret or self.secret)
+        return self.client.post(
+            reverse('subscriptions:stripe_webhook'),
+            data=payload,
+            content_type='application/json',
+            HTTP_STRIPE_SIGNATURE=f't={timestamp},v1={signature}',
+        )
+    
+    def invoice_paid(self, subscription_id, customer_id, amount=999, days=30, payment_intent=None, charge=None,
+                     event_type='invoice.paid', invoice_id=None, lines=True):
+        # A renewal invoice: the top-level period is the one just billed, the line covers the new one
+        now = int(time.time())
+        line_items = [{'type': 'subscription', 'period': {'start': now, 'end': now + days * 86400}}] if lines else []
+        return self.event(event_type, {
+            'id': invoice_id or f'in_{self.sequence + 1}',
+            'subscription': subscription_id,
+            'customer': customer_id,
+            'payment_intent': f'pi_{self.sequence + 1}' if payment_intent is None else payment_intent,
+            'charge': f'ch_{self.sequence + 1}' if charge is None else charge,
+            'amount_paid': amount,
+            'currency': 'usd',
+            'period_start': now - days * 86400,
+            'period_end': now,
+            'lines': {'data': line_items},
+        })
+    
+    def subscription_updated(self, subscription_id, customer_id, period_end, status='active'):
+        return self.event('customer.subscription.updated', {
+            'id': subscription_id,
+            'customer': customer_id,
+            'status': status,
+            'current_period_start': int(time.time()),
+            'current_period_end': int(period_end.timestamp()),
+        })
+    
+    def subscription_deleted(self, subscription_id, customer_id):
+        return self.event('customer.subscription.deleted', {
+            'id': subscription_id,
+            'customer': customer_id,
+            'status': 'canceled',
+        })
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET=WEBHOOK_SECRET)
+class WebhookIngestionTests(TestCase):
+
+    def setUp(self):
+        self.stripe = FakeStripe(self.client)
+        self.user = User.objects.create(email='creator@example.com', username='creator', is_active=True)
+        self.plan = SubscriptionPlan.objects.create(
+            name='Pro Monthly', plan_type='pro', billing_cycle='monthly',
+            price_monthly=9.99, card_limit=50, social_links_limit=15, picks_limit=200,
+        )
+        self.subscription = UserSubscription.objects.create(
+            user=self.user, plan=self.plan, status='active', billing_cycle='monthly',
+            end_date=timezone.now() + timedelta(days=1),
+            stripe_subscription_id='sub_1', stripe_customer_id='cus_1',
+        )
+    
+    def test_rejects_bad_signature(self):
+        response = self.stripe.deliver(self.stripe.invoice_paid('sub_1', 'cus_1'), secret='wrong')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(WebhookEvent.objects.exists())
+    
+    def test_redelivery_is_idempotent(self):
+        event = self.stripe.invoice_paid('sub_1', 'cus_1')
+        self.assertFalse(self.stripe.deliver(event).json()['duplicate'])
+        self.assertTrue(self.stripe.deliver(event).json()['duplicate'])
+        self.assertEqual(WebhookEvent.objects.count(), 1)
+        
+        process_pending_events(workers=1)
+        process_pending_events(workers=1)
+        self.assertEqual(Payment.objects.count(), 1)
+    
+    def test_invoice_paid_renews_and_records_payment(self):
+        self.stripe.deliver(self.stripe.invoice_paid('sub_1', 'cus_1', amount=999, days=30))
+        
+        self.assertEqual(process_pending_events(workers=1), 1)
+        
+        self.subscription.refresh_from_db()
+        self.user.refresh_from_db()
+        payment = Payment.objects.get()
+        self.assertGreater(self.subscription.end_date, timezone.now() + timedelta(days=29))
+        self.assertEqual(self.user.subscription_tier, 'pro')
+        self.assertEqual(payment.status, 'completed')
+        self.assertEqual(str(payment.amount), '9.99')
+        self.assertEqual(WebhookEvent.objects.get().status, 'processed')
+    
+    def test_renewal_invoice_extends_to_the_new_period(self):
+        self.subscription.end_date = timezone.now()
+        self.subscription.save()
+        
+        self.stripe.deliver(self.stripe.invoice_paid('sub_1', 'cus_1', days=30))
+        process_pending_events(workers=1)
+        
+        self.subscription.refresh_from_db()
+        self.assertGreater(self.subscription.end_date, timezone.now() + timedelta(days=29))
+        self.assertEqual(sweeper.sweep_subscriptions()['subscriptions'], 0)
+    
+    def test_invoice_without_lines_is_not_counted_twice(self):
+        period_end = timezone.now().replace(microsecond=0) + timedelta(days=31)
+        # The renewal also arrives as a subscription update, in either order
+        self.stripe.deliver(self.stripe.subscription_updated('sub_1', 'cus_1', period_end))
+        self.stripe.deliver(self.stripe.invoice_paid('sub_1', 'cus_1', lines=False))
+        self.stripe.deliver(self.stripe.subscription_updated('sub_1', 'cus_1', period_end))
+        
+        process_pending_events(workers=1)
+        
+        self.subscription.refresh_from_db()
+        self.assertEqual(self.subscription.end_date, period_end)
+        self.assertEqual(Payment.objects.get().billing_period_end, period_end)
+    
+    def test_invoice_without_lines_uses_the_expanded_subscription(self):
+        period_end = timezone.now().replace(microsecond=0) + timedelta(days=31)
+        subscription = self.stripe.subscription_updated('sub_1', 'cus_1', period_end)['data']['object']
+        event = self.stripe.invoice_paid('sub_1', 'cus_1', lines=False)
+        event['data']['object']['subscription'] = subscription
+        self.stripe.deliver(event)
+        
+        process_pending_events(workers=1)
+        
+        self.subscription.refresh_from_db()
+        self.assertEqual(self.subscription.end_date, period_end)
+    
+    def test_invoice_for_cancelled_subscription_is_ignored(self):
+        for status in ('cancelled', 'expired'):
+            self.subscription.status = status
+            self.subscription.save()
+            self.stripe.deliver(self.stripe.invoice_paid('sub_1', 'cus_1'))
+            
+            process_pending_events(workers=1)
+            
+            self.subscription.refresh_from_db()
+            self.user.refresh_from_db()
+            self.assertEqual(self.subscription.status, status)
+            self.assertEqual(self.user.subscription_tier, 'free')
+        self.assertFalse(Payment.objects.exists())
+        self.assertEqual(set(WebhookEvent.objects.values_list('status', flat=True)), {'ignored'})
+    
+    def test_zero_amount_invoice_keeps_earlier_payments(self):
+        self.stripe.deliver(self.stripe.invoice_paid('sub_1', 'cus_1'))
+        self.stripe.deliver(self.stripe.invoice_paid('sub_1', 'cus_1', amount=0, payment_intent='', charge=''))
+        
+        process_pending_events(workers=1)
+        
+        amounts = sorted(str(amount) for amount in Payment.objects.values_list('amount', flat=True))
+        self.assertEqual(amounts, ['0.00', '9.99'])
+    
+    def test_paid_and_payment_succeeded_record_one_payment(self):
+        self.stripe.deliver(self.stripe.invoice_paid('sub_1', 'cus_1', invoice_id='in_42'))
+        self.stripe.deliver(self.stripe.invoice_paid(
+            'sub_1', 'cus_1', invoice_id='in_42', event_type='invoice.payment_succeeded',
+        ))
+        
+        process_pending_events(workers=1)
+        
+        self.assertEqual(Payment.objects.get().stripe_invoice_id, 'in_42')
+    
+    def test_overlapping_runs_claim_disjoint_events(self):
+        self.stripe.deliver(self.stripe.invoice_paid('sub_1', 'cus_1'))
+        self.stripe.deliver(self.stripe.event('customer.created', {'id': 'cus_2', 'customer': 'cus_2'}))
+        
+        first = claim_pending_events(batch_size=1)
+        second = claim_pending_events()
+        
+        self.assertEqual([event.customer_id for event in first], ['cus_1'])
+        self.assertEqual([event.customer_id for event in second], ['cus_2'])
+        self.assertEqual(claim_pending_events(), [])
+        self.assertEqual(process_pending_events(workers=1), 0)
+    
+    @override_settings(WEBHOOK_CLAIM_TIMEOUT=60)
+    def test_claims_of_a_dead_run_are_taken_over(self):
+        self.stripe.deliver(self.stripe.invoice_paid('sub_1', 'cus_1'))
+        claim_pending_events(now=timezone.now() - timedelta(minutes=5))
+        
+        self.assertEqual(process_pending_events(workers=1), 1)
+        self.assertEqual(Payment.objects.count(), 1)
+    
+    def test_events_apply_in_order_per_customer(self):
+        self.stripe.deliver(self.stripe.invoice_paid('sub_1', 'cus_1'))
+        self.stripe.deliver(self.stripe.subscription_deleted('sub_1', 'cus_1'))
+        
+        process_pending_events(workers=1)
+        
+        self.subscription.refresh_from_db()
+        self.user.refresh_from_db()
+        self.assertEqual(self.subscription.status, 'cancelled')
+        self.assertEqual(self.user.subscription_tier, 'free')
+    
+    def test_unknown_events_are_ignored(self):
+        self.stripe.deliver(self.stripe.event('customer.created', {'id': 'cus_2'}))
+        
+        process_pending_events(workers=1)
+        
+        self.assertEqual(WebhookEvent.objects.get().status, 'ignored')
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET=WEBHOOK_SECRET)
+class ParallelWebhookProcessingTests(TransactionTestCase):
+    """process_pending_events with a thread pool, on committed rows each thread can see"""
+    
+    def test_customers_apply_in_parallel_and_in_order(self):
+        stripe = FakeStripe(self.client)
+        plan = SubscriptionPlan.objects.create(
+            name='Pro Monthly', plan_type='pro', billing_cycle='monthly',
+            price_monthly=9.99, card_limit=50, social_links_limit=15, picks_limit=200,
+        )
+        for i in range(6):
+            user = User.objects.create(email=f'creator{i}@example.com', username=f'creator{i}', is_active=True)
+            UserSubscription.objects.create(
+                user=user, plan=plan, status='active', billing_cycle='monthly',
+                end_date=timezone.now() + timedelta(days=1),
+                stripe_subscription_id=f'sub_{i}', stripe_customer_id=f'cus_{i}',
+            )
+            stripe.deliver(stripe.invoice_paid(f'sub_{i}', f'cus_{i}'))
+            stripe.deliver(stripe.subscription_deleted(f'sub_{i}', f'cus_{i}'))
+        
+        apply_in_order = webhooks._apply_in_order
+        lock = threading.Lock()
+        
+        def one_writer_at_a_time(events):
+            with lock:
+                return apply_in_order(events)
+        
+        with contextlib.ExitStack() as stack:
+            if connection.vendor == 'sqlite':
+                # SQLite's shared in-memory test database fails, rather than waits, on concurrent writes
+                stack.enter_context(mock.patch.object(webhooks, '_apply_in_order', one_writer_at_a_time))
+            self.assertEqual(process_pending_events(workers=3), 12)
+        
+        self.assertEqual(Payment.objects.count(), 6)
+        self.assertFalse(UserSubscription.objects.exclude(status='cancelled').exists())
+        self.assertFalse(WebhookEvent.objects.exclude(status='processed').exists())
+
+
+class SweeperTests(TestCase):
+
+    def setUp(self):
+        self.plan = SubscriptionPlan.objects.create(
+            name='Pro Monthly', plan_type='pro', billing_cycle='monthly',
+            price_monthly=9.99, card_limit=50, social_links_limit=15, picks_limit=200,
+        )
+        self.subscriptions = []
+        for i in range(3):
+            user = User.objects.create(
+                email=f'lapsed{i}@example.com', username=f'lapsed{i}', is_active=True, subscription_tier='pro',
+            )
+            self.subscriptions.append(UserSubscription.objects.create(
+                user=user, plan=self.plan, status='active', billing_cycle='monthly', auto_renew=False,
+                end_date=timezone.now() - timedelta(days=1),
+            ))
+    
+    def test_expires_lapsed_subscriptions_and_downgrades_users(self):
+        result = sweeper.sweep_subscriptions(chunk_size=2)
+        
+        self.assertEqual(result, {'trials': 0, 'subscriptions': 3})
+        self.assertEqual(UserSubscription.objects.filter(status='expired').count(), 3)
+        self.assertFalse(User.objects.exclude(subscription_tier='free').exists())
+    
+    def test_renewal_after_the_read_is_not_downgraded(self):
+        renewed = self.subscriptions[0]
+        atomic = transaction.atomic
+        
+        @contextlib.contextmanager
+        def renewal_commits_first():
+            # The payment lands between the sweeper's read and its transaction
+            renewed.renew(new_end_date=timezone.now() + timedelta(days=30))
+            with atomic():
+                yield
+        
+        with mock.patch.object(sweeper.transaction, 'atomic', renewal_commits_first):
+            result = sweeper.sweep_subscriptions()
+        
+        self.assertEqual(result['subscriptions'], 2)
+        renewed.refresh_from_db()
+        renewed.user.refresh_from_db()
+        self.assertEqual(renewed.status, 'active')
+        self.assertEqual(renewed.user.subscription_tier, 'pro')
+        self.assertEqual(User.objects.filter(subscription_tier='free').count(), 2)
+
+
+class EntitlementsTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        # Publish the new plan to this worker's catalog
+        with self.captureOnCommitCallbacks(execute=True):
+            self.plan = SubscriptionPlan.objects.create(
+                name='Pro Monthly', plan_type='pro', billing_cycle='monthly',
+                price_monthly=9.99, card_limit=50, social_links_limit=15, picks_limit=200, has_analytics=True,
+            )
+        self.user = User.objects.create(email='member@example.com', username='member', is_active=True)
+    
+    def fresh_user(self):
+        # Each request loads its own user object
+        return User.objects.get(pk=self.user.pk)
+    
+    def subscribe(self, **fields):
+        values = {'status': 'active', 'billing_cycle': 'monthly', 'end_date': timezone.now() + timedelta(days=30)}
+        values.update(fields)
+        return UserSubscription.objects.create(user=self.user, plan=self.plan, **values)
+    
+    def test_memoized_on_the_user(self):
+        user = self.fresh_user()
+        entitlements = get_entitlements(user)
+        
+        with self.assertNumQueries(0):
+            self.assertIs(get_entitlements(user), entitlements)
+    
+    def test_cache_is_reused_between_requests(self):
+        self.subscribe()
+        catalog.get_catalog()
+        user = self.fresh_user()
+        # Plans come from the in-process catalog, so resolving reads only the subscription
+        with self.assertNumQueries(1):
+            self.assertEqual(get_entitlements(user).card_limit, 50)
+        
+        user = self.fresh_user()
+        with self.assertNumQueries(0):
+            entitlements = get_entitlements(user)
+        self.assertEqual((entitlements.plan_id, entitlements.is_pro, entitlements.has_analytics), (self.plan.pk, True, True))
+    
+    def test_tier_change_invalidates(self):
+        self.assertFalse(get_entitlements(self.fresh_user()).is_pro)
+        
+        self.user.subscription_tier = 'pro'
+        self.user.save(update_fields=['subscription_tier'])
+        self.assertTrue(get_entitlements(self.fresh_user()).is_pro)
+        
+        # Saves that leave the tier alone keep the cached entry
+        self.user.first_name = 'Member'
+        self.user.save(update_fields=['first_name'])
+        user = self.fresh_user()
+        with self.assertNumQueries(0):
+            self.assertTrue(get_entitlements(user).is_pro)
+    
+    def test_subscription_change_invalidates(self):
+        subscription = self.subscribe()
+        self.assertTrue(get_entitlements(self.fresh_user()).is_pro)
+        
+        subscription.status = 'cancelled'
+        subscription.save()
+        self.assertFalse(get_entitlements(self.fresh_user()).is_pro)
+    
+    def test_plan_change_invalidates(self):
+        self.subscribe()
+        self.assertEqual(get_entitlements(self.fresh_user()).card_limit, 50)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.plan.card_limit = 80
+            self.plan.save()
+        self.assertEqual(get_entitlements(self.fresh_user()).card_limit, 80)
+    
+    def test_sweeper_invalidates(self):
+        self.user.subscription_tier = 'pro'
+        self.user.save()
+        self.subscribe(auto_renew=False, end_date=timezone.now() + timedelta(hours=1))
+        self.assertTrue(get_entitlements(self.fresh_user()).is_pro)
+        
+        sweeper.sweep_subscriptions(now=timezone.now() + timedelta(hours=2))
+        self.assertFalse(get_entitlements(self.fresh_user()).is_pro)
+
+
+class PlanCatalogTests(TestCase):
+
+    def test_new_version_is_published_after_the_commit(self):
+        plan = SubscriptionPlan.objects.create(
+            name='Pro Monthly', plan_type='pro', billing_cycle='monthly',
+            price_monthly=9.99, card_limit=50, social_links_limit=15, picks_limit=200,
+        )
+        version = catalog.get_catalog().version
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            plan.price_monthly = 12
+            plan.save()
+            self.assertEqual(catalog.get_catalog().version, version)
+        
+        self.assertNotEqual(catalog.get_catalog().version, version)
+        self.assertEqual([str(p.price_monthly) for p in catalog.get_catalog().plans], ['12.00'])
+
+
+@skipIf(fakeredis is None, 'fakeredis is not installed')
+class CouponRedemptionTests(TestCase):
+    """Reservations and confirmations against an in-process Redis with Lua support"""
+    
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        patcher = mock.patch.object(coupons, 'get_redis', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.coupon = Coupon.objects.create(
+            code='LAUNCH', name='Launch', coupon_type='percentage', discount_value=20, usage_limit=3,
+            valid_from=timezone.now() - timedelta(days=1), valid_until=timezone.now() + timedelta(days=1),
+        )
+    
+    def reserve(self, timeout=None):
+        try:
+            return coupons.reserve_coupon(self.coupon, timeout=timeout)
+        except coupons.CouponUnavailable:
+            return None
+    
+    def test_concurrent_reservations_never_exceed_the_limit(self):
+        results = []
+        start = threading.Barrier(20)
+        
+        def reserve():
+            start.wait()
+            results.append(self.reserve())
+        
+        threads = [threading.Thread(target=reserve) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(sum(result is not None for result in results), 3)
+    
+    def test_a_reservation_is_confirmed_once(self):
+        reservation = self.reserve()
+        
+        self.assertTrue(coupons.confirm_reservation(reservation))
+        self.assertFalse(coupons.confirm_reservation(reservation))
+        self.assertEqual(int(self.redis.get(coupons._used_key(self.coupon.pk))), 1)
+    
+    def test_released_reservations_free_their_use(self):
+        held = [self.reserve() for _ in range(3)]
+        self.assertIsNone(self.reserve())
+        
+        coupons.release_reservation(held[0])
+        
+        self.assertIsNotNone(self.reserve())
+    
+    def test_uses_confirmed_while_redis_was_down_still_count(self):
+        coupons.confirm_reservation(self.reserve())
+        coupons.reconcile_coupon_usage()
+        
+        with mock.patch.object(coupons, 'get_redis', return_value=None):
+            self.coupon.refresh_from_db()
+            self.assertTrue(coupons.confirm_reservation(coupons.reserve_coupon(self.coupon)))
+        
+        self.coupon.refresh_from_db()
+        self.assertEqual(self.coupon.used_count, 2)
+        self.assertIsNotNone(self.reserve())
+        self.assertIsNone(self.reserve())
+    
+    def test_database_confirmations_raise_the_redis_counter(self):
+        self.reserve()
+        reservation = coupons.Reservation(self.coupon.pk, 'token', timezone.now(), 'database')
+        
+        self.assertTrue(coupons.confirm_reservation(reservation))
+        
+        self.assertEqual(int(self.redis.get(coupons._used_key(self.coupon.pk))), 1)
+    
+    def test_a_shorter_reservation_keeps_the_longer_ones_alive(self):
+        self.reserve(timeout=600)
+        self.reserve(timeout=60)
+        
+        self.assertGreater(self.redis.pttl(coupons._reservations_key(self.coupon.pk)), 500 * 1000)
+    
+    def test_reconcile_copies_counts_and_keeps_ids_when_the_update_fails(self):
+        coupons.confirm_reservation(self.reserve())
+        
+        with mock.patch.object(Coupon.objects, 'filter', side_effect=DatabaseError('down')):
+            with self.assertRaises(DatabaseError):
+                coupons.reconcile_coupon_usage()
+        self.assertEqual(self.redis.smembers(coupons.DIRTY_SET_KEY), {str(self.coupon.pk).encode()})
+        
+        self.assertEqual(coupons.reconcile_coupon_usage(), 1)
+        self.coupon.refresh_from_db()
+        self.assertEqual(self.coupon.used_count, 1)
+        self.assertFalse(self.redis.smembers(coupons.DIRTY_SET_KEY))
@@ -6,4 +6,7 @@ app_name = 'subscriptions'
 urlpatterns = [
     # Subscription plans
     path('', views.PlanListView.as_view(), name='plan_list'),
+    
+    # Payment provider webhooks
+    path('webhooks/stripe/', views.stripe_webhook, name='stripe_webhook'),
 ]
@@ -1,5 +1,44 @@
+import json
+
+from django.http import HttpResponse, JsonResponse
 from django.shortcuts import render
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
 from django.views.generic import TemplateView
 
+from infikar.db.routers import use_replica
+from .catalog import get_catalog
+from .webhooks import WebhookSignatureError, record_event, verify_signature
+
+
+@method_decorator(use_replica, name='dispatch')
 class PlanListView(TemplateView):
-    template_name = 'subscriptions/plan_list.html'
\ No newline at end of file
+    template_name = 'subscriptions/plan_list.html'
+    
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['plans'] = get_catalog().active_plans()
+        return context
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def stripe_webhook(request):
+    """
+    Payment provider webhook intake.
+    Verifies the signature and stores the raw event; state changes are applied
+    asynchronously by the process_webhooks command.
+    """
+    payload = request.body
+    try:
+        verify_signature(payload, request.headers.get('Stripe-Signature', ''))
+    except WebhookSignatureError as e:
+        return HttpResponse(str(e), status=400, content_type='text/plain')
+    
+    try:
+        event, created = record_event(payload, provider='stripe')
+    except (json.JSONDecodeError, KeyError):
+        return HttpResponse('Invalid payload', status=400, content_type='text/plain')
+    
+    return JsonResponse({'received': True, 'duplicate': not created})
@@ -0,0 +1,370 @@
+"""
+Payment provider webhook ingestion.
+
+The endpoint only verifies the signature and stores the raw event; a unique
+constraint on event_id makes redelivery idempotent. Events are applied later by
+`process_pending_events` (see the process_webhooks command), which keeps events
+for the same customer in order while different customers run in parallel.
+Each run claims its events first ('pending' -> 'processing'), so overlapping
+runs never apply the same event twice.
+"""
+import hashlib
+import hmac
+import json
+import logging
+import time
+import zlib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Payment, UserSubscription, WebhookEvent
+
+User = get_user_model()
+logger = logging.getLogger(__name__)
+
+
+class WebhookSignatureError(Exception):
+    """Raised when a webhook payload does not carry a valid signature"""
+
+
+def compute_signature(payload, timestamp, secret):
+    """Stripe-style v1 signature: HMAC-SHA256 over '<timestamp>.<payload>'"""
+    signed = f'{timestamp}.'.encode('utf-8') + payload
+    return hmac.new(secret.encode('utf-8'), signed, hashlib.sha256).hexdigest()
+
+
+def verify_signature(payload, header, secret=None, tolerance=None, now=None):
+    """Verify a `Stripe-Signature` header (t=<timestamp>,v1=<signature>[,v1=...])"""
+    secret = secret if secret is not None else settings.STRIPE_WEBHOOK_SECRET
+    tolerance = tolerance if tolerance is not None else settings.STRIPE_WEBHOOK_TOLERANCE
+    if not secret:
+        raise WebhookSignatureError('Webhook secret is not configured')
+    
+    timestamp = None
+    signatures = []
+    for part in (header or '').split(','):
+        key, _, value = part.strip().partition('=')
+        if key == 't':
+            timestamp = value
+        elif key == 'v1':
+            signatures.append(value)
+    
+    if not timestamp or not signatures:
+        raise WebhookSignatureError('Malformed signature header')
+    
+    try:
+        age = (now or time.time()) - int(timestamp)
+    except ValueError:
+        raise WebhookSignatureError('Malformed signature timestamp')
+    if abs(age) > tolerance:
+        raise WebhookSignatureError('Signature timestamp outside tolerance')
+    
+    expected = compute_signature(payload, timestamp, secret)
+    if not any(hmac.compare_digest(expected, signature) for signature in signatures):
+        raise WebhookSignatureError('Signature mismatch')
+
+
+def _from_timestamp(value):
+    if value in (None, ''):
+        return None
+    return datetime.fromtimestamp(int(value), tz=dt_timezone.utc)
+
+
+def record_event(payload, provider='stripe'):
+    """
+    Persist a verified raw event.
+    Returns (event, created); redelivered events return the stored row.
+    """
+    data = json.loads(payload)
+    obj = data.get('data', {}).get('object', {})
+    customer_id = obj.get('customer') or ''
+    if isinstance(customer_id, dict):
+        customer_id = customer_id.get('id', '')
+    
+    try:
+        with transaction.atomic():
+            event = WebhookEvent.objects.create(
+                provider=provider,
+                event_id=data['id'],
+                event_type=data.get('type', ''),
+                customer_id=customer_id,
+                payload=data,
+                provider_created_at=_from_timestamp(data.get('created')),
+            )
+        return event, True
+    except IntegrityError:
+        return WebhookEvent.objects.get(event_id=data['id']), False
+
+
+# State transitions
+
+
+def _sync_user_tier(subscription):
+    """Mirror a subscription's state onto the denormalized User fields"""
+    if subscription.status == 'active':
+        fields = {'subscription_tier': 'pro', 'subscription_end_date': subscription.end_date}
+    elif subscription.status == 'trial':
+        fields = {'subscription_tier': 'pro_trial', 'trial_end_date': subscription.trial_end_date}
+    else:
+        fields = {'subscription_tier': 'free'}
+    
+    user = subscription.user
+    for name, value in fields.items():
+        setattr(user, name, value)
+    user.save(update_fields=[*fields, 'updated_at'])
+
+
+def _get_subscription(stripe_subscription_id):
+    if not stripe_subscription_id:
+        return None
+    return (
+        UserSubscription.objects
+        .select_for_update()
+        .select_related('user')
+        .filter(stripe_subscription_id=stripe_subscription_id)
+        .first()
+    )
+
+
+def _invoice_period(obj):
+    """
+    (start, end) of the service period an invoice pays for, from its line items,
+    or else from the subscription object when the invoice has it expanded.
+    The invoice's own period_start/period_end cover the period just billed, so
+    at renewal period_end is about now, not the new end date.
+    """
+    periods = [
+        line['period'] for line in (obj.get('lines') or {}).get('data', [])
+        if line.get('period')
+    ]
+    if periods:
+        return (
+            _from_timestamp(min(period['start'] for period in periods)),
+            _from_timestamp(max(period['end'] for period in periods)),
+        )
+    
+    subscription = obj.get('subscription')
+    if isinstance(subscription, dict) and subscription.get('current_period_end'):
+        return (
+            _from_timestamp(subscription.get('current_period_start')),
+            _from_timestamp(subscription['current_period_end']),
+        )
+    return None, None
+
+
+def handle_invoice_paid(obj):
+    subscription = obj.get('subscription')
+    if isinstance(subscription, dict):
+        subscription = subscription.get('id')
+    subscription = _get_subscription(subscription)
+    # A closing invoice must not bring back a cancelled or ended subscription;
+    # a reactivation arrives as customer.subscription.updated
+    if subscription is None or subscription.status in ('cancelled', 'expired'):
+        return False
+    
+    period_start, period_end = _invoice_period(obj)
+    if period_end is not None:
+        subscription.renew(new_end_date=period_end)
+    elif subscription.status != 'active':
+        # No period to go by: customer.subscription.updated carries the new
+        # end date, so extending here as well would count the renewal twice
+        subscription.status = 'active'
+        subscription.save()
+    _sync_user_tier(subscription)
+    
+    fields = {
+        'user_id': subscription.user_id,
+        'stripe_payment_intent_id': obj.get('payment_intent') or '',
+        'stripe_charge_id': obj.get('charge') or '',
+        'amount': Decimal(obj.get('amount_paid', 0)) / 100,
+        'currency': (obj.get('currency') or 'usd').upper(),
+        'status': 'completed',
+        'billing_period_start': period_start or timezone.now(),
+        'billing_period_end': subscription.end_date,
+        'completed_at': timezone.now(),
+    }
+    invoice_id = obj.get('id') or ''
+    if invoice_id:
+        # invoice.paid and invoice.payment_succeeded both arrive for one invoice
+        Payment.objects.update_or_create(
+            subscription=subscription, stripe_invoice_id=invoice_id, defaults=fields,
+        )
+    else:
+        Payment.objects.create(subscription=subscription, **fields)
+    return True
+
+
+def handle_invoice_payment_failed(obj):
+    updated = Payment.objects.filter(
+        stripe_payment_intent_id=obj.get('payment_intent') or '',
+    ).exclude(stripe_payment_intent_id='').update(status='failed', updated_at=timezone.now())
+    return bool(updated)
+
+
+def handle_charge_refunded(obj):
+    updated = Payment.objects.filter(
+        stripe_charge_id=obj.get('id') or '',
+    ).exclude(stripe_charge_id='').update(status='refunded', updated_at=timezone.now())
+    return bool(updated)
+
+
+# Provider subscription status -> UserSubscription.status
+SUBSCRIPTION_STATUSES = {
+    'active': 'active',
+    'trialing': 'trial',
+    'canceled': 'cancelled',
+    'incomplete': 'pending',
+    'incomplete_expired': 'expired',
+    'unpaid': 'expired',
+}
+
+
+def handle_subscription_updated(obj):
+    subscription = _get_subscription(obj.get('id'))
+    if subscription is None:
+        return False
+    
+    status = SUBSCRIPTION_STATUSES.get(obj.get('status'))
+    if status:
+        subscription.status = status
+    if obj.get('current_period_end'):
+        subscription.end_date = _from_timestamp(obj['current_period_end'])
+    if obj.get('trial_end'):
+        subscription.trial_end_date = _from_timestamp(obj['trial_end'])
+    subscription.auto_renew = not obj.get('cancel_at_period_end', False)
+    subscription.save()
+    _sync_user_tier(subscription)
+    return True
+
+
+def handle_subscription_deleted(obj):
+    subscription = _get_subscription(obj.get('id'))
+    if subscription is None:
+        return False
+    
+    subscription.cancel()
+    _sync_user_tier(subscription)
+    return True
+
+
+EVENT_HANDLERS = {
+    'invoice.paid': handle_invoice_paid,
+    'invoice.payment_succeeded': handle_invoice_paid,
+    'invoice.payment_failed': handle_invoice_payment_failed,
+    'charge.refunded': handle_charge_refunded,
+    'customer.subscription.updated': handle_subscription_updated,
+    'customer.subscription.deleted': handle_subscription_deleted,
+}
+
+
+def apply_event(event):
+    """Apply one claimed event. Returns True if the event was processed without error."""
+    handler = EVENT_HANDLERS.get(event.event_type)
+    event.attempts += 1
+    try:
+        with transaction.atomic():
+            applied = handler(event.payload.get('data', {}).get('object', {})) if handler else False
+    except Exception as e:
+        logger.exception('Failed to apply webhook event %s', event.event_id)
+        event.last_error = str(e)
+        event.status = 'failed' if event.attempts >= settings.WEBHOOK_MAX_ATTEMPTS else 'pending'
+        event.save(update_fields=['attempts', 'last_error', 'status'])
+        return False
+    
+    event.status = 'processed' if applied else 'ignored'
+    event.last_error = ''
+    event.processed_at = timezone.now()
+    event.save(update_fields=['attempts', 'last_error', 'status', 'processed_at'])
+    return True
+
+
+def claim_pending_events(batch_size=500, now=None):
+    """
+    Claim up to `batch_size` pending events for this run, oldest first, by
+    moving them to 'processing'. Customers with events claimed by another run
+    are skipped so their events stay in order. Claims older than
+    WEBHOOK_CLAIM_TIMEOUT (the run died) are taken over.
+    """
+    now = now or timezone.now()
+    stale = now - timedelta(seconds=settings.WEBHOOK_CLAIM_TIMEOUT)
+    claimable = Q(status='pending') | Q(status='processing', claimed_at__lt=stale)
+    in_flight = WebhookEvent.objects.filter(status='processing', claimed_at__gte=stale).values('customer_id')
+    
+    with transaction.atomic():
+        pks = list(
+            WebhookEvent.objects
+            .filter(claimable)
+            .exclude(customer_id__in=in_flight)
+            .order_by('provider_created_at', 'id')
+            .select_for_update(skip_locked=True)
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        WebhookEvent.objects.filter(claimable, pk__in=pks).update(status='processing', claimed_at=now)
+    
+    # Rows another run claimed between the read and the UPDATE carry its timestamp, not ours
+    return list(
+        WebhookEvent.objects
+        .filter(pk__in=pks, status='processing', claimed_at=now)
+        .order_by('provider_created_at', 'id')
+    )
+
+
+def _apply_in_order(events):
+    """
+    Apply one worker's claimed events sequentially.
+    A failing event holds back later events for the same customer until it is retried.
+    """
+    blocked = set()
+    held_back = []
+    applied = 0
+    try:
+        for event in events:
+            if event.customer_id in blocked:
+                held_back.append(event.pk)
+                continue
+            if apply_event(event):
+                applied += 1
+            else:
+                blocked.add(event.customer_id)
+    finally:
+        # Held-back events go back to the queue, behind the failed event
+        WebhookEvent.objects.filter(pk__in=held_back, status='processing').update(status='pending')
+    return applied
+
+
+def _apply_in_thread(events):
+    try:
+        return _apply_in_order(events)
+    finally:
+        # The pool thread is discarded; close_old_connections() would keep its
+        # connection open while CONN_MAX_AGE allows
+        connection.close()
+
+
+def process_pending_events(workers=4, batch_size=500):
+    """
+    Claim and apply a batch of pending events with a pool of worker threads.
+    Events are partitioned by customer so each customer's events stay in order.
+    Returns the number of events applied.
+    """
+    events = claim_pending_events(batch_size)
+    if not events:
+        return 0
+    
+    if workers == 1:
+        return _apply_in_order(events)
+    
+    partitions = defaultdict(list)
+    for event in events:
+        partitions[zlib.crc32(event.customer_id.encode('utf-8')) % workers].append(event)
+    
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return sum(pool.map(_apply_in_thread, partitions.values()))
@@ -0,0 +1,720 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from unittest import mock, skipIf
+
+import redis
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from infikar import cache as cache_module
+from infikar import health
+from infikar import ratelimit
+from infikar.analytics.models import AnalyticsEvent
+from infikar.cache import LOCAL, REDIS, FailoverCache
+from infikar.cards.models import Card
+from infikar.db import pool as pool_module
+from infikar.db import routers
+from infikar.db.pool import ConnectionPool, PoolTimeout, get_pool
+from infikar.db.routers import PIN_COOKIE, ReplicaPinMiddleware, ReplicaRouter, use_replica
+from infikar.metrics import POOL_WORKER_GAUGES, PoolCollector, metrics_view
+from infikar.startup import Import, by_package, parse_importtime, profile_startup
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+class FakeConnection:
+
+    def __init__(self, number):
+        self.number = number
+        self.closed = False
+    
+    def close(self):
+        self.closed = True
+
+
+class FakeConnect:
+    """connect() stand-in numbering the connections it opens"""
+    
+    def __init__(self):
+        self.opened = []
+    
+    def __call__(self):
+        connection = FakeConnection(len(self.opened))
+        self.opened.append(connection)
+        return connection
+
+
+class Clock:
+    """time module stand-in whose monotonic clock only moves when told to"""
+    
+    def __init__(self):
+        self.now = 1000.0
+    
+    def monotonic(self):
+        return self.now
+
+
+class ConnectionPoolTests(SimpleTestCase):
+
+    def setUp(self):
+        self.connect = FakeConnect()
+        self.clock = Clock()
+        patcher = mock.patch.object(pool_module, 'time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def test_checkout_and_return(self):
+        pool = ConnectionPool(max_size=2)
+        
+        first, reused = pool.acquire(self.connect)
+        self.assertFalse(reused)
+        second, _ = pool.acquire(self.connect)
+        self.assertEqual(pool.stats()['in_use'], 2)
+        
+        pool.release(first)
+        pool.release(second)
+        self.assertEqual(pool.stats()['idle'], 2)
+        
+        # LIFO: the connection returned last is handed out first
+        connection, reused = pool.acquire(self.connect)
+        self.assertIs(connection, second)
+        self.assertTrue(reused)
+        self.assertEqual(len(self.connect.opened), 2)
+        self.assertEqual(pool.stats()['checkouts'], 3)
+    
+    def test_unusable_connection_is_closed(self):
+        pool = ConnectionPool()
+        connection, _ = pool.acquire(self.connect)
+        
+        pool.release(connection, reusable=False)
+        
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.size, 0)
+    
+    def test_max_lifetime(self):
+        pool = ConnectionPool(max_lifetime=60, max_idle=600)
+        connection, _ = pool.acquire(self.connect)
+        
+        # Past its lifetime a connection is closed on release...
+        self.clock.now += 61
+        pool.release(connection)
+        self.assertTrue(connection.closed)
+        
+        # ...or when it ages out while idle
+        connection, _ = pool.acquire(self.connect)
+        pool.release(connection)
+        self.clock.now += 61
+        replacement, reused = pool.acquire(self.connect)
+        self.assertTrue(connection.closed)
+        self.assertIsNot(replacement, connection)
+        self.assertFalse(reused)
+    
+    def test_max_idle(self):
+        pool = ConnectionPool(max_idle=30)
+        connection, _ = pool.acquire(self.connect)
+        pool.release(connection)
+        
+        self.clock.now += 29
+        self.assertIs(pool.acquire(self.connect)[0], connection)
+        pool.release(connection)
+        
+        self.clock.now += 30
+        self.assertIsNot(pool.acquire(self.connect)[0], connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.stats()['connections_closed'], 1)
+    
+    def test_failed_health_check_replaces_connection(self):
+        check = mock.Mock(side_effect=Exception('gone away'))
+        pool = ConnectionPool(check=check, check_interval=10)
+        connection, _ = pool.acquire(self.connect)
+        pool.release(connection)
+        
+        # Checked only once it has been idle for check_interval
+        self.clock.now += 5
+        self.assertIs(pool.acquire(self.connect)[0], connection)
+        check.assert_not_called()
+        pool.release(connection)
+        
+        self.clock.now += 10
+        replacement, reused = pool.acquire(self.connect)
+        check.assert_called_once_with(connection)
+        self.assertIsNot(replacement, connection)
+        self.assertFalse(reused)
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.stats()['health_check_failures'], 1)
+        self.assertEqual(pool.size, 1)
+    
+    def test_failed_connect_frees_its_slot(self):
+        pool = ConnectionPool(max_size=1)
+        
+        with self.assertRaises(ConnectionError):
+            pool.acquire(mock.Mock(side_effect=ConnectionError))
+        
+        self.assertEqual(pool.size, 0)
+        pool.acquire(self.connect)
+    
+    def test_released_by_fork_child(self):
+        pool = ConnectionPool()
+        connection, _ = pool.acquire(self.connect)
+        
+        # A connection inherited by a forked worker is never pooled there
+        with mock.patch.object(pool_module.os, 'getpid', return_value=pool.pid + 1):
+            pool.release(connection)
+        
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.stats()['idle'], 0)
+    
+    def test_get_pool_after_fork(self):
+        self.addCleanup(pool_module._pools.pop, 'test', None)
+        pool = get_pool('test', max_size=3)
+        self.assertIs(get_pool('test'), pool)
+        
+        with mock.patch.object(pool_module.os, 'getpid', return_value=pool.pid + 1):
+            child_pool = get_pool('test', max_size=3)
+        
+        self.assertIsNot(child_pool, pool)
+        self.assertEqual(child_pool.max_size, 3)
+
+
+class ConnectionPoolTimeoutTests(SimpleTestCase):
+    """Waiting for a connection, on the real clock"""
+    
+    def test_timeout(self):
+        pool = ConnectionPool(max_size=1, timeout=0.05)
+        connect = FakeConnect()
+        pool.acquire(connect)
+        
+        with self.assertRaises(PoolTimeout):
+            pool.acquire(connect)
+        
+        self.assertEqual(pool.stats()['timeouts'], 1)
+        self.assertEqual(len(connect.opened), 1)
+    
+    def test_waiter_gets_released_connection(self):
+        pool = ConnectionPool(max_size=1, timeout=5)
+        connect = FakeConnect()
+        connection, _ = pool.acquire(connect)
+        
+        timer = threading.Timer(0.05, pool.release, args=(connection,))
+        timer.start()
+        self.addCleanup(timer.cancel)
+        
+        self.assertIs(pool.acquire(connect)[0], connection)
+        stats = pool.stats()
+        self.assertEqual(stats['waits'], 1)
+        self.assertGreater(stats['wait_time_max'], 0)
+
+
+class FlakyRedisCache:
+    """RedisCache stand-in backed by a dict, raising connection errors while `down`"""
+    
+    down = False
+    
+    def __init__(self, server, params):
+        self.data = {}
+        self.client = mock.Mock()
+        self.client.get_client.return_value.ping.side_effect = self._check
+    
+    def _check(self):
+        if self.down:
+            raise redis.ConnectionError('Connection refused')
+        return True
+    
+    def get(self, key, default=None, version=None):
+        self._check()
+        return self.data.get(key, default)
+    
+    def set(self, key, value, timeout=None, version=None):
+        self._check()
+        self.data[key] = value
+    
+    def delete_many(self, keys, version=None):
+        self._check()
+        for key in keys:
+            self.data.pop(key, None)
+    
+    def delete_pattern(self, pattern, version=None):
+        self._check()
+        self.data.clear()
+
+
+class FailoverCacheTests(SimpleTestCase):
+    
+    def setUp(self):
+        patcher = mock.patch.object(cache_module, 'RedisCache', FlakyRedisCache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = FailoverCache('redis://127.0.0.1:6379/0', {'OPTIONS': {'HEALTH_CHECK_INTERVAL': 0.01}})
+        self.redis = self.cache._redis
+    
+    def wait_for_mode(self, mode):
+        deadline = time.monotonic() + 5
+        while self.cache.mode != mode and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.cache.mode, mode)
+    
+    def test_fail_over_and_recover(self):
+        self.cache.set('key', 'from redis')
+        self.assertEqual(self.redis.data, {'key': 'from redis'})
+        self.assertIsNotNone(self.cache.get_redis())
+        
+        self.redis.down = True
+        self.assertIsNone(self.cache.get('key'))
+        self.assertEqual(self.cache.mode, LOCAL)
+        self.assertEqual(self.cache.failovers, 1)
+        self.assertIn('ConnectionError', self.cache.last_error)
+        self.assertIsNone(self.cache.get_redis())
+        
+        # Served from local memory while Redis is down
+        self.cache.set('key', 'local')
+        self.assertEqual(self.cache.get('key'), 'local')
+        self.assertEqual(self.redis.data, {'key': 'from redis'})
+        
+        self.redis.down = False
+        self.wait_for_mode(REDIS)
+        self.assertEqual(self.cache.recoveries, 1)
+        self.assertEqual(self.cache.stats()['mode'], REDIS)
+        
+        # Local entries may be stale by now and are dropped, and so is the
+        # Redis copy of a key written while it was down
+        self.assertIsNone(self.cache._local.get('key'))
+        self.assertEqual(self.redis.data, {})
+        self.assertIsNotNone(self.cache.get_redis())
+    
+    def test_writes_during_the_outage_are_replayed(self):
+        self.cache.set('version', 'v1')
+        self.cache.set('entitlements:1', 'pro')
+        self.cache.set('untouched', 'kept')
+        
+        self.redis.down = True
+        self.cache.get('version')
+        self.cache.set('version', 'v2')
+        self.cache.delete('entitlements:1')
+        
+        self.redis.down = False
+        self.wait_for_mode(REDIS)
+        
+        # Redis no longer serves the values from before the outage
+        self.assertIsNone(self.cache.get('version'))
+        self.assertIsNone(self.cache.get('entitlements:1'))
+        self.assertEqual(self.cache.get('untouched'), 'kept')
+    
+    def test_too_many_writes_flush_the_cache(self):
+        self.cache.max_replayed_keys = 2
+        self.cache.set('untouched', 'dropped')
+        
+        self.redis.down = True
+        self.cache.get('untouched')
+        for i in range(3):
+            self.cache.set(f'key{i}', i)
+        
+        self.redis.down = False
+        self.wait_for_mode(REDIS)
+        
+        self.assertEqual(self.redis.data, {})
+    
+    def test_stays_local_while_redis_is_down(self):
+        self.redis.down = True
+        self.cache.set('key', 'local')
+        
+        time.sleep(0.05)
+        self.assertEqual(self.cache.mode, LOCAL)
+        self.assertEqual(self.cache.failovers, 1)
+        self.assertEqual(self.cache.get('key'), 'local')
+        self.assertGreater(self.redis.client.get_client.return_value.ping.call_count, 1)
+        
+        self.redis.down = False
+        self.wait_for_mode(REDIS)
+
+
+class PoolCollectorTests(SimpleTestCase):
+    
+    def test_reports_pool_stats(self):
+        self.addCleanup(pool_module._pools.pop, 'test', None)
+        pool = get_pool('test', max_size=3)
+        connect = FakeConnect()
+        first, _ = pool.acquire(connect)
+        pool.acquire(connect)
+        pool.release(first, reusable=False)
+        
+        samples = {
+            sample.name: sample.value
+            for family in PoolCollector().collect()
+            for sample in family.samples
+            if sample.labels == {'alias': 'test'}
+        }
+        
+        self.assertEqual(samples['infikar_db_pool_connections_in_use'], 1)
+        self.assertEqual(samples['infikar_db_pool_connections_idle'], 0)
+        self.assertEqual(samples['infikar_db_pool_connections_max'], 3)
+        self.assertEqual(samples['infikar_db_pool_connections_opened_total'], 2)
+        self.assertEqual(samples['infikar_db_pool_connections_closed_total'], 1)
+        self.assertEqual(samples['infikar_db_pool_waits_total'], 0)
+    
+    def test_multiprocess_mode_publishes_worker_gauges(self):
+        self.addCleanup(pool_module._pools.pop, 'test', None)
+        pool = get_pool('test', max_size=3)
+        pool.acquire(FakeConnect())
+        
+        # Reported by MultiProcessCollector from the shared files, not by the collector itself
+        self.assertEqual(PoolCollector(multiprocess=True).collect(), [])
+        
+        self.assertEqual(POOL_WORKER_GAUGES['in_use'].labels(alias='test')._value.get(), 1)
+        self.assertEqual(POOL_WORKER_GAUGES['connections_opened'].labels(alias='test')._value.get(), 1)
+        self.assertEqual(POOL_WORKER_GAUGES['in_use']._multiprocess_mode, 'livesum')
+
+
+class MetricsViewTests(SimpleTestCase):
+    
+    def get(self, token=None):
+        headers = {'Authorization': f'Bearer {token}'} if token else {}
+        return metrics_view(RequestFactory().get('/metrics', headers=headers))
+    
+    @override_settings(METRICS_TOKEN='secret', DEBUG=False)
+    def test_token_required(self):
+        self.assertEqual(self.get().status_code, 403)
+        self.assertEqual(self.get('wrong').status_code, 403)
+        self.assertEqual(self.get('secret').status_code, 200)
+    
+    @override_settings(METRICS_TOKEN='', DEBUG=False)
+    def test_no_token_outside_debug(self):
+        self.assertEqual(self.get().status_code, 403)
+    
+    @override_settings(METRICS_TOKEN='', DEBUG=True)
+    def test_no_token_in_debug(self):
+        self.assertEqual(self.get().status_code, 200)
+
+
+@override_settings(
+    RATELIMIT_ENABLE=True, RATELIMIT_TRUST_X_FORWARDED_FOR=True, RATELIMIT_PROXY_COUNT=1, RATELIMITS={'test': '2/m'},
+)
+class RateLimitTests(SimpleTestCase):
+    """Token buckets on the in-process fallback; RedisRateLimitTests reruns them against Redis"""
+    
+    def setUp(self):
+        patcher = mock.patch.object(ratelimit, 'get_redis', return_value=self.redis())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(ratelimit, '_local_buckets', ratelimit.LocalTokenBuckets())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def redis(self):
+        return None
+    
+    def request(self, forwarded='203.0.113.7'):
+        return RequestFactory().post('/', REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR=forwarded)
+    
+    def limited(self, request):
+        return ratelimit.is_rate_limited(request, 'test')[0]
+    
+    def test_limit(self):
+        self.assertFalse(self.limited(self.request()))
+        self.assertFalse(self.limited(self.request()))
+        
+        limited, retry_after = ratelimit.is_rate_limited(self.request(), 'test')
+        self.assertTrue(limited)
+        self.assertGreater(retry_after, 0)
+        
+        # Other clients have buckets of their own
+        self.assertFalse(self.limited(self.request('203.0.113.8')))
+    
+    def test_spoofed_forwarded_for_keeps_the_bucket(self):
+        for spoofed in ('1.1.1.1', '2.2.2.2'):
+            self.assertFalse(self.limited(self.request(f'{spoofed}, 203.0.113.7')))
+        self.assertTrue(self.limited(self.request('3.3.3.3, 203.0.113.7')))
+    
+    def test_client_ip(self):
+        self.assertEqual(ratelimit.client_ip(self.request('1.1.1.1, 203.0.113.7')), '203.0.113.7')
+        with self.settings(RATELIMIT_PROXY_COUNT=2):
+            self.assertEqual(ratelimit.client_ip(self.request('1.1.1.1, 203.0.113.7, 10.0.0.2')), '203.0.113.7')
+            # Fewer entries than proxies means the header did not come through them
+            self.assertEqual(ratelimit.client_ip(self.request('203.0.113.7')), '10.0.0.1')
+        with self.settings(RATELIMIT_TRUST_X_FORWARDED_FOR=False):
+            self.assertEqual(ratelimit.client_ip(self.request()), '10.0.0.1')
+
+
+@skipIf(fakeredis is None, 'fakeredis is not installed')
+class RedisRateLimitTests(RateLimitTests):
+    
+    def redis(self):
+        return fakeredis.FakeRedis()
+    
+    def test_buckets_live_in_redis(self):
+        self.assertFalse(self.limited(self.request()))
+        self.assertEqual(ratelimit._local_buckets._buckets, {})
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_MAX_LAG=5, REPLICA_LAG_CHECK_INTERVAL=60)
+class ReplicaRouterTests(SimpleTestCase):
+    
+    def setUp(self):
+        self.router = ReplicaRouter()
+        patcher = mock.patch.object(routers, 'healthy_replicas', return_value=('replica',))
+        self.healthy_replicas = patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def read_in_view(self, model=Card):
+        return use_replica(lambda: self.router.db_for_read(model))()
+    
+    def handle(self, request, view):
+        """Run `view` through ReplicaPinMiddleware and return (its result, the response)"""
+        result = []
+        
+        def get_response(request):
+            result.append(view())
+            return HttpResponse()
+        
+        response = ReplicaPinMiddleware(get_response)(request)
+        return result[0], response
+    
+    def test_use_replica(self):
+        self.assertEqual(self.read_in_view(), 'replica')
+        # Outside wrapped views only analytics reads go to a replica
+        self.assertIsNone(self.router.db_for_read(Card))
+        self.assertEqual(self.router.db_for_read(AnalyticsEvent), 'replica')
+    
+    def test_no_healthy_replica(self):
+        self.healthy_replicas.return_value = ()
+        self.assertEqual(self.read_in_view(), 'default')
+    
+    def test_write_pins_the_request_and_sets_the_cookie(self):
+        def view():
+            before = self.read_in_view()
+            self.router.db_for_write(Card)
+            return before, self.read_in_view()
+        
+        reads, response = self.handle(RequestFactory().post('/'), view)
+        
+        self.assertEqual(reads, ('replica', 'default'))
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], settings.REPLICA_PIN_SECONDS)
+    
+    def test_analytics_writes_do_not_pin(self):
+        def view():
+            self.router.db_for_write(AnalyticsEvent)
+            return self.read_in_view()
+        
+        read, response = self.handle(RequestFactory().post('/'), view)
+        
+        self.assertEqual(read, 'replica')
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+    
+    def test_pin_cookie(self):
+        request = RequestFactory().get('/')
+        request.COOKIES[PIN_COOKIE] = '1'
+        
+        read, response = self.handle(request, self.read_in_view)
+        
+        self.assertEqual(read, 'default')
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        self.assertEqual(self.handle(RequestFactory().get('/'), self.read_in_view)[0], 'replica')
+    
+    def test_allow_migrate(self):
+        self.assertFalse(self.router.allow_migrate('replica', 'cards'))
+        self.assertIsNone(self.router.allow_migrate('default', 'cards'))
+
+
+@override_settings(DATABASE_REPLICAS=['replica_0', 'replica_1'], REPLICA_MAX_LAG=5, REPLICA_LAG_CHECK_INTERVAL=60)
+class ReplicaHealthTests(SimpleTestCase):
+    
+    def setUp(self):
+        for name, value in (('_healthy', ()), ('_checked_at', None), ('_refresh_thread', None)):
+            patcher = mock.patch.object(routers, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.lags = {'replica_0': 0, 'replica_1': 30}
+        self.checking = threading.Event()
+        self.release = threading.Event()
+        patcher = mock.patch.object(routers, 'replica_lag', self.replica_lag)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(routers, 'connections', mock.MagicMock())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def replica_lag(self, alias):
+        self.checking.set()
+        self.release.wait(5)
+        return self.lags[alias]
+    
+    def finish_check(self):
+        self.release.set()
+        routers._refresh_thread.join(5)
+    
+    def test_check_runs_in_the_background(self):
+        # A slow replica holds up neither the request nor the lock
+        self.assertEqual(routers.healthy_replicas(), ())
+        self.assertTrue(self.checking.wait(5))
+        self.assertTrue(routers._lock.acquire(blocking=False))
+        routers._lock.release()
+        thread = routers._refresh_thread
+        self.assertEqual(routers.healthy_replicas(), ())
+        self.assertIs(routers._refresh_thread, thread)
+        
+        self.finish_check()
+        
+        # Lagging replicas are left out
+        self.assertEqual(routers.healthy_replicas(), ('replica_0',))
+    
+    def test_stale_result_is_served_while_rechecking(self):
+        self.release.set()
+        self.assertEqual(routers.refresh_replica_health(), ('replica_0',))
+        
+        self.release.clear()
+        self.lags['replica_0'] = None
+        routers._checked_at -= 60
+        self.assertEqual(routers.healthy_replicas(), ('replica_0',))
+        
+        self.finish_check()
+        self.assertEqual(routers.healthy_replicas(), ())
+
+
+class HealthTests(TestCase):
+    """Health endpoints on sync workers (through the test client) and async ones"""
+    
+    def setUp(self):
+        self.probe = health.Probe()
+        for target, name, value in (
+            (health, 'probe', self.probe),
+            (health.Probe, '_start_thread', lambda probe: None),
+            (health, 'pool_stats', dict),
+            (health, 'cache', mock.Mock(mode=REDIS, stats=dict)),
+            (health, 'get_redis', mock.Mock),
+            (health, '_check_analytics_queue', lambda: {'status': health.HEALTHY, 'depth': 0}),
+        ):
+            patcher = mock.patch.object(target, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+    
+    def get_async(self, view):
+        return async_to_sync(view)(RequestFactory().get('/'))
+    
+    def test_liveness(self):
+        with self.assertNumQueries(0):
+            response = self.client.get('/health/live/')
+        self.assertEqual(response.json()['status'], 'alive')
+        self.assertEqual(self.get_async(health.aliveness).status_code, 200)
+    
+    def test_cached_probe_runs_no_queries(self):
+        self.probe.refresh()
+        
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/health/ready/').status_code, 200)
+            self.assertEqual(self.get_async(health.areadiness_check).status_code, 200)
+    
+    def test_stale_probe_reruns_the_checks(self):
+        self.probe.refresh()
+        checked_at = self.probe.checked_at
+        self.probe.checked_at -= settings.HEALTH_PROBE_TTL + 1
+        
+        with self.assertNumQueries(1):
+            response = self.client.get('/health/')
+        
+        self.assertEqual(response.json()['checks']['database'], health.HEALTHY)
+        self.assertGreaterEqual(self.probe.checked_at, checked_at)
+        self.assertLess(response.json()['checked_seconds_ago'], 1)
+    
+    def test_pool_saturation(self):
+        self.probe.refresh()
+        stats = {'in_use': 10, 'max_size': 10}
+        
+        with mock.patch.object(health, 'pool_stats', return_value={'default': stats}):
+            response = self.client.get('/health/')
+            self.assertEqual(self.get_async(health.areadiness_check).status_code, 503)
+        
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['database_pools']['default']['status'], health.SATURATED)
+    
+    def test_redis_failover_is_degraded(self):
+        health.cache.mode = LOCAL
+        self.probe.refresh()
+        
+        response = self.get_async(health.ahealth_check)
+        
+        # Still ready: the cache is served from local memory
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(json.loads(response.content)['checks']['redis'].startswith(health.DEGRADED))
+
+
+IMPORTTIME_OUTPUT = """\
+import time: self [us] | cumulative | imported package
+import time:       221 |        221 |   _io
+import time:       459 |        459 |   posix
+import time:      1200 |       1200 |     django.utils.version
+import time:       300 |       1500 |   django.utils
+import time:       800 |       2300 | django
+import time:      5000 |       5000 | allauth
+Traceback lines and other output are skipped
+"""
+
+# Runs in a fresh interpreter with the public settings
+PUBLIC_ROUTES = """
+import json, sys
+import django
+django.setup()
+from django.urls import Resolver404, resolve
+routes = {}
+for path in ('/', '/@someone/', '/@someone/card/', '/health/ready/', '/app/dashboard/', '/admin/'):
+    try:
+        routes[path] = resolve(path).view_name
+    except Resolver404:
+        routes[path] = None
+loaded = sorted(name for name in ('allauth', 'django.contrib.admin', 'crispy_forms') if name in sys.modules)
+print(json.dumps({'routes': routes, 'loaded': loaded}))
+"""
+
+
+class StartupTests(SimpleTestCase):
+    
+    def test_parse_importtime(self):
+        imports = parse_importtime(IMPORTTIME_OUTPUT.splitlines())
+        
+        self.assertEqual([imported.name for imported in imports], [
+            '_io', 'posix', 'django.utils.version', 'django.utils', 'django', 'allauth',
+        ])
+        self.assertEqual(imports[2], Import('django.utils.version', 1200, 1200, 2))
+        self.assertEqual([imported.depth for imported in imports], [1, 1, 2, 1, 0, 0])
+        self.assertEqual(imports[3].package, 'django')
+    
+    def test_by_package(self):
+        imports = parse_importtime(IMPORTTIME_OUTPUT.splitlines())
+        
+        self.assertEqual(by_package(imports), [
+            ('allauth', 5000, 1), ('django', 2300, 3), ('posix', 459, 1), ('_io', 221, 1),
+        ])
+    
+    def test_public_settings_boot_without_admin_or_allauth(self):
+        report = profile_startup('infikar.settings_public')
+        
+        self.assertEqual(report['settings'], 'infikar.settings_public')
+        packages = {imported.package for imported in report['imports']}
+        self.assertNotIn('allauth', packages)
+        self.assertNotIn('crispy_forms', packages)
+        self.assertNotIn('django.contrib.admin', {imported.name for imported in report['imports']})
+    
+    def test_public_settings_resolve_public_routes(self):
+        completed = subprocess.run(
+            [sys.executable, '-c', PUBLIC_ROUTES],
+            env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'infikar.settings_public'}, cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        )
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        
+        self.assertEqual(result['routes'], {
+            '/': 'cards:home',
+            '/@someone/': 'cards:user_profile',
+            '/@someone/card/': 'cards:card_detail',
+            '/health/ready/': 'health_ready',
+            '/app/dashboard/': 'app:dashboard',
+            '/admin/': None,
+        })
+        self.assertEqual(result['loaded'], [])
@@ -16,29 +16,16 @@ Including another URLconf
 """
 
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path
 from django.conf import settings
 from django.conf.urls.static import static
-from infikar.health import health_check
+from infikar.urls_public import urlpatterns as public_urlpatterns
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     
-    # Health check
-    path("health/", health_check, name="health_check"),
-    
-    # Authentication URLs
-    path("auth/", include("infikar.accounts.urls")),
-    
-    # Public URLs (home and user profiles)
-    path("", include("infikar.cards.urls")),
-    
-    # App URLs (dashboard and cards)
-    path("app/", include("infikar.cards.app_urls")),
-    
-    # Analytics and subscriptions
-    path("analytics/", include("infikar.analytics.urls")),
-    path("subscriptions/", include("infikar.subscriptions.urls")),
+    # Everything else; public-serving workers use only these
+    *public_urlpatterns,
 ]
 
 # Serve media files in development
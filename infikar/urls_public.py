@@ -0,0 +1,43 @@
+"""
+URL configuration for public-serving workers (infikar.settings_public).
+
+Every route except the admin, whose app these workers do not install. The
+dashboard and sign-in routes stay: public pages and redirects reverse their
+names, and they work here when the load balancer does send them. The full
+urlconf is these routes plus the admin, so URL names match in both.
+"""
+from django.conf import settings
+from django.urls import include, path
+
+from infikar import health
+from infikar.metrics import metrics_view
+
+# Async views only pay off under ASGI workers; sync workers get sync views
+if settings.SERVER_MODE == "asgi":
+    health_check, liveness, readiness_check = health.ahealth_check, health.aliveness, health.areadiness_check
+else:
+    health_check, liveness, readiness_check = health.health_check, health.liveness, health.readiness_check
+
+urlpatterns = [
+    # Health checks
+    path("health/", health_check, name="health_check"),
+    path("health/live/", liveness, name="health_live"),
+    path("health/ready/", readiness_check, name="health_ready"),
+    
+    # Authentication URLs
+    path("auth/", include("infikar.accounts.urls")),
+    
+    # Public URLs (home and user profiles)
+    path("", include("infikar.cards.urls")),
+    
+    # App URLs (dashboard and cards)
+    path("app/", include("infikar.cards.app_urls")),
+    
+    # Analytics and subscriptions
+    path("analytics/", include("infikar.analytics.urls")),
+    path("subscriptions/", include("infikar.subscriptions.urls")),
+]
+
+# Only with a scrape token, or in development
+if settings.METRICS_TOKEN or settings.DEBUG:
+    urlpatterns.append(path("metrics", metrics_view, name="metrics"))